@@ -0,0 +1,218 @@
+"""
+Summary.
+
+    Multi-account profiling:  profiles many AWS accounts concurrently.
+    Accounts are distributed across worker processes, one per account
+    up to MAX_PROCESSES; each worker profiles the regions of its account
+    with a pool of threads.
+
+    Output is one .profile file per account plus a merged index
+    file summarising every account profiled during the run.
+
+"""
+
+import os
+import sys
+import json
+import time
+import datetime
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from configparser import ConfigParser
+from pyaws.session import parse_profiles
+from ec2tools.statics import local_config
+from ec2tools.discovery import get_account_identifier, profile_account, MAX_AGE, MAX_THREADS
+from ec2tools.jsonstream import JSONStreamWriter, atomic_file
+from ec2tools.incremental import (
+    account_regions, load_profile, refresh_profile, diff_profiles, save_profile
+)
+from ec2tools import deadline, logd, __version__
+
+
+# globals
+logger = logd.getLogger(__version__)
+FILE_PATH = local_config['CONFIG']['CONFIG_DIR']
+INDEX_FILE = 'accounts.index'
+MAX_PROCESSES = 16              # accounts profiled concurrently; work is io bound
+
+
+def shared_credentials_location():
+    """
+    Summary:
+        Discover alterate location for awscli shared credentials file
+    Returns:
+        TYPE: str, Full path of shared credentials file, if exists
+    """
+    if 'AWS_SHARED_CREDENTIALS_FILE' in os.environ:
+        return os.environ['AWS_SHARED_CREDENTIALS_FILE']
+    return ''
+
+
+def awscli_profiles():
+    """
+    Summary:
+        Returns profile names from local awscli configuration, omitting
+        profiles which assume a role (role_arn)
+    Returns:
+        profile names, TYPE: list
+    """
+    config = ConfigParser()
+    config_file = shared_credentials_location() or os.path.join(
+        os.environ.get('HOME', ''), '.aws', 'credentials'
+    )
+
+    if not os.path.isfile(config_file):
+        logger.warning(
+            'awscli configuration file not found on local filesystem (%s)' % config_file)
+        return []
+
+    config.read(config_file)
+    return [x for x in config.sections() if 'role_arn' not in config[x].keys()]
+
+
+def profile_worker(profile, regions=None, threads=MAX_THREADS, outputdir=FILE_PATH,
+                   incremental=False, max_age=MAX_AGE):
+    """
+    Summary:
+        Profiles a single account in a worker process, writing the result
+        to <alias>.profile.  Exceptions are captured in the summary returned
+        so that one failing account cannot halt profiling of the others.
+        When incremental, only stale sections are refreshed and a diff
+        against the previous profile is written to <alias>.diff
+    Returns:
+        account summary, TYPE: dict
+    """
+    start = time.time()
+    # worker processes are reused; regions abandoned for earlier accounts are excluded
+    abandoned = len(deadline.abandoned())
+    profiled = []
+    summary = {
+        'Profile': profile,
+        'AccountId': None,
+        'AccountAlias': None,
+        'ProfileFile': None,
+        'Regions': 0,
+        'Status': 'FAILED',
+        'Error': None
+    }
+
+    try:
+        alias = get_account_identifier(parse_profiles(profile))
+        path = os.path.join(outputdir, alias + '.profile')
+
+        if incremental:
+            previous = load_profile(path)
+            container = refresh_profile(
+                parse_profiles(profile), previous, regions, max_age, threads
+            )
+            diff = diff_profiles(previous, container)
+            summary['Changes'] = len(diff)
+
+            save_profile(path, container, diff)
+            regions_profiled = len(account_regions(container))
+
+        else:
+            # stream each region to disk as it completes; the previous profile is kept on failure
+            with atomic_file(path) as f1:
+                writer = JSONStreamWriter(f1)
+                container = profile_account(
+                    parse_profiles(profile), regions, threads, writer, completed=profiled.append
+                )
+                writer.close()
+            regions_profiled = len(profiled)
+
+        summary.update({
+            'AccountId': container['AccountId'],
+            'AccountAlias': container['AccountAlias'],
+            'ProfileFile': path,
+            'Regions': regions_profiled,
+            'Status': 'OK',
+            'TimedOut': deadline.abandoned()[abandoned:]
+        })
+
+    except deadline.DeadlineExceeded as e:
+        summary.update({'Status': deadline.TIMED_OUT, 'Error': str(e)})
+
+    except Exception as e:
+        logger.exception(
+            'Failure while profiling account for profile %s: %s' %
+            (profile, str(e)))
+        summary['Error'] = str(e)
+
+    summary['Duration'] = round(time.time() - start, 3)
+    return summary
+
+
+def profile_accounts(profiles, regions=None, processes=None, threads=MAX_THREADS,
+                     outputdir=FILE_PATH, incremental=False, max_age=MAX_AGE):
+    """
+    Summary:
+        Profiles multiple AWS accounts concurrently
+    Args:
+        :profiles (list): profile names from local awscli configuration
+        :regions (list): region codes to profile.  Default: all regions
+        :processes (int): maximum number of worker processes.  Default: MAX_PROCESSES
+        :threads (int): number of region threads per worker process
+        :outputdir (str): directory in which profile and index files are written
+        :incremental (bool): refresh only stale sections of existing profiles
+        :max_age (int): seconds after which a profile section is stale
+    Returns:
+        merged index, TYPE: dict
+    """
+    start = time.time()
+    summaries = []
+    processes = max(min(len(profiles), processes or MAX_PROCESSES), 1)
+
+    with ProcessPoolExecutor(max_workers=processes) as executor:
+        futures = {
+            executor.submit(
+                profile_worker, x, regions, threads, outputdir, incremental, max_age
+            ): x for x in profiles
+        }
+        for future in as_completed(futures):
+            try:
+                summaries.append(future.result())
+                if summaries[-1]['Status'] == deadline.TIMED_OUT:
+                    deadline.record([futures[future]])
+                else:
+                    deadline.record(summaries[-1].get('TimedOut', []))
+            except Exception as e:
+                # worker process died before returning a summary
+                logger.exception(
+                    'Worker process failed for profile %s: %s' %
+                    (futures[future], str(e)))
+                summaries.append({
+                    'Profile': futures[future],
+                    'Status': 'FAILED',
+                    'Error': str(e),
+                    'Duration': None
+                })
+
+    index = {
+        'CreateDate': datetime.datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%SZ'),
+        'Duration': round(time.time() - start, 3),
+        'Accounts': sorted(summaries, key=lambda x: x['Profile'])
+    }
+
+    with open(os.path.join(outputdir, INDEX_FILE), 'w') as f1:
+        f1.write(json.dumps(index, indent=4))
+    return index
+
+
+def print_summary(index):
+    """ Prints per-account profiling results """
+    for account in index['Accounts']:
+        if account['Status'] == 'OK' and account.get('TimedOut'):
+            status = 'OK ({} regions {})'.format(len(account['TimedOut']), deadline.TIMED_OUT)
+        elif account['Status'] in ('OK', deadline.TIMED_OUT):
+            status = account['Status']
+        else:
+            status = 'FAILED: ' + str(account['Error'])
+        print('\t{: <24}{: <32}{: >8}s  {}'.format(
+            account['Profile'],
+            str(account.get('AccountAlias')),
+            str(account['Duration']),
+            status
+        ))
+    print('\n\tProfiled {} accounts in {}s\n'.format(len(index['Accounts']), index['Duration']))
+    sys.stdout.flush()
+    return True
@@ -0,0 +1,259 @@
+"""
+Summary.
+
+    Record and replay of AWS api responses.  With EC2TOOLS_RECORD set to
+    a file path, every http response received by instrumented clients is
+    written to a gzip compressed json cassette when the command exits.
+    With EC2TOOLS_REPLAY set to a cassette path, responses are served
+    from the cassette instead of AWS, so any command run can be
+    reproduced offline:
+
+        $ EC2TOOLS_RECORD=~/amis.cassette machineimage --image amazonlinux2
+        $ EC2TOOLS_REPLAY=~/amis.cassette EC2TOOLS_REPLAY_LATENCY=recorded \\
+              machineimage --image amazonlinux2
+
+    Requests are matched on method, url, and request parameters, with
+    idempotency tokens removed.  Repeated identical requests (retries,
+    polling) are answered in recorded order, the last response repeating.
+    EC2TOOLS_REPLAY_LATENCY delays each replayed response by a fixed
+    number of milliseconds, or by its recorded duration ('recorded').
+    Replayed requests are not signed; no credentials are needed.
+
+    Only the responses of the main process are recorded (not those of
+    profileaccount --profiles worker processes).
+
+"""
+
+import os
+import json
+import gzip
+import time
+import hashlib
+import datetime
+import threading
+from collections import defaultdict
+from urllib.parse import parse_qsl, urlencode
+from botocore import UNSIGNED
+from botocore.awsrequest import AWSResponse
+from ec2tools import deadline, logd, __version__
+
+
+# globals
+logger = logd.getLogger(__version__)
+RECORD_ENV = 'EC2TOOLS_RECORD'
+REPLAY_ENV = 'EC2TOOLS_REPLAY'
+LATENCY_ENV = 'EC2TOOLS_REPLAY_LATENCY'
+CASSETTE_VERSION = 1
+
+# request parameters differing between otherwise identical requests
+VOLATILE_PARAMS = frozenset(['ClientToken', 'ClientRequestToken', 'IdempotencyToken'])
+
+# request in progress on each thread: (key, request, event name, start time)
+_pending = threading.local()
+
+
+class CassetteMiss(Exception):
+    """ Raised when a replayed request has no recorded response """
+
+
+def normalize(body):
+    """
+    Summary.
+
+        Request body with volatile parameters removed and parameters
+        sorted.  Form encoded (query protocol) and json bodies are
+        supported; others are returned unchanged.
+
+    >>> normalize(b'Version=2016-11-15&Action=RunInstances&ClientToken=abc')
+    'Action=RunInstances&Version=2016-11-15'
+    """
+    if isinstance(body, bytes):
+        body = body.decode('utf-8', errors='replace')
+    body = body or ''
+
+    if body.startswith('{'):
+        try:
+            params = json.loads(body)
+        except ValueError:
+            return body
+        return json.dumps(
+            {k: v for k, v in params.items() if k not in VOLATILE_PARAMS}, sort_keys=True
+        )
+
+    params = [x for x in parse_qsl(body, keep_blank_values=True) if x[0] not in VOLATILE_PARAMS]
+    return urlencode(sorted(params))
+
+
+def request_key(request):
+    """ Key matching a request (AWSPreparedRequest) to its recorded responses """
+    key = '\n'.join((request.method, request.url, normalize(request.body)))
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+
+def read_cassette(path):
+    """ Interactions of a cassette file, TYPE: list """
+    with gzip.open(os.path.expanduser(path), 'rt') as f1:
+        cassette = json.loads(f1.read())
+    if cassette.get('Version') != CASSETTE_VERSION:
+        raise ValueError(
+            'Unsupported cassette version {} in {}'.format(cassette.get('Version'), path)
+        )
+    return cassette['Interactions']
+
+
+def write_cassette(path, interactions):
+    """ Writes interactions to a gzip compressed cassette, replacing it atomically """
+    path = os.path.expanduser(path)
+    tmp_path = '{}.{}.tmp'.format(path, os.getpid())
+    cassette = {
+        'Version': CASSETTE_VERSION,
+        'Recorded': datetime.datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%SZ'),
+        'Interactions': interactions
+    }
+    with gzip.open(tmp_path, 'wt') as f1:
+        f1.write(json.dumps(cassette))
+    os.replace(tmp_path, path)
+    return path
+
+
+class _Raw():
+    """ Minimal urllib3 response body served to botocore """
+    def __init__(self, content):
+        self.content = content
+
+    def stream(self, **kwargs):
+        yield self.content
+
+
+class Recorder():
+    """
+    Summary.
+
+        Records each http attempt of instrumented clients; the cassette
+        is written at exit
+
+    Args:
+        :path (str): cassette file location
+
+    """
+    def __init__(self, path):
+        self.path = path
+        self.interactions = []
+        self.lock = threading.Lock()
+
+    def before_send(self, request, event_name, **kwargs):
+        _pending.request = (request_key(request), request, event_name, time.perf_counter())
+
+    def after_attempt(self, response, **kwargs):
+        pending = getattr(_pending, 'request', None)
+        _pending.request = None
+        if pending is None or response is None:
+            return None
+        key, request, event_name, start = pending
+        http_response = response[0]
+        _, service, operation = event_name.split('.', 2)
+        with self.lock:
+            self.interactions.append({
+                'Key': key,
+                'Service': service,
+                'Operation': operation,
+                'Method': request.method,
+                'Url': request.url,
+                'Status': http_response.status_code,
+                'Headers': dict(http_response.headers),
+                'Body': http_response.content.decode('utf-8', errors='replace'),
+                'DurationMs': round((time.perf_counter() - start) * 1000, 1)
+            })
+        return None
+
+    def attach(self, client):
+        events = client.meta.events
+        events.register('before-send.*.*', self.before_send, unique_id='ec2tools-record-send')
+        events.register('needs-retry.*.*', self.after_attempt, unique_id='ec2tools-record-retry')
+        return client
+
+    def save(self):
+        with self.lock:
+            write_cassette(self.path, self.interactions)
+        logger.info('Recorded {} AWS responses to {}'.format(len(self.interactions), self.path))
+
+
+class Player():
+    """
+    Summary.
+
+        Serves recorded responses in place of http requests
+
+    Args:
+        :interactions (list): interactions of a cassette
+        :latency: milliseconds added to each response, or 'recorded'
+        :sleep (callable): sleep function; replaceable in tests
+
+    """
+    def __init__(self, interactions, latency=0, sleep=time.sleep):
+        self.latency = latency
+        self.sleep = sleep
+        self.responses = defaultdict(list)
+        self.served = defaultdict(int)
+        self.lock = threading.Lock()
+        for interaction in interactions:
+            self.responses[interaction['Key']].append(interaction)
+
+    def delay(self, interaction):
+        if self.latency == 'recorded':
+            return interaction.get('DurationMs', 0) / 1000
+        return float(self.latency) / 1000
+
+    def before_send(self, request, event_name, **kwargs):
+        key = request_key(request)
+        with self.lock:
+            recorded = self.responses.get(key)
+            if not recorded:
+                raise CassetteMiss(
+                    'No recorded response for {} {}'.format(
+                        event_name.split('.', 1)[1], request.url
+                    )
+                )
+            interaction = recorded[min(self.served[key], len(recorded) - 1)]
+            self.served[key] += 1
+
+        delay = self.delay(interaction)
+        if delay:
+            self.sleep(delay)
+        return AWSResponse(
+            request.url, interaction['Status'], interaction['Headers'],
+            _Raw(interaction['Body'].encode('utf-8'))
+        )
+
+    def attach(self, client):
+        events = client.meta.events
+        events.register(
+            'choose-signer.*.*', lambda **kwargs: UNSIGNED, unique_id='ec2tools-replay-signer'
+        )
+        events.register('before-send.*.*', self.before_send, unique_id='ec2tools-replay-send')
+        return client
+
+
+_cassette = {}
+_cassette_lock = threading.Lock()
+
+
+def active():
+    """ Recorder or Player of this process, None unless enabled by environment """
+    with _cassette_lock:
+        if 'active' not in _cassette:
+            _cassette['active'] = None
+            if os.environ.get(REPLAY_ENV):
+                _cassette['active'] = Player(
+                    read_cassette(os.environ[REPLAY_ENV]), os.environ.get(LATENCY_ENV, 0)
+                )
+            elif os.environ.get(RECORD_ENV):
+                _cassette['active'] = Recorder(os.path.expanduser(os.environ[RECORD_ENV]))
+                deadline.at_exit(_cassette['active'].save)
+        return _cassette['active']
+
+
+def attach(client):
+    """ Records or replays the responses of a boto3 client when enabled """
+    cassette = active()
+    return cassette.attach(client) if cassette else client
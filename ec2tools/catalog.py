@@ -0,0 +1,193 @@
+"""
+Summary.
+
+    Instance type catalog.  Lookup API over the catalog.db artifact built
+    from the EC2 price file by scripts/ec2sizes.py (make build-sizes):
+    vcpu, memory, network, architecture, gpu, generation, and regional
+    availability per instance type.  Falls back to the flat sizes.txt
+    list (names only) when no catalog has been installed; that list is
+    not kept current, so sizes missing from it are not rejected.
+
+"""
+
+import os
+import math
+import difflib
+import sqlite3
+from collections import namedtuple
+from ec2tools.statics import local_config
+from ec2tools import logd, __version__
+
+
+# globals
+logger = logd.getLogger(__version__)
+FILE_PATH = local_config['CONFIG']['CONFIG_DIR']
+CATALOG_PATH = os.path.join(FILE_PATH, 'catalog.db')
+SIZES_PATH = os.path.join(FILE_PATH, 'sizes.txt')
+
+InstanceType = namedtuple(
+    'InstanceType',
+    [
+        'instance_type', 'family', 'size', 'vcpu', 'memory', 'network', 'architecture', 'gpu',
+        'current_generation'
+    ]
+)
+
+
+class Catalog():
+    """
+    Summary.
+
+        Instance type catalog
+
+    Args:
+        :path (str): catalog.db location.  Default: ~/.config/ec2tools/catalog.db
+        :sizes (str): sizes.txt location, used when path does not exist
+
+    """
+    def __init__(self, path=CATALOG_PATH, sizes=SIZES_PATH):
+        self.path = path
+        self.conn = None
+        self.types = {}
+
+        if os.path.exists(path):
+            self.conn = sqlite3.connect('file:{}?mode=ro'.format(path), uri=True)
+            for row in self.conn.execute('SELECT * FROM instance_types'):
+                self.types[row[0]] = InstanceType(*row)
+        elif os.path.exists(sizes):
+            with open(sizes) as f1:
+                for name in (x.strip() for x in f1 if '.' in x):
+                    family, size = name.split('.', 1)
+                    self.types[name] = InstanceType(
+                        name, family, size, None, None, None, None, None, None
+                    )
+
+    def __contains__(self, name):
+        return name in self.types
+
+    def __len__(self):
+        return len(self.types)
+
+    @property
+    def authoritative(self):
+        """ True when loaded from catalog.db rather than the sizes.txt fallback """
+        return self.conn is not None
+
+    def close(self):
+        if self.conn:
+            self.conn.close()
+
+    def get(self, name):
+        """ InstanceType record for name, or None """
+        return self.types.get(name)
+
+    def regions(self, name):
+        """ Region codes offering an instance type; empty without regional data """
+        if self.conn is None:
+            return []
+        rows = self.conn.execute(
+            'SELECT region FROM regions WHERE instance_type = ? ORDER BY region', (name,)
+        )
+        return [x[0] for x in rows]
+
+    def offered(self, region):
+        """ Instance types offered in region, or None when the catalog holds no data for it """
+        if self.conn is None:
+            return None
+        rows = self.conn.execute('SELECT instance_type FROM regions WHERE region = ?', (region,))
+        names = {x[0] for x in rows}
+        return names or None
+
+    def available(self, name, region=None):
+        """
+        Summary.
+
+            Whether an instance type exists and, given a region the catalog
+            has data for, is offered there
+
+        Returns:
+            True | False, TYPE: bool
+
+        """
+        if name not in self.types:
+            return False
+        offered = self.offered(region) if region else None
+        return offered is None or name in offered
+
+    def nearest(self, name, region=None, n=3):
+        """
+        Summary.
+
+            Instance types closest to name.  Known types are ranked by vcpu
+            and memory distance within the same architecture; unknown names
+            by spelling similarity, then by other sizes of the same family.
+
+        Args:
+            :name (str): instance type requested
+            :region (str): restrict suggestions to types offered in region
+            :n (int): number of suggestions
+
+        Returns:
+            instance type names, TYPE: list
+
+        """
+        offered = self.offered(region) if region else None
+        candidates = [
+            x for x in self.types.values() if offered is None or x.instance_type in offered
+        ]
+        target = self.types.get(name)
+
+        if target and target.vcpu and target.memory:
+            def distance(x):
+                if not (x.vcpu and x.memory):
+                    return (math.inf,)
+                return (
+                    x.architecture != target.architecture,
+                    abs(math.log2(x.vcpu / target.vcpu)) + abs(math.log2(x.memory / target.memory)),
+                    x.family != target.family,
+                    not x.current_generation
+                )
+            ranked = sorted((x for x in candidates if x.instance_type != name), key=distance)
+            return [x.instance_type for x in ranked[:n]]
+
+        names = [x.instance_type for x in candidates]
+        matches = difflib.get_close_matches(name, names, n=n, cutoff=0.6)
+        family = name.split('.')[0]
+        matches += sorted(x for x in names if x.split('.')[0] == family and x not in matches)
+        return matches[:n]
+
+
+def validate_size(size, region=None, path=CATALOG_PATH, sizes=SIZES_PATH):
+    """
+    Summary.
+
+        Validates an instance size against the local catalog.  Sizes
+        are rejected only by an installed catalog.db; with the sizes.txt
+        fallback, unknown sizes are valid (left to the EC2 api to reject)
+        and returned with suggestions.
+
+    Returns:
+        (valid, suggestions), TYPE: tuple (bool, list).  Sizes are valid
+        when no catalog is installed
+
+    >>> import tempfile
+    >>> sizes = os.path.join(tempfile.mkdtemp(), 'sizes.txt')
+    >>> _ = open(sizes, 'w').write('m5.large\\nm5.xlarge\\n')
+    >>> validate_size('m5.large', path='/nonexistent', sizes=sizes)
+    (True, [])
+    >>> validate_size('m5.larg', path='/nonexistent', sizes=sizes)
+    (True, ['m5.large', 'm5.xlarge'])
+    """
+    catalog = Catalog(path, sizes)
+    try:
+        if not len(catalog):
+            logger.info('No instance type catalog installed; size {} not validated'.format(size))
+            return True, []
+        if catalog.available(size, region):
+            return True, []
+        if not catalog.authoritative:
+            logger.warning('Size {} not in {}; not validated'.format(size, sizes))
+            return True, catalog.nearest(size, region)
+        return False, catalog.nearest(size, region)
+    finally:
+        catalog.close()
@@ -0,0 +1,302 @@
+"""
+Summary.
+
+    Cidr overlap and ip capacity analysis of profiled accounts.  Vpc and
+    subnet cidrs of every local account profile are placed in interval
+    trees (one per address family) to find overlapping address space
+    across vpcs, regions, and accounts in O(n log n + k) for k overlaps.
+
+    Usage:
+
+        $ profileaccount analyze overlaps
+        $ profileaccount analyze overlaps --subnets --skip-default
+        $ profileaccount analyze capacity --by-az --region us-east-1
+
+"""
+
+import argparse
+import ipaddress
+from collections import namedtuple, OrderedDict
+from pyaws.utils import stdout_message
+from ec2tools.intervals import IntervalTree
+from ec2tools.inventory import FILE_PATH, ACCOUNT_KEYS, profile_files, display_rows
+from ec2tools.jsonstream import iter_items
+from ec2tools import logd, __version__
+
+
+# globals
+logger = logd.getLogger(__version__)
+
+# addresses AWS reserves in every ipv4 subnet
+RESERVED_IPS = 5
+
+# a vpc cidr block (subnet_id None) or subnet of an account profile
+Network = namedtuple(
+    'Network', ['account', 'region', 'vpc_id', 'subnet_id', 'az', 'cidr', 'available', 'default']
+)
+
+
+def address_range(cidr):
+    """
+    Summary.
+
+        Address family and first, last addresses of a cidr as integers
+
+    >>> address_range('10.0.0.0/24')
+    (4, 167772160, 167772415)
+    """
+    net = ipaddress.ip_network(cidr, strict=False)
+    return (net.version, int(net.network_address), int(net.broadcast_address))
+
+
+def region_networks(account, rgn, region_profile):
+    """ Yields a Network for every vpc cidr block and every subnet of a region profile """
+    defaults = set()
+
+    for row in region_profile.get('Vpcs', []):
+        for vpc_id, vpc in row.items():
+            if vpc.get('IsDefault'):
+                defaults.add(vpc_id)
+            for cidr in vpc.get('CidrBlocks', []):
+                yield Network(account, rgn, vpc_id, None, None, cidr, None, vpc_id in defaults)
+
+    for row in region_profile.get('Subnets', []):
+        for subnet_id, subnet in row.items():
+            yield Network(
+                account, rgn, subnet['VpcId'], subnet_id, subnet['AvailabilityZone'],
+                subnet['CidrBlock'], subnet.get('AvailableIpAddressCount'),
+                subnet['VpcId'] in defaults
+            )
+
+
+def profile_networks(container):
+    """
+    Summary.
+
+        Yields a Network for every vpc cidr block and every subnet of an
+        account profile (.profile schema)
+
+    Args:
+        :container: account profile, as a dict or as an iterable of
+            key, value pairs (jsonstream.iter_items)
+
+    """
+    items = container.items() if isinstance(container, dict) else container
+    account, pending = None, []
+
+    for rgn, region_profile in items:
+        if rgn == 'AccountId':
+            account = region_profile
+        elif rgn in ACCOUNT_KEYS or not isinstance(region_profile, dict):
+            continue
+        elif account is None:
+            # regions preceding the AccountId key wait for it
+            pending.append((rgn, region_profile))
+        else:
+            yield from region_networks(account, rgn, region_profile)
+
+    for rgn, region_profile in pending:
+        yield from region_networks(account, rgn, region_profile)
+
+
+def local_networks(paths=None, account=None, region=None, skip_default=False):
+    """
+    Summary.
+
+        Networks of all local account profiles, read one file and one
+        region at a time
+
+    Args:
+        :paths (list): .profile files.  Default: all profiles in FILE_PATH
+        :account (str): AccountId filter
+        :region (str): region code filter
+        :skip_default (bool): omit default vpcs and their subnets
+
+    Returns:
+        networks, TYPE: list of Network
+
+    """
+    networks = []
+
+    def selected(x):
+        if account and x.account != account:
+            return False
+        if region and x.region != region:
+            return False
+        return not (skip_default and x.default)
+
+    for path in (paths or profile_files()):
+        try:
+            with open(path) as f1:
+                found = [x for x in profile_networks(iter_items(f1)) if selected(x)]
+        except (OSError, ValueError) as e:
+            logger.warning('Unable to read profile %s: %s' % (path, e))
+            continue
+        networks.extend(found)
+    return networks
+
+
+def overlaps(networks):
+    """
+    Summary.
+
+        Pairs of networks belonging to different vpcs whose address ranges
+        overlap.  Each pair is reported once.
+
+    Args:
+        :networks (list): Network tuples; vpc cidrs and subnets are
+            compared only with networks of the same kind
+
+    Returns:
+        overlapping pairs, TYPE: list of (Network, Network)
+
+    """
+    ranges = [address_range(x.cidr) for x in networks]
+    trees = {}
+
+    for version in {x[0] for x in ranges}:
+        trees[version] = IntervalTree(
+            (start, end, i) for i, (v, start, end) in enumerate(ranges) if v == version
+        )
+
+    pairs = []
+    for i, (version, start, end) in enumerate(ranges):
+        a = networks[i]
+        for j in trees[version].overlapping(start, end):
+            b = networks[j]
+            if j <= i or (a.subnet_id is None) != (b.subnet_id is None):
+                continue
+            if (a.account, a.vpc_id) != (b.account, b.vpc_id):
+                pairs.append((a, b))
+    return pairs
+
+
+def capacity(networks):
+    """
+    Summary.
+
+        Ip capacity of every ipv4 subnet, most utilized first
+
+    Returns:
+        capacity records, TYPE: list of dict
+
+    """
+    rows = []
+
+    for x in networks:
+        if x.subnet_id is None or x.available is None:
+            continue
+        net = ipaddress.ip_network(x.cidr, strict=False)
+        if net.version != 4:
+            continue
+        total = net.num_addresses - RESERVED_IPS
+        rows.append(OrderedDict([
+            ('AccountId', x.account),
+            ('Region', x.region),
+            ('AvailabilityZone', x.az),
+            ('VpcId', x.vpc_id),
+            ('SubnetId', x.subnet_id),
+            ('CidrBlock', x.cidr),
+            ('TotalIps', total),
+            ('AvailableIps', x.available),
+            ('Utilization', round(100 * (total - x.available) / total, 1) if total > 0 else 100.0)
+        ]))
+    return sorted(rows, key=lambda x: (-x['Utilization'], x['AvailableIps']))
+
+
+def capacity_by_az(networks):
+    """
+    Summary.
+
+        Subnet ip capacity totalled per account and availability zone,
+        least free capacity first
+
+    Returns:
+        capacity records, TYPE: list of dict
+
+    """
+    zones = OrderedDict()
+
+    for x in capacity(networks):
+        key = (x['AccountId'], x['Region'], x['AvailabilityZone'])
+        if key not in zones:
+            zones[key] = OrderedDict([
+                ('AccountId', key[0]),
+                ('Region', key[1]),
+                ('AvailabilityZone', key[2]),
+                ('Subnets', 0),
+                ('TotalIps', 0),
+                ('AvailableIps', 0)
+            ])
+        zones[key]['Subnets'] += 1
+        zones[key]['TotalIps'] += x['TotalIps']
+        zones[key]['AvailableIps'] += x['AvailableIps']
+    return sorted(
+        zones.values(),
+        key=lambda x: (x['AvailableIps'], x['AccountId'] or '', x['AvailabilityZone'])
+    )
+
+
+def overlap_rows(pairs):
+    """ Formats overlapping network pairs for display """
+    rows = []
+    for a, b in pairs:
+        rows.append(OrderedDict([
+            ('AccountId', a.account),
+            ('Region', a.region),
+            ('VpcId', a.vpc_id),
+            ('SubnetId', a.subnet_id or ''),
+            ('Cidr', a.cidr),
+            ('OverlapAccountId', b.account),
+            ('OverlapRegion', b.region),
+            ('OverlapVpcId', b.vpc_id),
+            ('OverlapSubnetId', b.subnet_id or ''),
+            ('OverlapCidr', b.cidr)
+        ]))
+    return rows
+
+
+def analyze_options(argv):
+    parser = argparse.ArgumentParser(prog='profileaccount analyze')
+    parser.add_argument('analysis', choices=['overlaps', 'capacity'])
+    parser.add_argument('--account', dest='account', default=None, help='AWS AccountId')
+    parser.add_argument('--region', dest='region', default=None)
+    parser.add_argument(
+        '--subnets', dest='subnets', action='store_true', help='compare subnet cidrs, not vpc cidrs'
+    )
+    parser.add_argument(
+        '--by-az', dest='by_az', action='store_true', help='total capacity per availability zone'
+    )
+    parser.add_argument(
+        '--skip-default', dest='skip_default', action='store_true', help='omit default vpcs'
+    )
+    parser.add_argument(
+        '--path', dest='path', default=FILE_PATH, help='directory containing .profile files'
+    )
+    return parser.parse_args(argv)
+
+
+def analyze_cli(argv):
+    """
+    Summary.
+
+        profileaccount analyze subcommand
+
+    Returns:
+        Success | Failure, TYPE: bool
+
+    """
+    args = analyze_options(argv)
+    paths = profile_files(args.path)
+
+    if not paths:
+        stdout_message('No account profiles found in {}'.format(args.path), prefix='WARN')
+        return False
+
+    networks = local_networks(paths, args.account, args.region, args.skip_default)
+
+    if args.analysis == 'capacity':
+        return display_rows(capacity_by_az(networks) if args.by_az else capacity(networks))
+
+    kind = [x for x in networks if (x.subnet_id is not None) == args.subnets]
+    return display_rows(overlap_rows(overlaps(kind)))
@@ -5,15 +5,19 @@
 import re
 import sys
 import json
-import inspect
 import itertools
 from collections import OrderedDict
-from botocore.exceptions import ClientError
-from pyaws.session import authenticated, boto3_session
+from concurrent.futures import ThreadPoolExecutor
+from botocore.exceptions import ClientError, ConnectionError as BotoConnectionError
 from pyaws import Colors
 from pyaws.utils import stdout_message, export_json_object
 from libtools import bool_convert, bool_assignment
 from ec2tools.help_menu import menu_body
+from ec2tools.paginate import paginate
+from ec2tools.models import Image
+from ec2tools.session import authenticated, authentication_failures, boto3_session, span
+from ec2tools.regions import enabled_regions, healthy_regions, record_failure, record_success
+from ec2tools import deadline, profiling, stats, timings
 from ec2tools import about, logd, __version__
 from ec2tools.variables import bl, dbl, fs, rst
 from ec2tools.statics import local_config
@@ -27,6 +31,7 @@
 logger = logd.getLogger(__version__)
 DEFAULT_REGION = os.environ['AWS_DEFAULT_REGION']
 VALID_FORMATS = ('json', 'text')
+MAX_THREADS = 8                 # concurrent region lookups
 VALID_AMI_TYPES = (
         'amazonlinux1', 'amazonlinux2',
         'redhat', 'redhat7.4', 'redhat7.5', 'redhat7.6',
@@ -60,6 +65,78 @@ def debug_message(response, rgn, mode):
     return True
 
 
+def describe_images(client, region, debug, **kwargs):
+    """
+    Summary:
+        Lazily yields all images matching the criteria given in kwargs
+        (Owners, Filters).  In debug mode, images are collected and printed
+    Returns:
+        images, TYPE: generator | list
+    """
+    images = paginate(client, 'describe_images', **kwargs)
+    if debug:
+        images = list(images)
+        debug_message({'Images': images}, region, debug)
+    return images
+
+
+def latest_images(profile, regions, detailed, debug, **kwargs):
+    """
+    Summary:
+        Newest image matching the criteria given in kwargs (Owners,
+        Filters) in each region.  Regions are queried concurrently; api
+        requests are paced by the rate limiter of each region.  Regions
+        which fail with a boto error are logged and omitted; region level
+        failures open the circuit of the region (ec2tools.regions).
+        Regions not finished by the --deadline are marked timed out.
+    Returns:
+        amis, TYPE: dict: {region: ImageId} | {region: image metadata} if detailed
+    """
+    def lookup(region):
+        client = boto3_session(service='ec2', region=region, profile=profile)
+        return newest_ami(describe_images(client, region, debug, **kwargs))
+
+    amis, metadata = {}, {}
+
+    # debug output of each region is printed whole, one region at a time
+    executor = ThreadPoolExecutor(max_workers=1 if debug else MAX_THREADS)
+    futures = {executor.submit(lookup, region): region for region in regions}
+    pending = dict(futures)
+
+    for future in deadline.as_completed(futures):
+        region = pending.pop(future)
+        try:
+            newest = future.result()
+            # the whole describe_images record is kept for detailed output only
+            if detailed:
+                metadata[region] = newest
+            amis[region] = Image.from_dict(newest).image_id or 'unavailable'
+            record_success(profile, region)
+        except (ClientError, BotoConnectionError) as e:
+            if not record_failure(profile, region, e):
+                logger.exception(
+                    'Boto error while retrieving AMI data (%s)' % str(e))
+            continue
+        except deadline.DeadlineExceeded:
+            pending[future] = region
+        except Exception as e:
+            logger.exception(
+                'Unknown Exception occured while retrieving AMI data (%s)' % str(e))
+            raise e
+
+    for region in deadline.abandon(pending):
+        metadata[region] = {'Status': deadline.TIMED_OUT}
+        amis[region] = deadline.TIMED_OUT
+
+    # abandoned lookups are not waited for
+    executor.shutdown(wait=not pending)
+
+    # keep the order of regions given
+    if detailed:
+        return {x: metadata[x] for x in regions if x in metadata}
+    return {x: amis[x] for x in regions if x in amis}
+
+
 def help_menu():
     """
     Displays help menu contents
@@ -73,17 +150,15 @@ def help_menu():
 
 
 def get_regions(profile):
-    """ Return list of all regions """
+    """ Return list of all regions enabled for the account (cached) """
     try:
 
-        client = boto3_session(service='ec2', profile=profile)
+        return enabled_regions(profile)
 
     except ClientError as e:
         logger.exception(
-            '%s: Boto error while retrieving regions (%s)' %
-            (inspect.stack()[0][3], str(e)))
+            'Boto error while retrieving regions (%s)' % str(e))
         raise e
-    return [x['RegionName'] for x in client.describe_regions()['Regions']]
 
 
 def amazonlinux1(profile, region=None, detailed=False, debug=False):
@@ -96,45 +171,23 @@ def amazonlinux1(profile, region=None, detailed=False, debug=False):
     Returns:
         amis, TYPE: list:  container for metadata dict for most current instance in region
     """
-    amis, metadata = {}, {}
     if region:
         regions = [region]
     else:
-        regions = get_regions(profile=profile)
-
-    # retrieve ami for each region in list
-    for region in regions:
-        try:
-            client = boto3_session(service='ec2', region=region, profile=profile)
-            r = client.describe_images(
-                Owners=['amazon'],
-                Filters=[
-                    {
-                        'Name': 'name',
-                        'Values': [
-                            'amzn-ami-hvm-*-x86_64-gp2'
-                        ]
-                    }
-                ])
-
-            # need to find ami with latest date returned
-            debug_message(r, region, debug)
-            newest = newest_ami(r['Images'])
-            metadata[region] = newest
-            amis[region] = newest.get('ImageId', 'unavailable')
-        except ClientError as e:
-            logger.exception(
-                '%s: Boto error while retrieving AMI data (%s)' %
-                (inspect.stack()[0][3], str(e)))
-            continue
-        except Exception as e:
-            logger.exception(
-                '%s: Unknown Exception occured while retrieving AMI data (%s)' %
-                (inspect.stack()[0][3], str(e)))
-            raise e
-    if detailed:
-        return metadata
-    return amis
+        regions = healthy_regions(profile)
+
+    return latest_images(
+        profile, regions, detailed, debug,
+        Owners=['amazon'],
+        Filters=[
+            {
+                'Name': 'name',
+                'Values': [
+                    'amzn-ami-hvm-*-x86_64-gp2'
+                ]
+            }
+        ]
+    )
 
 
 def amazonlinux2(profile, region=None, detailed=False, debug=False):
@@ -147,49 +200,26 @@ def amazonlinux2(profile, region=None, detailed=False, debug=False):
     Returns:
         amis, TYPE: list:  container for metadata dict for most current instance in region
     """
-    amis, metadata = {}, {}
     if region:
         regions = [region]
     else:
-        regions = get_regions(profile=profile)
-
-    # retrieve ami for each region in list
-    for region in regions:
-        try:
-            if not profile:
-                profile = 'default'
-            client = boto3_session(service='ec2', region=region, profile=profile)
-
-            r = client.describe_images(
-                Owners=['amazon'],
-                Filters=[
-                    {
-                        'Name': 'name',
-                        'Values': [
-                            'amzn2-ami-hvm-????.??.?.*????.?-x86_64-*',
-                            'amzn2-ami-hvm-*-x86_64-gp2'
-                        ]
-                    }
-                ])
-
-            # need to find ami with latest date returned
-            debug_message(r, region, debug)
-            newest = newest_ami(r['Images'])
-            metadata[region] = newest
-            amis[region] = newest.get('ImageId', 'unavailable')
-        except ClientError as e:
-            logger.exception(
-                '%s: Boto error while retrieving AMI data (%s)' %
-                (inspect.stack()[0][3], str(e)))
-            continue
-        except Exception as e:
-            logger.exception(
-                '%s: Unknown Exception occured while retrieving AMI data (%s)' %
-                (inspect.stack()[0][3], str(e)))
-            raise e
-    if detailed:
-        return metadata
-    return amis
+        regions = healthy_regions(profile)
+    if not profile:
+        profile = 'default'
+
+    return latest_images(
+        profile, regions, detailed, debug,
+        Owners=['amazon'],
+        Filters=[
+            {
+                'Name': 'name',
+                'Values': [
+                    'amzn2-ami-hvm-????.??.?.*????.?-x86_64-*',
+                    'amzn2-ami-hvm-*-x86_64-gp2'
+                ]
+            }
+        ]
+    )
 
 
 def centos(profile, os, region=None, detailed=False, debug=False):
@@ -205,44 +235,23 @@ def centos(profile, os, region=None, detailed=False, debug=False):
         amis, TYPE: list:  container for metadata dict for most current instance in region
 
     """
-    amis, metadata = {}, {}
     if region:
         regions = [region]
     else:
-        regions = get_regions(profile=profile)
-    # retrieve ami for each region in list
-    for region in regions:
-        try:
-            client = boto3_session(service='ec2', region=region, profile=profile)
-            r = client.describe_images(
-                Owners=[CENTOS],
-                Filters=[
-                    {
-                        'Name': 'name',
-                        'Values': [
-                            'CentOS*%s x86_64*' % os
-                        ]
-                    }
-                ])
-
-            # need to find ami with latest date returned
-            debug_message(r, region, debug)
-            newest = newest_ami(r['Images'])
-            metadata[region] = newest
-            amis[region] = newest.get('ImageId', 'unavailable')
-        except ClientError as e:
-            logger.exception(
-                '%s: Boto error while retrieving AMI data (%s)' %
-                (inspect.stack()[0][3], str(e)))
-            continue
-        except Exception as e:
-            logger.exception(
-                '%s: Unknown Exception occured while retrieving AMI data (%s)' %
-                (inspect.stack()[0][3], str(e)))
-            raise e
-    if detailed:
-        return metadata
-    return amis
+        regions = healthy_regions(profile)
+
+    return latest_images(
+        profile, regions, detailed, debug,
+        Owners=[CENTOS],
+        Filters=[
+            {
+                'Name': 'name',
+                'Values': [
+                    'CentOS*%s x86_64*' % os
+                ]
+            }
+        ]
+    )
 
 
 def fedora(profile, os, region=None, detailed=False, debug=False):
@@ -258,45 +267,23 @@ def fedora(profile, os, region=None, detailed=False, debug=False):
         amis, TYPE: list:  container for metadata dict for most current instance in region
 
     """
-    amis, metadata = {}, {}
     if region:
         regions = [region]
     else:
-        regions = get_regions(profile=profile)
-
-    # retrieve ami for each region in list
-    for region in regions:
-        try:
-            client = boto3_session(service='ec2', region=region, profile=profile)
-            r = client.describe_images(
-                Owners=[COMMUNITY],
-                Filters=[
-                    {
-                        'Name': 'name',
-                        'Values': [
-                            'Fedora-*%s-*.x86_64-*' % os
-                        ]
-                    }
-                ])
-
-            # need to find ami with latest date returned
-            debug_message(r, region, debug)
-            newest = newest_ami(r['Images'])
-            metadata[region] = newest
-            amis[region] = newest.get('ImageId', 'unavailable')
-        except ClientError as e:
-            logger.exception(
-                '%s: Boto error while retrieving AMI data (%s)' %
-                (inspect.stack()[0][3], str(e)))
-            continue
-        except Exception as e:
-            logger.exception(
-                '%s: Unknown Exception occured while retrieving AMI data (%s)' %
-                (inspect.stack()[0][3], str(e)))
-            raise e
-    if detailed:
-        return metadata
-    return amis
+        regions = healthy_regions(profile)
+
+    return latest_images(
+        profile, regions, detailed, debug,
+        Owners=[COMMUNITY],
+        Filters=[
+            {
+                'Name': 'name',
+                'Values': [
+                    'Fedora-*%s-*.x86_64-*' % os
+                ]
+            }
+        ]
+    )
 
 
 def redhat(profile, os, region=None, detailed=False, debug=False):
@@ -309,44 +296,23 @@ def redhat(profile, os, region=None, detailed=False, debug=False):
     Returns:
         amis, TYPE: list:  container for metadata dict for most current instance in region
     """
-    amis, metadata = {}, {}
     if region:
         regions = [region]
     else:
-        regions = get_regions(profile=profile)
-    # retrieve ami for each region in list
-    for region in regions:
-        try:
-            client = boto3_session(service='ec2', region=region, profile=profile)
-            r = client.describe_images(
-                Owners=['309956199498'],
-                Filters=[
-                    {
-                        'Name': 'name',
-                        'Values': [
-                            'RHEL-%s*GA*' % os
-                        ]
-                    }
-                ])
-
-            # need to find ami with latest date returned
-            debug_message(r, region, debug)
-            newest = newest_ami(r['Images'])
-            metadata[region] = newest
-            amis[region] = newest.get('ImageId', 'unavailable')
-        except ClientError as e:
-            logger.exception(
-                '%s: Boto error while retrieving AMI data (%s)' %
-                (inspect.stack()[0][3], str(e)))
-            continue
-        except Exception as e:
-            logger.exception(
-                '%s: Unknown Exception occured while retrieving AMI data (%s)' %
-                (inspect.stack()[0][3], str(e)))
-            raise e
-    if detailed:
-        return metadata
-    return amis
+        regions = healthy_regions(profile)
+
+    return latest_images(
+        profile, regions, detailed, debug,
+        Owners=['309956199498'],
+        Filters=[
+            {
+                'Name': 'name',
+                'Values': [
+                    'RHEL-%s*GA*' % os
+                ]
+            }
+        ]
+    )
 
 
 def ubuntu(profile, os, region=None, detailed=False, debug=False):
@@ -361,44 +327,23 @@ def ubuntu(profile, os, region=None, detailed=False, debug=False):
     Returns:
         amis, TYPE: list:  container for metadata dict for most current instance in region
     """
-    amis, metadata = {}, {}
     if region:
         regions = [region]
     else:
-        regions = get_regions(profile=profile)
-    # retrieve ami for each region in list
-    for region in regions:
-        try:
-            client = boto3_session(service='ec2', region=region, profile=profile)
-            r = client.describe_images(
-                Owners=[UBUNTU],
-                Filters=[
-                    {
-                        'Name': 'name',
-                        'Values': [
-                            'ubuntu/images/hvm-ssd/*%s*' % os
-                        ]
-                    }
-                ])
-
-            # need to find ami with latest date returned
-            debug_message(r, region, debug)
-            newest = newest_ami(r['Images'])
-            metadata[region] = newest
-            amis[region] = newest.get('ImageId', 'unavailable')
-        except ClientError as e:
-            logger.exception(
-                '%s: Boto error while retrieving AMI data (%s)' %
-                (inspect.stack()[0][3], str(e)))
-            continue
-        except Exception as e:
-            logger.exception(
-                '%s: Unknown Exception occured while retrieving AMI data (%s)' %
-                (inspect.stack()[0][3], str(e)))
-            raise e
-    if detailed:
-        return metadata
-    return amis
+        regions = healthy_regions(profile)
+
+    return latest_images(
+        profile, regions, detailed, debug,
+        Owners=[UBUNTU],
+        Filters=[
+            {
+                'Name': 'name',
+                'Values': [
+                    'ubuntu/images/hvm-ssd/*%s*' % os
+                ]
+            }
+        ]
+    )
 
 
 def windows(profile, os, region=None, detailed=False, debug=False):
@@ -421,44 +366,23 @@ def windows(profile, os, region=None, detailed=False, debug=False):
     else:
         filter_criteria = 'Windows_Server*%s*English*Base*' % os
 
-    amis, metadata = {}, {}
     if region:
         regions = [region]
     else:
-        regions = get_regions(profile=profile)
-    # retrieve ami for each region in list
-    for region in regions:
-        try:
-            client = boto3_session(service='ec2', region=region, profile=profile)
-            r = client.describe_images(
-                Owners=[MICROSOFT],
-                Filters=[
-                    {
-                        'Name': 'name',
-                        'Values': [
-                            filter_criteria
-                        ]
-                    }
-                ])
-
-            # need to find ami with latest date returned
-            debug_message(r, region, debug)
-            newest = newest_ami(r['Images'])
-            metadata[region] = newest
-            amis[region] = newest.get('ImageId', 'unavailable')
-        except ClientError as e:
-            logger.exception(
-                '%s: Boto error while retrieving AMI data (%s)' %
-                (inspect.stack()[0][3], str(e)))
-            continue
-        except Exception as e:
-            logger.exception(
-                '%s: Unknown Exception occured while retrieving AMI data (%s)' %
-                (inspect.stack()[0][3], str(e)))
-            raise e
-    if detailed:
-        return metadata
-    return amis
+        regions = healthy_regions(profile)
+
+    return latest_images(
+        profile, regions, detailed, debug,
+        Owners=[MICROSOFT],
+        Filters=[
+            {
+                'Name': 'name',
+                'Values': [
+                    filter_criteria
+                ]
+            }
+        ]
+    )
 
 
 def is_tty():
@@ -635,8 +559,7 @@ def format_text(json_object, debug=False):
 
     except KeyError as e:
         logger.exception(
-            '%s: json_object does not appear to be json structure. Error (%s)' %
-            (inspect.stack()[0][3], str(e))
+            'json_object does not appear to be json structure. Error (%s)' % str(e)
             )
         return ''
     return data.split('\n'), region, name, bddict
@@ -653,94 +576,95 @@ def main(profile, imagetype, format, details, debug, filename='', rgn=None):
 
     """
     try:
-        if imagetype.startswith('amazonlinux1'):
-            latest = amazonlinux1(
-                        profile=profile,
-                        region=rgn,
-                        detailed=details,
-                        debug=debug
-                    )
-
-        elif imagetype.startswith('amazonlinux2'):
-            latest = amazonlinux2(
-                        profile=profile,
-                        region=rgn,
-                        detailed=details,
-                        debug=debug
-                    )
-
-        elif imagetype.startswith('centos'):
-            latest = centos(
-                        profile=profile,
-                        os=os_version(imagetype),
-                        region=rgn,
-                        detailed=details,
-                        debug=debug
-                    )
-
-        elif imagetype.startswith('fedora'):
-            latest = fedora(
-                        profile=profile,
-                        os=os_version(imagetype),
-                        region=rgn,
-                        detailed=details,
-                        debug=debug
-                    )
-
-        elif imagetype.startswith('redhat'):
-            latest = redhat(
-                        profile=profile,
-                        os=os_version(imagetype),
-                        region=rgn,
-                        detailed=details,
-                        debug=debug
-                    )
-
-        elif imagetype.startswith('ubuntu'):
-            latest = ubuntu(
-                        profile=profile,
-                        os=os_version(imagetype),
-                        region=rgn,
-                        detailed=details,
-                        debug=debug
-                    )
-
-        elif imagetype.startswith('windows'):
-            latest = windows(
-                        profile=profile,
-                        os=os_version(imagetype),
-                        region=rgn,
-                        detailed=details,
-                        debug=debug
-                    )
+        with span('discovery', profile=profile, imagetype=imagetype, region=rgn):
+            if imagetype.startswith('amazonlinux1'):
+                latest = amazonlinux1(
+                            profile=profile,
+                            region=rgn,
+                            detailed=details,
+                            debug=debug
+                        )
+
+            elif imagetype.startswith('amazonlinux2'):
+                latest = amazonlinux2(
+                            profile=profile,
+                            region=rgn,
+                            detailed=details,
+                            debug=debug
+                        )
+
+            elif imagetype.startswith('centos'):
+                latest = centos(
+                            profile=profile,
+                            os=os_version(imagetype),
+                            region=rgn,
+                            detailed=details,
+                            debug=debug
+                        )
+
+            elif imagetype.startswith('fedora'):
+                latest = fedora(
+                            profile=profile,
+                            os=os_version(imagetype),
+                            region=rgn,
+                            detailed=details,
+                            debug=debug
+                        )
+
+            elif imagetype.startswith('redhat'):
+                latest = redhat(
+                            profile=profile,
+                            os=os_version(imagetype),
+                            region=rgn,
+                            detailed=details,
+                            debug=debug
+                        )
+
+            elif imagetype.startswith('ubuntu'):
+                latest = ubuntu(
+                            profile=profile,
+                            os=os_version(imagetype),
+                            region=rgn,
+                            detailed=details,
+                            debug=debug
+                        )
+
+            elif imagetype.startswith('windows'):
+                latest = windows(
+                            profile=profile,
+                            os=os_version(imagetype),
+                            region=rgn,
+                            detailed=details,
+                            debug=debug
+                        )
 
         # return appropriate response format
-        if format == 'json' and not filename:
-            if is_tty():
-                r = export_json_object(latest, logging=False)
-            else:
-                print(json.dumps(latest, indent=4))
-                return True
+        with span('render', format=format):
+            if format == 'json' and not filename:
+                if is_tty():
+                    r = export_json_object(latest, logging=False)
+                else:
+                    print(json.dumps(latest, indent=4))
+                    return True
 
-        elif format == 'json' and filename:
-            r = export_json_object(latest, filename=filename)
+            elif format == 'json' and filename:
+                r = export_json_object(latest, filename=filename)
 
-        elif format == 'text' and not filename and len([x for x in latest]) == 1:
-            # single region
-            print_data, regioncode, ami_title, bddict = format_text(latest)
-            return print_text_stdout(ami_title, print_data, regioncode, bddict)
+            elif format == 'text' and not filename and len([x for x in latest]) == 1:
+                # single region
+                print_data, regioncode, ami_title, bddict = format_text(latest)
+                return print_text_stdout(ami_title, print_data, regioncode, bddict)
 
-        elif format == 'text' and not filename and rgn is None:
-            # all regions
-            return print_text_allregions(latest)
+            elif format == 'text' and not filename and rgn is None:
+                # all regions
+                return print_text_allregions(latest)
 
-        elif format == 'text' and filename:
-            r = write_to_file(text=format_text(latest), file=filename)
+            elif format == 'text' and filename:
+                r = write_to_file(text=format_text(latest), file=filename)
 
     except Exception as e:
         logger.exception(
-            '%s: Unknown problem retrieving data from AWS (%s)' %
-            (inspect.stack()[0][3], str(e)))
+            'Unknown problem retrieving data from AWS (%s)' % str(e))
         return False
     return r
 
@@ -759,6 +683,13 @@ def options(parser, help_menu=False):
     parser.add_argument("-f", "--format", nargs='?', default='json', type=str, choices=VALID_FORMATS, required=False)
     parser.add_argument("-n", "--filename", nargs='?', default='', type=str, required=False)
     parser.add_argument("-D", "--debug", dest='debug', default=False, action='store_true', required=False)
+    parser.add_argument(
+        "-T", "--timings", dest='timings', default=False, action='store_true', required=False
+    )
+    parser.add_argument(
+        "-S", "--stats", dest='stats', default=False, action='store_true', required=False
+    )
+    parser.add_argument("--deadline", dest='deadline', type=float, default=None, required=False)
     parser.add_argument("-V", "--version", dest='version', action='store_true', required=False)
     parser.add_argument("-h", "--help", dest='help', action='store_true', required=False)
     return parser.parse_args()
@@ -770,9 +701,7 @@ def newest_ami(image_list):
         Returns metadata for the most recent amazon machine image returned
         for a region from boto3
     """
-    if image_list:
-        return sorted(image_list, key=lambda k: k['CreationDate'])[-1]
-    return {}
+    return max(image_list, key=lambda k: k['CreationDate'], default={})
 
 
 def package_version():
@@ -805,12 +734,13 @@ def write_to_file(text, file):
             f1.write(text)
     except OSError as e:
         logger.exception(
-            '%s: Problem writing %s to local filesystem' %
-            (inspect.stack()[0][3], file))
+            'Problem writing %s to local filesystem' % file)
         return False
     return True
 
 
+@profiling.profiled('machineimage')
+@authentication_failures
 def init_cli():
     """ Collect parameters and call main """
     try:
@@ -830,6 +760,12 @@ def init_cli():
         stdout_message(message='filename: %s' % args.filename, prefix='DBUG', severity='WARNING')
         stdout_message(message='debug flag: %s' % str(args.debug), prefix='DBUG', severity='WARNING')
 
+    if args.timings:
+        timings.enable()
+
+    stats.enable('machineimage', dump=args.stats)
+    deadline.start(args.deadline)
+
     if len(sys.argv) == 1:
         help_menu()
         sys.exit(exit_codes['EX_OK']['Code'])
@@ -849,6 +785,7 @@ def init_cli():
                         format=args.format, filename=args.filename,
                         rgn=args.region, details=args.details, debug=args.debug
                     )
+                deadline.finish()
             else:
                 stdout_message(
                         'Invalid AWS region code %s. Region must be one of:' %
@@ -867,6 +804,7 @@ def init_cli():
                     format=args.format, filename=args.filename,
                     details=args.details, debug=args.debug
                 )
+            deadline.finish()
         else:
             stdout_message(
                     f'Image type must be one of: {VALID_AMI_TYPES}',
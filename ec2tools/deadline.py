@@ -0,0 +1,158 @@
+"""
+Summary.
+
+    Time limit of a command (--deadline).  Once the deadline has passed,
+    region work still outstanding is abandoned: waits for region results
+    stop, abandoned regions are reported as timed out, and every new api
+    call fails with DeadlineExceeded so worker threads stop at their next
+    call (or page) instead of starting more work.  Commands which
+    abandoned regions exit with EXIT_DEADLINE after writing the regions
+    that did finish.
+
+    The deadline is measured on the monotonic clock and inherited by
+    worker processes (profileaccount --profiles).
+
+"""
+
+import os
+import sys
+import time
+import atexit
+import threading
+from concurrent.futures import as_completed as _as_completed, TimeoutError as FuturesTimeout
+from ec2tools import logd, __version__
+
+
+# globals
+logger = logd.getLogger(__version__)
+
+# status of a region abandoned when the deadline passed
+TIMED_OUT = 'timed-out'
+
+# exit code of a command returning partial results (sysexits EX_TEMPFAIL)
+EXIT_DEADLINE = 75
+
+_state = {'expires': None, 'abandoned': []}
+_lock = threading.Lock()
+
+# exit handlers writing command output, run by finish: (func, args)
+_exit_handlers = []
+
+
+class DeadlineExceeded(Exception):
+    """ Raised by api calls started after the deadline """
+
+
+def start(seconds):
+    """ Sets the deadline to seconds from now; None removes it """
+    _state['expires'] = None if seconds is None else time.monotonic() + seconds
+
+
+def remaining():
+    """ Seconds left before the deadline, None without a deadline """
+    if _state['expires'] is None:
+        return None
+    return max(_state['expires'] - time.monotonic(), 0)
+
+
+def expired():
+    return remaining() == 0
+
+
+def as_completed(futures):
+    """
+    Summary.
+
+        concurrent.futures.as_completed, ending quietly at the deadline
+
+    Args:
+        :futures (iterable): futures of region work
+
+    Returns:
+        futures completed before the deadline, TYPE: generator
+
+    """
+    try:
+        for future in _as_completed(futures, timeout=remaining()):
+            yield future
+    except FuturesTimeout:
+        return
+
+
+def abandon(futures):
+    """
+    Summary.
+
+        Cancels region work which did not complete before the deadline
+        and records its regions
+
+    Args:
+        :futures (dict): {future: region code} of work not collected
+
+    Returns:
+        abandoned region codes, TYPE: list
+
+    """
+    for future in futures:
+        future.cancel()
+    return record(sorted(futures.values()))
+
+
+def record(regions):
+    """ Records regions (or accounts) abandoned here or by a worker process """
+    with _lock:
+        _state['abandoned'].extend(regions)
+    if regions:
+        logger.warning('Deadline passed; abandoned {}'.format(', '.join(regions)))
+    return regions
+
+
+def abandoned():
+    """ Region codes abandoned by this process """
+    with _lock:
+        return list(_state['abandoned'])
+
+
+def at_exit(func, *args):
+    """
+    Summary.
+
+        Registers an exit handler writing command output (reports,
+        profiles, recorded responses).  Handlers run at interpreter exit,
+        or are run by finish, last registered first, before a deadline
+        exit which skips interpreter exit handlers.
+
+    """
+    atexit.register(func, *args)
+    _exit_handlers.append((func, args))
+
+
+def check(**kwargs):
+    """ before-call handler refusing api calls once the deadline has passed """
+    if expired():
+        raise DeadlineExceeded('deadline passed before the api call started')
+
+
+def finish(code=0):
+    """
+    Summary.
+
+        Exits with EXIT_DEADLINE when regions were abandoned, after
+        flushing output, running the exit handlers registered by at_exit,
+        and flushing log handlers.  The process exits without joining
+        worker threads, which may still be blocked in abandoned api calls.
+        Otherwise returns code.
+
+    """
+    if not abandoned():
+        return code
+    sys.stdout.flush()
+    while _exit_handlers:
+        func, args = _exit_handlers.pop()
+        try:
+            func(*args)
+        except Exception as e:
+            logger.warning('Exit handler {} failed: {}'.format(getattr(func, '__name__', func), e))
+    logd.shutdown()
+    sys.stderr.flush()
+    os._exit(EXIT_DEADLINE)
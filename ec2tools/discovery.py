@@ -0,0 +1,270 @@
+"""
+Summary.
+
+    Account discovery.  Profiles the Vpcs, Subnets, SecurityGroups, and
+    KeyPairs of every region of an AWS account, one thread per region.
+    Used by profileaccount for single, incremental, and multi-account
+    profiles.
+
+"""
+
+import datetime
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from botocore.exceptions import ClientError, ConnectionError as BotoConnectionError
+from ec2tools.paginate import paginate
+from ec2tools.session import boto3_session, span
+from ec2tools.regions import healthy_regions, record_failure, record_success
+from ec2tools import deadline, logd, __version__
+
+
+# globals
+logger = logd.getLogger(__version__)
+MAX_THREADS = 8                 # concurrent region threads per account
+MAX_AGE = 3600                  # seconds before a profile section is stale
+TIME_FORMAT = '%Y-%m-%dT%H:%M:%SZ'
+
+# states of vpc cidr block associations whose address space is released
+RELEASED = ('disassociating', 'disassociated')
+
+
+def get_account_identifier(profile, returnAlias=True):
+    """
+    Summary:
+        Returns account alias
+    Args:
+        :profile (str): profilename present in local awscli configuration
+        :returnAlias (bool): when True (default), returns the account alias if one
+         exists.  If False, returns the AWS AccountId number (12 digit integer sequence)
+    Returns:
+        aws account alias (str) or aws account id number (str)
+    """
+    if returnAlias:
+        client = boto3_session(service='iam', profile=profile)
+        aliases = client.list_account_aliases()['AccountAliases']
+        if aliases:
+            return aliases[0]
+    client = boto3_session(service='sts', profile=profile)
+    return client.get_caller_identity()['Account']
+
+
+def _subnets(client):
+    """ Subnet metadata for the region of the ec2 client provided """
+    return [
+            {
+                x['SubnetId']: {
+                        'AvailabilityZone': x['AvailabilityZone'],
+                        'CidrBlock': x['CidrBlock'],
+                        'State': x['State'],
+                        'IpAddresses': 'Public' if x['MapPublicIpOnLaunch'] else 'Private',
+                        'AvailableIpAddressCount': x.get('AvailableIpAddressCount'),
+                        'VpcId': x['VpcId']
+                    }
+            } for x in paginate(client, 'describe_subnets')
+        ]
+
+
+def _vpcs(client):
+    """ Vpc ipv4 and ipv6 cidr blocks for the region of the ec2 client provided """
+    return [
+            {
+                x['VpcId']: {
+                    'CidrBlocks': (
+                        [
+                            y['CidrBlock'] for y in x.get('CidrBlockAssociationSet', [])
+                            if y.get('CidrBlockState', {}).get('State') not in RELEASED
+                        ] + [
+                            y['Ipv6CidrBlock'] for y in x.get('Ipv6CidrBlockAssociationSet', [])
+                            if y.get('Ipv6CidrBlockState', {}).get('State') not in RELEASED
+                        ]
+                    ) or [x['CidrBlock']],
+                    'IsDefault': x.get('IsDefault', False),
+                    'State': x['State']
+                }
+            } for x in paginate(client, 'describe_vpcs')
+        ]
+
+
+def _rules(permissions):
+    """ Compacts securitygroup IpPermissions to protocol, port range, and sources """
+    return [
+            {
+                'IpProtocol': x['IpProtocol'],
+                'FromPort': x.get('FromPort'),
+                'ToPort': x.get('ToPort'),
+                'Cidrs': (
+                    [y['CidrIp'] for y in x.get('IpRanges', [])] +
+                    [y['CidrIpv6'] for y in x.get('Ipv6Ranges', [])]
+                ),
+                'Groups': [y['GroupId'] for y in x.get('UserIdGroupPairs', []) if 'GroupId' in y],
+                'PrefixLists': [y['PrefixListId'] for y in x.get('PrefixListIds', [])]
+            } for x in permissions
+        ]
+
+
+def _securitygroups(client):
+    """ Securitygroup metadata for the region of the ec2 client provided """
+    return [
+            {
+                x['GroupId']: {
+                    'Description': x['Description'],
+                    'GroupName': x['GroupName'],
+                    'VpcId': x.get('VpcId', ''),
+                    'IngressRules': _rules(x.get('IpPermissions', [])),
+                    'EgressRules': _rules(x.get('IpPermissionsEgress', []))
+                }
+            } for x in paginate(client, 'describe_security_groups')
+        ]
+
+
+def _keypairs(client):
+    """ Keypair names for the region of the ec2 client provided """
+    return [x['KeyName'] for x in paginate(client, 'describe_key_pairs')]
+
+
+def timestamp():
+    """ Current utc time in iso8601 format """
+    return datetime.datetime.utcnow().strftime(TIME_FORMAT)
+
+
+def profile_subnets(profile, region=None):
+    """ Profiles all subnets in an account """
+    subnets = {}
+    regions = [region] if region else healthy_regions(profile)
+
+    for rgn in regions:
+        try:
+            client = boto3_session('ec2', region=rgn, profile=profile)
+            subnets[rgn] = _subnets(client)
+        except ClientError as e:
+            logger.warning(
+                'Unable to retrieve subnets for region {}'.format(rgn)
+                )
+            continue
+    return subnets
+
+
+def profile_securitygroups(profile, region=None):
+    """ Profiles securitygroups in an aws account """
+    sgs = {}
+    regions = [region] if region else healthy_regions(profile)
+
+    for rgn in regions:
+        try:
+            client = boto3_session('ec2', region=rgn, profile=profile)
+            sgs[rgn] = _securitygroups(client)
+        except ClientError as e:
+            logger.warning(
+                'Unable to retrieve securitygroups for region {}. Error: {}'.format(rgn, e)
+                )
+            continue
+    return sgs
+
+
+def profile_keypairs(profile, region=None):
+    keypairs = {}
+    regions = [region] if region else healthy_regions(profile)
+
+    for rgn in regions:
+        try:
+            client = boto3_session('ec2', region=rgn, profile=profile)
+            keypairs[rgn] = _keypairs(client)
+        except ClientError as e:
+            logger.warning(
+                'Unable to retrieve keypairs for region {}'.format(rgn)
+                )
+            continue
+    return keypairs
+
+
+def profile_region(profile, region, sections=None):
+    """
+    Summary:
+        Profiles Vpcs, Subnets, SecurityGroups, and KeyPairs in a single region
+        using one ec2 client.  The time each section was retrieved is
+        recorded under the Timestamps key.
+    Args:
+        :sections (list): section names to profile.  Default: all SECTIONS
+    Returns:
+        region profile, TYPE: dict
+    """
+    client = boto3_session('ec2', region=region, profile=profile)
+    profile_data = {'Timestamps': {}}
+
+    with span('profile_region', profile=profile, region=region):
+        for section in (sections or SECTIONS):
+            profile_data[section] = SECTIONS[section](client)
+            profile_data['Timestamps'][section] = timestamp()
+    return profile_data
+
+
+def profile_account(profile, regions=None, max_workers=MAX_THREADS, writer=None, completed=None):
+    """
+    Summary:
+        Profiles all regions of an AWS account concurrently, one thread
+        per region.  Regions which fail to profile are logged and omitted;
+        regions failing with region level errors are skipped by later
+        runs until their cooldown has passed (ec2tools.regions).  Regions
+        not finished by the --deadline are written as timed out.
+    Args:
+        :profile (str): profilename present in local awscli configuration
+        :regions (list): region codes to profile.  Default: all regions
+        :max_workers (int): maximum number of region threads
+        :writer (JSONStreamWriter): when provided, each region is written as
+            soon as it completes and is not retained in the profile returned
+        :completed (callable): called with the region code of each region
+            profiled
+    Returns:
+        account profile, TYPE: dict
+    """
+    container = {
+        'AccountId': get_account_identifier(profile, returnAlias=False),
+        'AccountAlias': get_account_identifier(profile)
+    }
+    regions = regions or healthy_regions(profile)
+
+    if writer:
+        for key in ('AccountId', 'AccountAlias'):
+            writer.write(key, container[key])
+
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    futures = {executor.submit(profile_region, profile, rgn): rgn for rgn in regions}
+    pending = dict(futures)
+
+    with span('discovery', profile=profile, regions=len(regions)):
+        for future in deadline.as_completed(futures):
+            rgn = pending.pop(future)
+            try:
+                if writer:
+                    writer.write(rgn, future.result())
+                else:
+                    container[rgn] = future.result()
+                record_success(profile, rgn)
+                if completed:
+                    completed(rgn)
+            except (ClientError, BotoConnectionError) as e:
+                if not record_failure(profile, rgn, e):
+                    logger.warning(
+                        'Unable to profile region {}. Error: {}'.format(rgn, e)
+                        )
+            except deadline.DeadlineExceeded:
+                pending[future] = rgn
+
+    for rgn in deadline.abandon(pending):
+        if writer:
+            writer.write(rgn, {'Status': deadline.TIMED_OUT})
+        else:
+            container[rgn] = {'Status': deadline.TIMED_OUT}
+
+    # abandoned regions are not waited for
+    executor.shutdown(wait=not pending)
+    return container
+
+
+# profile sections; section name: retrieval function
+SECTIONS = OrderedDict([
+    ('Vpcs', _vpcs),
+    ('Subnets', _subnets),
+    ('SecurityGroups', _securitygroups),
+    ('KeyPairs', _keypairs)
+])
@@ -4,13 +4,19 @@
 import sys
 import json
 import argparse
-import inspect
-from botocore.exceptions import ClientError
+import tempfile
 from pyaws.utils import stdout_message, export_json_object, userchoice_mapping
-from pyaws.session import authenticated, boto3_session, parse_profiles
-from pyaws.ec2 import get_regions, default_region
+from pyaws.session import parse_profiles
 from pyaws import Colors
 from ec2tools.statics import local_config
+from ec2tools.session import authenticated, authentication_failures, span
+from ec2tools.discovery import get_account_identifier, profile_account, MAX_AGE
+from ec2tools.incremental import load_profile, refresh_profile, diff_profiles, save_profile
+from ec2tools.accounts import awscli_profiles, profile_accounts, print_summary
+from ec2tools import deadline, profiling, stats, timings
+from ec2tools.inventory import query_cli, update_inventory
+from ec2tools.cidr import analyze_cli
+from ec2tools.jsonstream import JSONStreamWriter, atomic_file, display, COLOR_MAX_BYTES
 from ec2tools import about, logd, __version__
 
 try:
@@ -35,12 +41,12 @@ def help_menu():
     Displays command line parameter options
 
     """
-    menu = '''
+    menu = ('''
                     ''' + bd + CALLER + rst + ''' help contents
 
   ''' + bd + '''DESCRIPTION''' + rst + '''
 
-          Profile AWS Account Environment.  Collects Subnets,
+          Profile AWS Account Environment.  Collects Vpcs, Subnets,
           SecurityGroups, and ssh Keypairs for all AWS regions.
 
   ''' + bd + '''OPTIONS''' + rst + '''
@@ -48,14 +54,34 @@ def help_menu():
             $ ''' + act + CALLER + rst + '''  --profile <PROFILE> [--outputfile]
 
                          -p, --profile  <value>
+                        [-P, --profiles <value> ]
+                        [-a, --all-profiles ]
+                        [--processes <value> ]
                         [-o, --outputfile ]
                         [-r, --region   <value> ]
+                        [-i, --incremental ]
+                        [-m, --max-age  <value> ]
+                        [-T, --timings   ]
+                        [-S, --stats     ]
+                        [--deadline <value> ]
                         [-d, --debug     ]
                         [-h, --help      ]
 
         ''' + bd + '''-p''' + rst + ''', ''' + bd + '''--profile''' + rst + '''  (string):  IAM username or Role corresponding
             to a profile name from local awscli configuration
 
+        ''' + bd + '''-P''' + rst + ''', ''' + bd + '''--profiles''' + rst +
+        ''' (string):  Comma-separated list of profile
+            names (a,b,c).  Accounts are profiled concurrently; one .profile
+            file is written per account plus a merged accounts.index file.
+
+        ''' + bd + '''-a''' + rst + ''', ''' + bd + '''--all-profiles''' + rst +
+        ''':  Profile every account found in the
+            local awscli configuration.  Output as for --profiles.
+
+        ''' + bd + '''--processes''' + rst + ''' (integer):  Maximum number of accounts profiled
+            concurrently with --profiles or --all-profiles (Default: 16)
+
         ''' + bd + '''-o''' + rst + ''', ''' + bd + '''--outputfile''' + rst + ''' (string):  When parameter present, produces
             a local json file containing metadata gathered about the
             AWS Account designated by --profile during profiling.
@@ -65,6 +91,29 @@ def help_menu():
             all AWS regions in the AWS Account designated by profile
             name provided with --profile.
 
+        ''' + bd + '''-i''' + rst + ''', ''' + bd + '''--incremental''' + rst +
+        ''':  Refresh the existing local profile,
+            re-querying only regions and sections older than --max-age.
+            Writes a diff of added, removed, and changed resources to
+            <alias>.diff alongside the refreshed profile.
+
+        ''' + bd + '''-m''' + rst + ''', ''' + bd + '''--max-age''' + rst +
+        ''' (integer):  Age in seconds after which a
+            profile section is stale when using --incremental (Default: 3600)
+
+        ''' + bd + '''-T''' + rst + ''', ''' + bd + '''--timings''' + rst +
+        ''':  Print a summary of AWS api call latency
+            (count, total, p50, p95 per operation and region) and of time
+            spent in discovery and rendering when the command exits.
+
+        ''' + bd + '''-S''' + rst + ''', ''' + bd + '''--stats''' + rst +
+        ''':  Print AWS api call, error, retry, throttle,
+            and bytes received counters of the command as json at exit.
+
+        ''' + bd + '''--deadline''' + rst + ''' (seconds):  Write the regions profiled within the
+            number of seconds given.  Regions still outstanding are abandoned
+            and written as {"Status": "timed-out"}; the exit code is 75.
+
         ''' + bd + '''-d''' + rst + ''', ''' + bd + '''--debug''' + rst + ''': Debug mode, verbose output.
 
         ''' + bd + '''-h''' + rst + ''', ''' + bd + '''--help''' + rst + ''': Print this help menu
@@ -72,7 +121,34 @@ def help_menu():
         ''' + bd + '''-s''' + rst + ''', ''' + bd + '''--show''' + rst + ''' {profiles | ?}:  Display user information
 
         ''' + bd + '''-V''' + rst + ''', ''' + bd + '''--version''' + rst + ''': Print package version and License information
-    '''
+
+  ''' + bd + '''QUERY''' + rst + '''
+
+            $ ''' + act + CALLER + rst +
+            '''  query {subnets | securitygroups | keypairs | exposure} [filters]
+
+            Queries the local inventory of profiled accounts without calling
+            AWS.  Profiles are added to the inventory whenever written to
+            disk; --reindex reloads all local .profile files.  Filters:
+
+                --account, --region, --vpc, --az, --cidr, --name <glob>,
+                --public, --private, --reindex
+
+            exposure lists securitygroup rules in any region which open
+            --port to --cidr (for example, --port 22 --cidr 0.0.0.0/0).
+            Options: --protocol <tcp>, --egress, --exact
+
+  ''' + bd + '''ANALYZE''' + rst + '''
+
+            $ ''' + act + CALLER + rst + '''  analyze {overlaps | capacity} [options]
+
+            overlaps reports vpc cidrs (--subnets: subnet cidrs) of different
+            vpcs which share address space across all regions and accounts
+            profiled locally; capacity reports free ip addresses per subnet
+            (--by-az: per availability zone).  Options:
+
+                --account, --region, --subnets, --by-az, --skip-default
+    ''')
     print(menu)
     return True
 
@@ -87,98 +163,6 @@ def is_tty():
     return sys.stdout.isatty()
 
 
-def get_account_identifier(profile, returnAlias=True):
-    """
-    Summary:
-        Returns account alias
-    Args:
-        :profile (str): profilename present in local awscli configuration
-        :returnAlias (bool): when True (default), returns the account alias if one
-         exists.  If False, returns the AWS AccountId number (12 digit integer sequence)
-    Returns:
-        aws account alias (str) or aws account id number (str)
-    """
-    client = boto3_session(service='iam', profile=profile)
-    alias = client.list_account_aliases()['AccountAliases'][0]
-    if alias and returnAlias:
-        return alias
-    client = boto3_session(service='sts', profile=profile)
-    return client.get_caller_identity()['Account']
-
-
-def profile_subnets(profile):
-    """ Profiles all subnets in an account """
-    subnets = {}
-    for rgn in get_regions():
-        try:
-            client = boto3_session('ec2', region=rgn, profile=profile)
-            r = client.describe_subnets()['Subnets']
-            subnets[rgn] = [
-                    {
-                        x['SubnetId']: {
-                                'AvailabilityZone': x['AvailabilityZone'],
-                                'CidrBlock': x['CidrBlock'],
-                                'State': x['State'],
-                                'IpAddresses': 'Public' if x['MapPublicIpOnLaunch'] else 'Private',
-                                'VpcId': x['VpcId']
-                            }
-                    } for x in r
-                ]
-        except ClientError as e:
-            logger.warning(
-                '{}: Unable to retrieve subnets for region {}'.format(inspect.stack()[0][3], rgn)
-                )
-            continue
-    return subnets
-
-
-def profile_securitygroups(profile, region=None):
-    """ Profiles securitygroups in an aws account
-    THIS IS BROKEN -- ONLY WORKS WHEN GIVEN region,
-    LOOPING THRU REGIONS FAILS
-    """
-    sgs = {}
-    regions = [region] or get_regions()
-
-    for rgn in regions:
-        try:
-            client = boto3_session('ec2', region=rgn, profile=profile)
-            r = client.describe_security_groups()['SecurityGroups']
-            sgs[rgn] = [
-                    {
-                        x['GroupId']: {
-                            'Description': x['Description'],
-                            'GroupName': x['GroupName'],
-                            'VpcId': x['VpcId']
-                        }
-                    } for x in r
-                ]
-        except ClientError as e:
-            stack = inspect.stack()[0][3]
-            logger.warning(
-                '{}: Unable to retrieve securitygroups for region {}. Error: {}'.format(stack, rgn, e)
-                )
-            continue
-    return sgs
-
-
-def profile_keypairs(profile, region=None):
-    keypairs = {}
-
-    regions = [region] or get_regions()
-
-    for rgn in regions:
-        try:
-            client = boto3_session('ec2', region=rgn, profile=profile)
-            keypairs[rgn] = [x['KeyName'] for x in client.describe_key_pairs()['KeyPairs']]
-        except ClientError as e:
-            logger.warning(
-                '{}: Unable to retrieve keypairs for region {}'.format(inspect.stack()[0][3], rgn)
-                )
-            continue
-    return keypairs
-
-
 def options(parser):
     """
     Summary:
@@ -188,8 +172,25 @@ def options(parser):
     """
     parser.add_argument("-p", "--profile", nargs='?', default="default",
                               required=False, help="type (default: %(default)s)")
+    parser.add_argument(
+        "-P", "--profiles", dest='profiles', nargs='?', default=None, required=False
+    )
+    parser.add_argument(
+        "-a", "--all-profiles", dest='all_profiles', action='store_true', required=False
+    )
+    parser.add_argument("--processes", dest='processes', type=int, default=None, required=False)
     parser.add_argument("-o", "--outputfile", dest='outputfile', action='store_true', required=False)
+    parser.add_argument("-r", "--region", dest='region', nargs='?', default=None, required=False)
+    parser.add_argument(
+        "-i", "--incremental", dest='incremental', action='store_true', required=False
+    )
+    parser.add_argument(
+        "-m", "--max-age", dest='max_age', type=int, default=MAX_AGE, required=False
+    )
     parser.add_argument("-d", "--debug", dest='debug', action='store_true', required=False)
+    parser.add_argument("-T", "--timings", dest='timings', action='store_true', required=False)
+    parser.add_argument("-S", "--stats", dest='stats', action='store_true', required=False)
+    parser.add_argument("--deadline", dest='deadline', type=float, default=None, required=False)
     parser.add_argument("-s", "--show", dest='show', nargs='?', required=False)
     parser.add_argument("-V", "--version", dest='version', action='store_true', required=False)
     parser.add_argument("-h", "--help", dest='help', action='store_true', required=False)
@@ -217,7 +218,9 @@ def precheck(parameters):
     for arg in sys.argv[1:]:
         if arg.startswith('-') or arg.startswith('--'):
             if arg not in (
-                '--profile', '-p', '-o', '--outputfile', '-d', '--debug', '-s', '--show',
+                '--profile', '-p', '-P', '--profiles', '-a', '--all-profiles', '--processes',
+                '-o', '--outputfile', '-r', '--region', '-i', '--incremental', '-m', '--max-age',
+                '-d', '--debug', '-T', '--timings', '-S', '--stats', '--deadline', '-s', '--show',
                 '-V', '--version', '-h', '--help'
             ):
                 stdout_message(
@@ -275,10 +278,43 @@ def valid(input):
     return False
 
 
+def incremental_profile(profile, regions=None, max_age=MAX_AGE):
+    """
+    Summary:
+        Refreshes stale sections of the local account profile, writes
+        the refreshed profile and a diff (<alias>.diff) against the
+        previous profile to the local filesystem, and displays the diff
+    Returns:
+        Success or Failure, TYPE: bool
+    """
+    alias = get_account_identifier(profile)
+    previous = load_profile(FILE_PATH + '/' + alias + '.profile')
+    container = refresh_profile(profile, previous, regions, max_age)
+    diff = diff_profiles(previous, container)
+
+    save_profile(FILE_PATH + '/' + alias + '.profile', container, diff)
+    update_inventory([FILE_PATH + '/' + alias + '.profile'])
+
+    if is_tty():
+        export_json_object(diff, logging=False)
+        stdout_message('AWS Account profile refreshed, {} regions changed'.format(len(diff)))
+    else:
+        print(json.dumps(diff, indent=4))
+    return True
+
+
+@profiling.profiled(CALLER)
+@authentication_failures
 def init_cli():
     """
     Initializes commandline script
     """
+    if sys.argv[1:2] == ['query']:
+        return query_cli(sys.argv[2:])
+
+    elif sys.argv[1:2] == ['analyze']:
+        return analyze_cli(sys.argv[2:])
+
     parser = argparse.ArgumentParser(add_help=False)
 
     try:
@@ -289,6 +325,12 @@ def init_cli():
         stdout_message(str(e), 'ERROR')
         sys.exit(exit_codes['EX_OK']['Code'])
 
+    if args.timings:
+        timings.enable()
+
+    stats.enable(CALLER, dump=args.stats)
+    deadline.start(args.deadline)
+
     if not precheck(args):
         sys.exit(exit_codes['E_DEPENDENCY']['Code'])
 
@@ -310,40 +352,54 @@ def init_cli():
     elif args.show:
         return show_information(args.show)
 
+    elif args.profiles or args.all_profiles:
+        if args.all_profiles:
+            profiles = awscli_profiles()
+        else:
+            profiles = [x.strip() for x in args.profiles.split(',') if x.strip()]
+
+        if not profiles:
+            stdout_message('No profiles found to profile. Exit', prefix='WARN')
+            sys.exit(exit_codes['E_BADPROFILE']['Code'])
+
+        index = profile_accounts(
+                    profiles,
+                    regions=[args.region] if args.region else None,
+                    processes=args.processes,
+                    incremental=args.incremental,
+                    max_age=args.max_age
+                )
+        update_inventory([x['ProfileFile'] for x in index['Accounts'] if x['Status'] == 'OK'])
+        return deadline.finish(print_summary(index))
+
     elif args.profile:
         if authenticated(profile=parse_profiles(args.profile)):
 
-            container = {}
-            default_outputfile = get_account_identifier(parse_profiles(args.profile)) + '.profile'
-            region = default_region(args.profile)
-
-            # add aws account identifiers
-            container['AccountId'] = get_account_identifier(parse_profiles(args.profile), returnAlias=False)
-            container['AccountAlias'] = get_account_identifier(parse_profiles(args.profile))
-
-            # profile the account
-            r_subnets = profile_subnets(profile=parse_profiles(args.profile))
-            r_sgs = profile_securitygroups(profile=parse_profiles(args.profile))
-            r_keypairs = profile_keypairs(profile=parse_profiles(args.profile))
-
-            # assemble profile data into single json schema
-            if r_subnets and r_sgs and r_keypairs:
-
-                try:
-                    for region in get_regions():
-                        temp = {}
-                        temp['Subnets'] = r_subnets[region]
-                        temp['SecurityGroups'] = r_sgs[region]
-                        temp['KeyPairs'] = r_keypairs[region]
-                        container[region] = temp
-                except KeyError as e:
-                    raise e
-
-                if args.outputfile:
-                    export_json_object(container, FILE_PATH + '/' + default_outputfile)
-                elif is_tty():
-                    export_json_object(container, logging=False)
+            regions = [args.region] if args.region else None
+
+            if args.incremental:
+                return deadline.finish(
+                    incremental_profile(parse_profiles(args.profile), regions, args.max_age)
+                )
+
+            # profile the account, streaming each region to output as it completes
+            if args.outputfile:
+                alias = get_account_identifier(parse_profiles(args.profile))
+                with atomic_file(FILE_PATH + '/' + alias + '.profile') as f1:
+                    writer = JSONStreamWriter(f1)
+                    profile_account(parse_profiles(args.profile), regions, writer=writer)
+                    writer.close()
+                update_inventory([FILE_PATH + '/' + alias + '.profile'])
+            else:
+                with tempfile.SpooledTemporaryFile(mode='w+', max_size=COLOR_MAX_BYTES) as f1:
+                    writer = JSONStreamWriter(f1)
+                    profile_account(parse_profiles(args.profile), regions, writer=writer)
+                    writer.close()
+                    with span('render'):
+                        display(f1)
+                if is_tty():
                     stdout_message('AWS Account profile complete')
+            deadline.finish()
         return True
 
     else:
@@ -41,6 +41,9 @@
                            [-f, --format   <value> ]
                            [-p, --profile <value> ]
                            [-r, --region   <value> ]
+                           [-T, --timings  ]
+                           [-S, --stats    ]
+                           [--deadline <seconds> ]
                            [-d, --debug    ]
                            [-h, --help     ]
                            [-V, --version  ]
@@ -89,6 +92,17 @@
 
             If the region parameter is omitted,  """ + PACKAGE + """ returns Amazon
             Machine Images for """ + UL + IT + "all regions" + rst + """.
+    """ + c.BOLD + c.WHITE + """
+        -T, --timings""" + rst + """:  Print a summary of AWS api call latency (count,
+            total, p50, p95 per operation and region) and of time spent
+            in discovery and rendering when the command exits.
+    """ + c.BOLD + c.WHITE + """
+        -S, --stats""" + rst + """:  Print AWS api call, error, retry, throttle, and bytes
+            received counters of the command as json at exit.
+    """ + c.BOLD + c.WHITE + """
+        --deadline""" + rst + """  <seconds>:  Return the regions which finished within
+            the number of seconds given.  Regions still outstanding are
+            abandoned and reported as "timed-out"; the exit code is 75.
     """ + c.BOLD + c.WHITE + """
         -d, --debug""" + rst + """:  Turn on verbose log output.
     """ + c.BOLD + c.WHITE + """
@@ -0,0 +1,239 @@
+"""
+Summary.
+
+    Incremental account profiling.  Loads a previous account profile,
+    re-queries only the regions and sections whose timestamps are older
+    than a maximum age, and computes a structured diff between the
+    previous and refreshed profiles.
+
+"""
+
+import os
+import json
+import datetime
+from concurrent.futures import ThreadPoolExecutor
+from botocore.exceptions import ClientError, ConnectionError as BotoConnectionError
+from ec2tools.discovery import (
+    get_account_identifier, profile_region, MAX_AGE, MAX_THREADS, SECTIONS, TIME_FORMAT
+)
+from ec2tools.jsonstream import JSONStreamWriter, atomic_file
+from ec2tools.regions import enabled_regions, healthy_regions, record_failure, record_success
+from ec2tools import deadline, logd, __version__
+
+
+# globals
+logger = logd.getLogger(__version__)
+ACCOUNT_KEYS = ('AccountId', 'AccountAlias')
+
+
+def account_regions(container):
+    """ Returns region codes present in an account profile """
+    return [k for k, v in container.items() if k not in ACCOUNT_KEYS and isinstance(v, dict)]
+
+
+def load_profile(path):
+    """
+    Summary:
+        Reads an account profile from the local filesystem
+    Returns:
+        account profile (dict) or None if absent or unreadable
+    """
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path) as f1:
+            return json.loads(f1.read())
+    except (OSError, ValueError) as e:
+        logger.warning(
+            'Unable to read previous profile %s: %s' % (path, e))
+    return None
+
+
+def save_profile(path, container, diff):
+    """
+    Summary:
+        Writes a refreshed account profile to path and its diff against
+        the previous profile to <alias>.diff alongside it.  Each file
+        replaces its predecessor only once completely written
+    """
+    for filename, content in ((os.path.splitext(path)[0] + '.diff', diff), (path, container)):
+        with atomic_file(filename) as f1:
+            writer = JSONStreamWriter(f1)
+            for key, value in content.items():
+                writer.write(key, value)
+            writer.close()
+
+
+def section_age(region_profile, section, now=None):
+    """
+    Summary:
+        Age in seconds of a section of a region profile.  Sections with no
+        recorded timestamp (profiles created before timestamps existed) are
+        infinitely old.
+    """
+    now = now or datetime.datetime.utcnow()
+    try:
+        then = datetime.datetime.strptime(region_profile['Timestamps'][section], TIME_FORMAT)
+    except (KeyError, TypeError, ValueError):
+        return float('inf')
+    return (now - then).total_seconds()
+
+
+def stale_sections(previous, regions, max_age=MAX_AGE):
+    """
+    Summary:
+        Identifies sections requiring refresh
+    Args:
+        :previous (dict): previous account profile
+        :regions (list): region codes which the refreshed profile must contain
+        :max_age (int): maximum age in seconds of a section before it is stale
+    Returns:
+        region code: list of stale section names, TYPE: dict
+    """
+    stale = {}
+    now = datetime.datetime.utcnow()
+
+    for rgn in regions:
+        region_profile = previous.get(rgn)
+        if not isinstance(region_profile, dict):
+            stale[rgn] = list(SECTIONS)
+            continue
+        sections = [
+            x for x in SECTIONS
+            if x not in region_profile or section_age(region_profile, x, now) > max_age
+        ]
+        if sections:
+            stale[rgn] = sections
+    return stale
+
+
+def refresh_profile(profile, previous, regions=None, max_age=MAX_AGE, max_workers=MAX_THREADS):
+    """
+    Summary:
+        Incrementally refreshes an account profile.  Only stale sections
+        are queried; fresh sections are carried forward from the previous
+        profile.  Regions which fail to refresh, are skipped as failing
+        (ec2tools.regions), or are not refreshed by the --deadline retain
+        their previous data.
+    Args:
+        :profile (str): profilename present in local awscli configuration
+        :previous (dict): previous account profile, or None
+        :regions (list): region codes to profile.  Default: all regions.  When
+            given, regions of the previous profile not listed are carried forward
+    Returns:
+        refreshed account profile, TYPE: dict
+    """
+    previous = previous or {}
+    container = {
+        'AccountId': (
+            previous.get('AccountId') or get_account_identifier(profile, returnAlias=False)
+        ),
+        'AccountAlias': previous.get('AccountAlias') or get_account_identifier(profile)
+    }
+
+    if regions:
+        retained = set(regions) | set(account_regions(previous))
+    else:
+        regions = enabled_regions(profile)
+        retained = set(regions)
+
+    for rgn in retained:
+        if isinstance(previous.get(rgn), dict):
+            container[rgn] = {k: v for k, v in previous[rgn].items() if k in SECTIONS}
+            container[rgn]['Timestamps'] = dict(previous[rgn].get('Timestamps', {}))
+
+    stale = stale_sections(previous, healthy_regions(profile, regions), max_age)
+
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    futures = {
+        executor.submit(profile_region, profile, rgn, sections): rgn
+        for rgn, sections in stale.items()
+    }
+    pending = dict(futures)
+
+    for future in deadline.as_completed(futures):
+        rgn = pending.pop(future)
+        try:
+            refreshed = future.result()
+            record_success(profile, rgn)
+        except (ClientError, BotoConnectionError) as e:
+            if not record_failure(profile, rgn, e):
+                logger.warning(
+                    'Unable to refresh region {}. Error: {}'.format(rgn, e)
+                    )
+            continue
+        except deadline.DeadlineExceeded:
+            pending[future] = rgn
+            continue
+        region_profile = container.setdefault(rgn, {'Timestamps': {}})
+        region_profile['Timestamps'].update(refreshed.pop('Timestamps'))
+        region_profile.update(refreshed)
+
+    # regions abandoned at the deadline keep their previous data
+    deadline.abandon(pending)
+    executor.shutdown(wait=not pending)
+    return container
+
+
+def _keyed(records):
+    """ Converts profile list of single key dicts to a dict keyed by resource id """
+    keyed = {}
+    for record in records:
+        keyed.update(record)
+    return keyed
+
+
+def diff_section(old, new):
+    """
+    Summary:
+        Compares two lists of profile records of the same section.  Sections
+        which are lists of names (KeyPairs) report Added and Removed names only.
+    Returns:
+        {'Added': {id: record}, 'Removed': {id: record}, 'Changed': {id: {field: [old, new]}}}
+        containing only non-empty keys, TYPE: dict
+    """
+    if not all(isinstance(x, dict) for x in old + new):
+        delta = {'Added': sorted(set(new) - set(old)), 'Removed': sorted(set(old) - set(new))}
+        return {k: v for k, v in delta.items() if v}
+
+    old, new = _keyed(old), _keyed(new)
+    changed = {}
+
+    for rid in old.keys() & new.keys():
+        fields = {
+            k: [old[rid].get(k), new[rid].get(k)]
+            for k in old[rid].keys() | new[rid].keys() if old[rid].get(k) != new[rid].get(k)
+        }
+        if fields:
+            changed[rid] = fields
+
+    delta = {
+        'Added': {k: new[k] for k in new.keys() - old.keys()},
+        'Removed': {k: old[k] for k in old.keys() - new.keys()},
+        'Changed': changed
+    }
+    return {k: v for k, v in delta.items() if v}
+
+
+def diff_profiles(old, new):
+    """
+    Summary:
+        Structured diff of two account profiles
+    Returns:
+        region code: section name: diff_section result; regions and sections
+        without changes are omitted, TYPE: dict
+    """
+    old = old or {}
+    diff = {}
+
+    for rgn in sorted(set(account_regions(old)) | set(account_regions(new))):
+        region_diff = {}
+        for section in SECTIONS:
+            delta = diff_section(
+                old.get(rgn, {}).get(section, []), new.get(rgn, {}).get(section, [])
+            )
+            if delta:
+                region_diff[section] = delta
+        if region_diff:
+            diff[rgn] = region_diff
+    return diff
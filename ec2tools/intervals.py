@@ -0,0 +1,111 @@
+"""
+Summary.
+
+    Static centered interval tree.  Built once in O(n log n) from closed
+    integer intervals; answers point (stabbing) and range overlap queries
+    in O(log n + k) for k results.
+
+    >>> t = IntervalTree([(0, 65535, 'all'), (22, 22, 'ssh'), (80, 443, 'web')])
+    >>> sorted(t.at(22))
+    ['all', 'ssh']
+    >>> sorted(t.overlapping(100, 8080))
+    ['all', 'web']
+    >>> IntervalTree([(8, 0, 'reversed')])
+    Traceback (most recent call last):
+        ...
+    ValueError: Interval (8, 0) starts after it ends
+
+"""
+
+from bisect import bisect_right
+from operator import itemgetter
+
+
+class _Node():
+    """ Intervals containing a center point, plus subtrees either side """
+    __slots__ = ('center', 'by_start', 'starts', 'by_end', 'ends', 'left', 'right')
+
+    def __init__(self, center, intervals, left, right):
+        self.center = center
+        self.by_start = sorted(intervals, key=itemgetter(0))
+        self.starts = [x[0] for x in self.by_start]
+        self.by_end = sorted(intervals, key=itemgetter(1), reverse=True)
+        self.ends = [-x[1] for x in self.by_end]
+        self.left = left
+        self.right = right
+
+
+class IntervalTree():
+    """
+    Summary.
+
+        Interval tree over closed intervals [start, end]
+
+    Args:
+        :intervals (iterable): (start, end, value) tuples; start <= end
+
+    """
+    def __init__(self, intervals):
+        intervals = list(intervals)
+        for x in intervals:
+            if x[0] > x[1]:
+                raise ValueError('Interval ({}, {}) starts after it ends'.format(x[0], x[1]))
+        self.size = 0
+        self.root = self._build(intervals)
+
+    def __len__(self):
+        return self.size
+
+    def _build(self, intervals):
+        """ Builds the tree; recursion depth is O(log n) """
+        if not intervals:
+            return None
+        points = sorted(x[0] for x in intervals)
+        center = points[len(points) // 2]
+        left, right, here = [], [], []
+
+        for x in intervals:
+            if x[1] < center:
+                left.append(x)
+            elif x[0] > center:
+                right.append(x)
+            else:
+                here.append(x)
+        self.size += len(here)
+        return _Node(center, here, self._build(left), self._build(right))
+
+    def at(self, point):
+        """ Yields values of all intervals containing point """
+        node = self.root
+        while node is not None:
+            if point < node.center:
+                # intervals here end at or after center; match those starting <= point
+                for x in node.by_start[:bisect_right(node.starts, point)]:
+                    yield x[2]
+                node = node.left
+            else:
+                # intervals here start at or before center; match those ending >= point
+                for x in node.by_end[:bisect_right(node.ends, -point)]:
+                    yield x[2]
+                node = node.right
+
+    def overlapping(self, start, end):
+        """ Yields values of all intervals overlapping [start, end] """
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            if node is None:
+                continue
+            if end < node.center:
+                for x in node.by_start[:bisect_right(node.starts, end)]:
+                    yield x[2]
+                stack.append(node.left)
+            elif start > node.center:
+                for x in node.by_end[:bisect_right(node.ends, -start)]:
+                    yield x[2]
+                stack.append(node.right)
+            else:
+                # query spans center; every interval at this node overlaps
+                for x in node.by_start:
+                    yield x[2]
+                stack.extend((node.left, node.right))
@@ -0,0 +1,471 @@
+"""
+Summary.
+
+    Local account inventory store.  Account profiles (.profile files)
+    are loaded into an indexed SQLite database which answers resource
+    queries across accounts and regions without calling AWS.  Profiles
+    are read one region at a time; the regions loaded for each account
+    are recorded so that a region without resources is distinguished
+    from a region never profiled.
+
+    Usage:
+
+        $ profileaccount query subnets --vpc vpc-0a1b2c3d --public
+        $ profileaccount query securitygroups --name 'web-*'
+        $ profileaccount query keypairs --region eu-west-1
+        $ profileaccount query exposure --port 22 --cidr 0.0.0.0/0
+        $ profileaccount query --reindex
+
+"""
+
+import os
+import sys
+import json
+import glob
+import sqlite3
+import argparse
+from veryprettytable import VeryPrettyTable
+from pyaws.utils import stdout_message
+from ec2tools.statics import local_config
+from ec2tools.sgindex import Rule, covers, normalize_protocol, region_rules
+from ec2tools.jsonstream import iter_items
+from ec2tools.deadline import TIMED_OUT
+from ec2tools import logd, __version__
+
+
+# globals
+logger = logd.getLogger(__version__)
+FILE_PATH = local_config['CONFIG']['CONFIG_DIR']
+DB_PATH = os.path.join(FILE_PATH, 'inventory.db')
+ACCOUNT_KEYS = ('AccountId', 'AccountAlias')
+
+# tables holding the resources of an account
+TABLES = ('regions', 'subnets', 'securitygroups', 'sgrules', 'keypairs')
+
+SCHEMA = """
+    CREATE TABLE IF NOT EXISTS accounts (
+        account_id TEXT PRIMARY KEY,
+        alias TEXT,
+        source TEXT
+    );
+    CREATE TABLE IF NOT EXISTS regions (
+        account_id TEXT,
+        region TEXT,
+        PRIMARY KEY (account_id, region)
+    );
+    CREATE TABLE IF NOT EXISTS subnets (
+        subnet_id TEXT,
+        account_id TEXT,
+        region TEXT,
+        vpc_id TEXT,
+        az TEXT,
+        cidr TEXT,
+        state TEXT,
+        ip_assign TEXT
+    );
+    CREATE TABLE IF NOT EXISTS securitygroups (
+        group_id TEXT,
+        account_id TEXT,
+        region TEXT,
+        vpc_id TEXT,
+        group_name TEXT,
+        description TEXT
+    );
+    CREATE TABLE IF NOT EXISTS sgrules (
+        account_id TEXT,
+        region TEXT,
+        group_id TEXT,
+        group_name TEXT,
+        direction TEXT,
+        protocol TEXT,
+        from_port INTEGER,
+        to_port INTEGER,
+        cidr TEXT
+    );
+    CREATE TABLE IF NOT EXISTS keypairs (
+        key_name TEXT,
+        account_id TEXT,
+        region TEXT
+    );
+    CREATE INDEX IF NOT EXISTS ix_subnets_account ON subnets (account_id, region);
+    CREATE INDEX IF NOT EXISTS ix_subnets_region ON subnets (region);
+    CREATE INDEX IF NOT EXISTS ix_subnets_vpc ON subnets (vpc_id);
+    CREATE INDEX IF NOT EXISTS ix_subnets_az ON subnets (az);
+    CREATE INDEX IF NOT EXISTS ix_subnets_cidr ON subnets (cidr);
+    CREATE INDEX IF NOT EXISTS ix_sgs_account ON securitygroups (account_id, region);
+    CREATE INDEX IF NOT EXISTS ix_sgs_region ON securitygroups (region);
+    CREATE INDEX IF NOT EXISTS ix_sgs_vpc ON securitygroups (vpc_id);
+    CREATE INDEX IF NOT EXISTS ix_sgs_name ON securitygroups (group_name);
+    CREATE INDEX IF NOT EXISTS ix_sgrules_account ON sgrules (account_id, region);
+    CREATE INDEX IF NOT EXISTS ix_sgrules_exposure
+        ON sgrules (direction, protocol, from_port, to_port);
+    CREATE INDEX IF NOT EXISTS ix_keypairs_account ON keypairs (account_id, region);
+    CREATE INDEX IF NOT EXISTS ix_keypairs_region ON keypairs (region);
+"""
+
+# resource type: (table, {query filter: sql predicate})
+RESOURCES = {
+    'subnets': ('subnets', {
+        'account': 'account_id = ?',
+        'region': 'region = ?',
+        'vpc': 'vpc_id = ?',
+        'az': 'az = ?',
+        'cidr': 'cidr = ?',
+        'ip_assign': 'ip_assign = ?'
+    }),
+    'securitygroups': ('securitygroups', {
+        'account': 'account_id = ?',
+        'region': 'region = ?',
+        'vpc': 'vpc_id = ?',
+        'name': 'group_name GLOB ?'
+    }),
+    'keypairs': ('keypairs', {
+        'account': 'account_id = ?',
+        'region': 'region = ?',
+        'name': 'key_name GLOB ?'
+    })
+}
+
+
+class InventoryStore():
+    """
+    Summary.
+
+        Indexed SQLite store of account profile data
+
+    Args:
+        :path (str): database location.  Default: ~/.config/ec2tools/inventory.db
+
+    """
+    def __init__(self, path=DB_PATH):
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.executescript(SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    def _load_region(self, account, rgn, region_profile):
+        """ Inserts the resources of a region profile """
+        if region_profile.get('Status') == TIMED_OUT:
+            return False
+        self.conn.execute('INSERT OR REPLACE INTO regions VALUES (?, ?)', (account, rgn))
+        self.conn.executemany(
+            'INSERT INTO subnets VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+            (
+                (k, account, rgn, v['VpcId'], v['AvailabilityZone'], v['CidrBlock'],
+                 v['State'], v['IpAddresses'])
+                for row in region_profile.get('Subnets', []) for k, v in row.items()
+            )
+        )
+        self.conn.executemany(
+            'INSERT INTO securitygroups VALUES (?, ?, ?, ?, ?, ?)',
+            (
+                (k, account, rgn, v['VpcId'], v['GroupName'], v['Description'])
+                for row in region_profile.get('SecurityGroups', []) for k, v in row.items()
+            )
+        )
+        self.conn.executemany(
+            'INSERT INTO keypairs VALUES (?, ?, ?)',
+            ((x, account, rgn) for x in region_profile.get('KeyPairs', []))
+        )
+        self.conn.executemany(
+            'INSERT INTO sgrules VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+            region_rules(account, rgn, region_profile)
+        )
+        return True
+
+    def load(self, container, source=None):
+        """
+        Summary.
+
+            Replaces all data held for an account with the content of an
+            account profile.  Regions are inserted as they are read, so
+            an account profile streamed from disk is never held whole.
+
+        Args:
+            :container: account profile (.profile schema), as a dict or
+                as an iterable of key, value pairs (jsonstream.iter_items)
+            :source (str): path of the profile file loaded, if any
+
+        Returns:
+            number of regions loaded, TYPE: int
+
+        """
+        items = container.items() if isinstance(container, dict) else container
+        header, pending, count = {}, [], 0
+
+        with self.conn:
+            for key, value in items:
+                if key in ACCOUNT_KEYS:
+                    header[key] = value
+                    if key == 'AccountId':
+                        for table in TABLES:
+                            self.conn.execute(
+                                'DELETE FROM {} WHERE account_id = ?'.format(table), (value,)
+                            )
+                elif isinstance(value, dict):
+                    # regions are held only while the account is not yet known
+                    pending.append((key, value))
+
+                if 'AccountId' in header:
+                    for rgn, region_profile in pending:
+                        count += self._load_region(header['AccountId'], rgn, region_profile)
+                    pending = []
+
+            if 'AccountId' not in header:
+                raise KeyError('AccountId')
+            self.conn.execute(
+                'INSERT OR REPLACE INTO accounts VALUES (?, ?, ?)',
+                (header['AccountId'], header.get('AccountAlias'), source)
+            )
+        return count
+
+    def load_file(self, path):
+        """ Loads a single .profile file, one region at a time; returns number of regions loaded """
+        with open(path) as f1:
+            return self.load(iter_items(f1), source=path)
+
+    def rules(self, port=None, protocols=None, direction=None, cidr=None):
+        """
+        Summary.
+
+            Yields the securitygroup rules held in the store, optionally
+            only those of direction and protocols whose port range holds
+            port, or whose cidr equals cidr
+
+        """
+        clauses, values = [], []
+
+        if direction is not None:
+            clauses.append('direction = ?')
+            values.append(direction)
+        if protocols:
+            clauses.append('protocol IN ({})'.format(', '.join('?' * len(protocols))))
+            values.extend(sorted(protocols))
+        if port is not None:
+            clauses.append('from_port <= ? AND to_port >= ?')
+            values.extend((port, port))
+        if cidr is not None:
+            clauses.append('cidr = ?')
+            values.append(cidr)
+
+        sql = 'SELECT * FROM sgrules'
+        if clauses:
+            sql += ' WHERE ' + ' AND '.join(clauses)
+        for row in self.conn.execute(sql, values):
+            yield Rule(*row)
+
+    def query(self, resource, **filters):
+        """
+        Summary.
+
+            Returns resources matching all filters given
+
+        Args:
+            :resource (str): subnets | securitygroups | keypairs
+            :filters: filter name, value pairs; names are keys of RESOURCES.
+                Filters with value None are ignored
+
+        Returns:
+            matching rows, TYPE: list of dict
+
+        """
+        table, predicates = RESOURCES[resource]
+        clauses, values = [], []
+
+        for k, v in filters.items():
+            if v is None:
+                continue
+            clauses.append(predicates[k])
+            values.append(v)
+
+        sql = 'SELECT * FROM {}'.format(table)
+        if clauses:
+            sql += ' WHERE ' + ' AND '.join(clauses)
+        return [dict(x) for x in self.conn.execute(sql, values)]
+
+    def records(self, resource, account, region):
+        """
+        Summary.
+
+            Resources of an account region in .profile schema; the format
+            returned by the profile_* functions
+
+        Returns:
+            records (list, empty for a region without resources) or
+            None if the region of the account has not been loaded
+
+        """
+        loaded = self.conn.execute(
+            'SELECT 1 FROM regions WHERE account_id = ? AND region = ?', (account, region)
+        ).fetchone()
+        if loaded is None:
+            return None
+        rows = self.query(resource, account=account, region=region)
+        if resource == 'subnets':
+            return [
+                {
+                    x['subnet_id']: {
+                        'AvailabilityZone': x['az'],
+                        'CidrBlock': x['cidr'],
+                        'State': x['state'],
+                        'IpAddresses': x['ip_assign'],
+                        'VpcId': x['vpc_id']
+                    }
+                } for x in rows
+            ]
+        elif resource == 'securitygroups':
+            return [
+                {
+                    x['group_id']: {
+                        'Description': x['description'],
+                        'GroupName': x['group_name'],
+                        'VpcId': x['vpc_id']
+                    }
+                } for x in rows
+            ]
+        return [x['key_name'] for x in rows]
+
+
+def profile_files(path=FILE_PATH):
+    """ Returns paths of all account profile files in path """
+    return sorted(glob.glob(os.path.join(path, '*.profile')))
+
+
+def reindex(store, paths=None):
+    """
+    Summary.
+
+        Loads account profile files into the inventory store
+
+    Returns:
+        number of profile files loaded, TYPE: int
+
+    """
+    count = 0
+    for path in (paths or profile_files()):
+        try:
+            store.load_file(path)
+            count += 1
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(
+                'Unable to load profile %s into inventory: %s' % (path, e))
+    return count
+
+
+def update_inventory(paths):
+    """ Loads newly written account profile files into the inventory store """
+    store = InventoryStore()
+    try:
+        return reindex(store, paths)
+    finally:
+        store.close()
+
+
+def exposure(store, port, cidr=None, protocol='tcp', direction='ingress', exact=False):
+    """
+    Summary.
+
+        Securitygroup rules across all accounts and regions in the store
+        which permit traffic on port from (or to) cidr.  Rules are
+        selected by direction, protocol, and port through the sgrules
+        exposure index; cidr containment is checked on those rules only.
+        Rules whose source is a securitygroup or prefix list are listed
+        when no cidr is given; their addresses are not resolved.
+
+    Returns:
+        matching rules, TYPE: list of dict
+
+    """
+    if port is None:
+        stdout_message('A --port value is required for exposure queries', prefix='WARN')
+        return []
+    protocols = {normalize_protocol(protocol), '-1'}
+    rules = store.rules(port, protocols, direction, cidr if exact else None)
+    if cidr is not None and not exact:
+        rules = (x for x in rules if covers(x.cidr, cidr))
+    matches = sorted(rules, key=lambda x: (x.account or '', x.region, x.group_id))
+    return [x._asdict() for x in matches]
+
+
+def display_rows(rows):
+    """ Displays query results as a table (tty) or json (redirected) """
+    if not sys.stdout.isatty():
+        print(json.dumps(rows, indent=4))
+        return True
+    if not rows:
+        stdout_message('No matching resources found in inventory')
+        return True
+
+    x = VeryPrettyTable(border=True, header=True, padding_width=2)
+    x.field_names = list(rows[0].keys())
+    x.align = 'l'
+    for row in rows:
+        x.add_row([row[k] for k in x.field_names])
+    print(x.get_string())
+    stdout_message('{} resources found'.format(len(rows)))
+    return True
+
+
+def query_options(argv):
+    parser = argparse.ArgumentParser(prog='profileaccount query')
+    parser.add_argument('resource', nargs='?', choices=list(RESOURCES) + ['exposure'], default=None)
+    parser.add_argument('--account', dest='account', default=None, help='AWS AccountId')
+    parser.add_argument('--region', dest='region', default=None)
+    parser.add_argument('--vpc', dest='vpc', default=None, help='VpcId')
+    parser.add_argument('--az', dest='az', default=None, help='Availability Zone')
+    parser.add_argument(
+        '--cidr', dest='cidr', default=None, help='subnet CidrBlock | exposure source cidr'
+    )
+    parser.add_argument('--name', dest='name', default=None, help='name glob pattern (web-*)')
+    parser.add_argument('--public', dest='ip_assign', action='store_const', const='Public')
+    parser.add_argument('--private', dest='ip_assign', action='store_const', const='Private')
+    parser.add_argument('--port', dest='port', type=int, default=None, help='exposure port number')
+    parser.add_argument(
+        '--protocol', dest='protocol', default='tcp', help='exposure protocol (tcp)'
+    )
+    parser.add_argument(
+        '--egress', dest='direction', action='store_const', const='egress', default='ingress'
+    )
+    parser.add_argument(
+        '--exact', dest='exact', action='store_true', help='exposure cidr must match exactly'
+    )
+    parser.add_argument(
+        '--reindex', dest='reindex', action='store_true', help='reload all .profile files'
+    )
+    parser.add_argument('--db', dest='db', default=DB_PATH, help='inventory database path')
+    return parser.parse_args(argv)
+
+
+def query_cli(argv):
+    """
+    Summary.
+
+        profileaccount query subcommand
+
+    Returns:
+        Success | Failure, TYPE: bool
+
+    """
+    args = query_options(argv)
+    store = InventoryStore(args.db)
+
+    try:
+        if args.reindex:
+            stdout_message('Loaded {} account profiles into {}'.format(reindex(store), args.db))
+
+        if args.resource == 'exposure':
+            return display_rows(
+                exposure(store, args.port, args.cidr, args.protocol, args.direction, args.exact)
+            )
+
+        elif args.resource:
+            _, predicates = RESOURCES[args.resource]
+            filters = {k: getattr(args, k) for k in predicates}
+            return display_rows(store.query(args.resource, **filters))
+    finally:
+        store.close()
+    return args.reindex
+
@@ -0,0 +1,195 @@
+"""
+Summary.
+
+    Streaming json output.  Writes a json object to a file object one
+    top-level key at a time so that large documents (account profiles)
+    never need to be held in memory or serialized as a whole.  Files are
+    written through atomic_file so that a profile interrupted part way
+    leaves the previous file intact.
+
+"""
+
+import os
+import sys
+import json
+import shutil
+from contextlib import contextmanager
+from pygments import highlight, lexers, formatters
+
+
+# largest document (bytes) colorized when displayed to a terminal
+COLOR_MAX_BYTES = 1024 * 1024
+
+# characters read at a time by iter_items
+READ_SIZE = 64 * 1024
+WHITESPACE = ' \t\n\r'
+
+
+class JSONStreamWriter():
+    """
+    Summary.
+
+        Incrementally writes a json object to a file object
+
+    >>> import io
+    >>> f = io.StringIO()
+    >>> w = JSONStreamWriter(f, indent=None)
+    >>> w.write('a', [1, 2])
+    >>> w.close()
+    >>> json.loads(f.getvalue())
+    {'a': [1, 2]}
+    """
+    def __init__(self, fileobj, indent=4):
+        self.fileobj = fileobj
+        self.indent = indent
+        self.padding = '\n' + ' ' * (indent or 0) if indent is not None else ''
+        self.encoder = json.JSONEncoder(indent=indent, sort_keys=True, default=str)
+        self.count = 0
+        self.fileobj.write('{')
+
+    def write(self, key, value):
+        """ Writes one key: value pair of the json object """
+        if self.count:
+            self.fileobj.write(',' + (self.padding or ' '))
+        else:
+            self.fileobj.write(self.padding)
+        self.fileobj.write(json.dumps(key) + ': ')
+        for chunk in self.encoder.iterencode(value):
+            self.fileobj.write(chunk.replace('\n', self.padding) if self.padding else chunk)
+        self.count += 1
+
+    def close(self):
+        """ Terminates the json object """
+        self.fileobj.write(('\n' if self.padding and self.count else '') + '}\n')
+        self.fileobj.flush()
+
+
+def iter_items(fileobj, read_size=READ_SIZE):
+    """
+    Summary.
+
+        Yields the key, value pairs of the json object in a file object
+        one member at a time; only the member being decoded is held in
+        memory.  The counterpart of JSONStreamWriter.
+
+    >>> import io
+    >>> list(iter_items(io.StringIO('{"a": [1, 2],\\n "b": {"c": null}, "d": 10}'), read_size=3))
+    [('a', [1, 2]), ('b', {'c': None}), ('d', 10)]
+    """
+    decoder = json.JSONDecoder()
+    buf, pos, eof = '', 0, False
+
+    def more():
+        """ Drops content decoded and reads more; reads grow with the content held """
+        nonlocal buf, pos, eof
+        chunk = fileobj.read(max(read_size, len(buf) - pos))
+        buf, pos, eof = buf[pos:] + chunk, 0, not chunk
+
+    def token():
+        """ Next non-whitespace character, left unconsumed """
+        nonlocal pos
+        while True:
+            while pos < len(buf) and buf[pos] in WHITESPACE:
+                pos += 1
+            if pos < len(buf):
+                return buf[pos]
+            if eof:
+                raise ValueError('Unexpected end of json document')
+            more()
+
+    def value():
+        """ Decodes the value at pos; a value ending the content read may continue """
+        nonlocal pos
+        while True:
+            try:
+                obj, end = decoder.raw_decode(buf, pos)
+                if end < len(buf) or eof:
+                    pos = end
+                    return obj
+            except ValueError:
+                if eof:
+                    raise
+            more()
+
+    def expect(chars):
+        nonlocal pos
+        char = token()
+        if char not in chars:
+            raise ValueError('Expecting one of {} in json object, found {!r}'.format(chars, char))
+        pos += 1
+        return char
+
+    expect('{')
+    if token() == '}':
+        return
+    while True:
+        token()
+        key = value()
+        expect(':')
+        token()
+        yield key, value()
+        if expect(',}') == '}':
+            return
+
+
+@contextmanager
+def atomic_file(path):
+    """
+    Summary.
+
+        Writable file object of a temporary file in the directory of
+        path, moved over path when the block completes.  On error the
+        temporary file is removed and path is left unchanged.
+
+    >>> import tempfile
+    >>> path = os.path.join(tempfile.mkdtemp(), 'a.profile')
+    >>> with atomic_file(path) as f1:
+    ...     w = JSONStreamWriter(f1, indent=None)
+    ...     w.write('a', 1)
+    ...     w.close()
+    >>> try:
+    ...     with atomic_file(path) as f1:
+    ...         _ = f1.write('{"a": ')
+    ...         raise KeyboardInterrupt
+    ... except KeyboardInterrupt:
+    ...     pass
+    >>> json.loads(open(path).read()), os.listdir(os.path.dirname(path))
+    ({'a': 1}, ['a.profile'])
+    """
+    tmp_path = '{}.{}.tmp'.format(path, os.getpid())
+    f1 = open(tmp_path, 'w')
+    try:
+        yield f1
+        f1.close()
+        os.replace(tmp_path, path)
+    finally:
+        f1.close()
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def display(fileobj, max_bytes=COLOR_MAX_BYTES):
+    """
+    Summary.
+
+        Copies json content of a file object to stdout.  Content is
+        colorized only when stdout is a terminal and the content is
+        small enough to highlight quickly; otherwise it is streamed as-is.
+
+    Args:
+        :fileobj (file): readable file object containing json text
+        :max_bytes (int): largest content size colorized
+
+    Returns:
+        Success | Failure, TYPE: bool
+
+    """
+    size = fileobj.seek(0, 2)
+    fileobj.seek(0)
+
+    if sys.stdout.isatty() and size <= max_bytes:
+        print(highlight(fileobj.read(), lexers.JsonLexer(), formatters.TerminalFormatter()).strip())
+    else:
+        shutil.copyfileobj(fileobj, sys.stdout)
+    sys.stdout.flush()
+    return True
@@ -4,7 +4,6 @@
 import sys
 import json
 import argparse
-import inspect
 import datetime
 import pdb
 import subprocess
@@ -13,11 +12,18 @@
 from veryprettytable import VeryPrettyTable
 from pyaws.ec2 import default_region
 from pyaws.utils import stdout_message, export_json_object, userchoice_mapping
-from pyaws.session import authenticated, boto3_session, parse_profiles
+from pyaws.session import parse_profiles
 from pyaws import Colors
 from ec2tools.statics import local_config
 from ec2tools import about, current_ami, logd, __version__
-from ec2tools.environment import profile_securitygroups, profile_keypairs
+from ec2tools.discovery import profile_securitygroups, profile_keypairs
+from ec2tools.paginate import paginate
+from ec2tools.session import authenticated, authentication_failures, boto3_session, span
+from ec2tools import profiling, stats, timings
+from ec2tools.inventory import InventoryStore
+from ec2tools.models import Subnet, SecurityGroup, KeyPair, InstanceProfile, load, index
+from ec2tools.catalog import validate_size
+from ec2tools.pricing import estimate, HOURS_PER_MONTH
 from ec2tools.user_selection import choose_resource
 from ec2tools.userdata import userdata_lookup
 
@@ -41,6 +47,7 @@
 
 FILE_PATH = local_config['CONFIG']['CONFIG_DIR']
 GENERIC_USERDATA = local_config['CONFIG']['USERDATA_DIR'] + '/userdata.sh'
+PRICE_INDEX = os.path.join(FILE_PATH, 'prices.idx')
 
 image, subnet, securitygroup, keypair = None, None, None, None
 launch_prereqs = (image, subnet, securitygroup, keypair)
@@ -55,7 +62,7 @@ def help_menu():
         PARAM_ACCENT + '  [ --profile' + Colors.RESET + ' <value> ]'
         )
 
-    menu = """
+    menu = ("""
                         """ + bd + PACKAGE + rst + """ help contents
 
   """ + bd + """DESCRIPTION""" + rst + """
@@ -73,6 +80,9 @@ def help_menu():
                         [-p, --profile  <value>  ]
                         [-q, --quantity  <value> ]
                         [-s, --instance-size <value> ]
+                        [-l, --inventory ]
+                        [-T, --timings   ]
+                        [-S, --stats     ]
                         [-d, --debug     ]
                         [-h, --help      ]
 
@@ -98,16 +108,33 @@ def help_menu():
                 - """ + AMI + """windows2016""" + rst + """   :  Microsoft Windows Server 2016
 
       """ + bd + """-s""" + rst + """, """ + bd + """--instance-size""" + rst + """ (string):  Defines the EC2 instance size type at
-          launch time. Default: t3.micro unless otherwise specified.
+          launch time. Default: t3.micro unless otherwise specified.  Sizes
+          are validated against the local instance type catalog; the
+          nearest valid sizes are suggested for sizes not offered.
 
       """ + bd + """-p""" + rst + """, """ + bd + """--profile""" + rst + """ (string): IAM username or role corresponding to an STS
           (Secure Token Service) profile from local awscli configuration.
 
       """ + bd + """-q""" + rst + """, """ + bd + """--quantity""" + rst + """:  Quantity of identical EC2 servers created at launch
 
-      """ + bd + """-r""" + rst + """, """ + bd + """--region""" + rst + """ (string): AWS region code designating a specific launch
+      """ + bd + """-r""" + rst + """, """ + bd + """--region""" + rst +
+      """ (string): AWS region code designating a specific launch
           region.
 
+      """ + bd + """-l""" + rst + """, """ + bd + """--inventory""" + rst +
+      """: Select subnets, security groups, and keypairs
+          from the local inventory of profiled accounts (profileaccount)
+          instead of querying AWS.
+
+      """ + bd + """-T""" + rst + """, """ + bd + """--timings""" + rst +
+      """: Print a summary of AWS api call latency
+          (count, total, p50, p95 per operation and region) and of time
+          spent in discovery, prompts, and launch when the command exits.
+
+      """ + bd + """-S""" + rst + """, """ + bd + """--stats""" + rst +
+      """: Print AWS api call, error, retry, throttle,
+          and bytes received counters of the command as json at exit.
+
       """ + bd + """-d""" + rst + """, """ + bd + """--debug""" + rst + """: Debug mode, verbose output.
 
       """ + bd + """-u""" + rst + """, """ + bd + """--userdata""" + rst + """: Path to userdata file on local filesystem. Example:
@@ -119,7 +146,7 @@ def help_menu():
       """ + bd + """-V""" + rst + """, """ + bd + """--version""" + rst + """: Display program version information
 
       """ + bd + """-h""" + rst + """, """ + bd + """--help""" + rst + """: Print this menu
-    """
+    """)
     print(menu)
     return True
 
@@ -169,16 +196,49 @@ def source_instanceprofiles(profile):
             }
     """
     client = boto3_session(service='iam', profile=profile)
-    r = client.list_instance_profiles()['InstanceProfiles']
     return [
             {
                 'InstanceProfileName': x['InstanceProfileName'],
                 'Arn': x['Arn'],
                 'CreateDate': x['CreateDate'].strftime('%Y-%m-%dT%H:%M:%S')
-            } for x in r
+            } for x in paginate(client, 'list_instance_profiles')
         ]
 
 
+def local_inventory(resource, account, region, retrieve):
+    """
+    Summary.
+
+        Resources of an account region from the local inventory store
+        (profileaccount).  When no account is given or the region has
+        not been profiled, the resources are retrieved from AWS instead.
+        A profiled region without resources returns an empty list.
+
+    Args:
+        :retrieve (callable): returns the resources from AWS
+
+    Returns:
+        records in .profile schema, TYPE: list
+
+    """
+    if account is None:
+        return retrieve()
+
+    store = InventoryStore()
+    try:
+        records = store.records(resource, account, region)
+    finally:
+        store.close()
+
+    if records is None:
+        stdout_message(
+            message=f'No {resource} for {region} in local inventory. Retrieving from AWS',
+            prefix='WARN'
+        )
+        return retrieve()
+    return records
+
+
 def ip_lookup(profile, region, debug):
     """
     Summary.
@@ -207,28 +267,29 @@ def ip_lookup(profile, region, debug):
     x.align[bd + 'RoleArn' + frame] = 'l'
     x.align[bd + 'CreateDate' + frame] = 'c'
 
-    roles = source_instanceprofiles(parse_profiles(profile))
+    with span('discovery', resource='instanceprofiles', region=region):
+        roles = load(InstanceProfile, source_instanceprofiles(parse_profiles(profile)))
 
     # populate table
     lookup = {}
-    for index, iprofile in enumerate(roles):
+    for i, iprofile in enumerate(roles):
 
-            lookup[index] = iprofile['Arn']
+            lookup[i] = iprofile.arn
 
             x.add_row(
                 [
-                    rst + str(index) + '.' + frame,
-                    rst + iprofile['InstanceProfileName'] + frame,
-                    rst + iprofile['Arn'][:field_max_width] + frame,
-                    rst + iprofile['CreateDate'] + frame
+                    rst + str(i) + '.' + frame,
+                    rst + iprofile.instance_profile_name + frame,
+                    rst + iprofile.arn[:field_max_width] + frame,
+                    rst + iprofile.create_date + frame
                 ]
             )
 
     # add default choice (None)
-    lookup[index + 1] = None
+    lookup[i + 1] = None
     x.add_row(
         [
-            rst + str(index + 1) + '.' + frame,
+            rst + str(i + 1) + '.' + frame,
             rst + 'Default' + frame,
             None,
             rst + now.strftime('%Y-%m-%dT%H:%M:%S') + frame
@@ -237,7 +298,7 @@ def ip_lookup(profile, region, debug):
     # Table showing selections
     print(f'\n\tInstance Profile Roles (global directory)\n'.expandtabs(26))
     display_table(x, tabspaces=4)
-    return choose_resource(lookup, selector='numbers', default=(index + 1))
+    return choose_resource(lookup, selector='numbers', default=(i + 1))
 
 
 def is_tty():
@@ -255,10 +316,11 @@ def is_tty():
 
 def get_account_identifier(profile, returnAlias=True):
     """ Returns account alias """
-    client = boto3_session(service='iam', profile=profile)
-    alias = client.list_account_aliases()['AccountAliases'][0]
-    if alias and returnAlias:
-        return alias
+    if returnAlias:
+        client = boto3_session(service='iam', profile=profile)
+        aliases = client.list_account_aliases()['AccountAliases']
+        if aliases:
+            return aliases[0]
     client = boto3_session(service='sts', profile=profile)
     return client.get_caller_identity()['Account']
 
@@ -268,7 +330,7 @@ def get_regions():
     return [x['RegionName'] for x in client.describe_regions()['Regions'] if 'cn' not in x['RegionName']]
 
 
-def keypair_lookup(profile, region, debug):
+def keypair_lookup(profile, region, debug, account=None):
     """
     Summary.
 
@@ -277,6 +339,8 @@ def keypair_lookup(profile, region, debug):
     Args:
         :profile (str): profile_name from local awscli configuration
         :region (str): AWS region code
+        :account (str): AWS AccountId; when given, keypairs are sourced
+            from the local inventory store
 
     Returns:
         keypair name chosen by user
@@ -296,18 +360,25 @@ def keypair_lookup(profile, region, debug):
     x.align[bd + '#' + frame] = 'c'
     x.align[bd + 'Keypair' + frame] = 'l'
 
-    keypairs = profile_keypairs(parse_profiles(profile), region)[region]
+    with span('discovery', resource='keypairs', region=region):
+        keypairs = load(
+            KeyPair,
+            local_inventory(
+                'keypairs', account, region,
+                lambda: profile_keypairs(parse_profiles(profile), region)[region]
+            )
+        )
 
     # populate table
     lookup = {}
-    for index, keypair in enumerate(keypairs):
+    for i, keypair in enumerate(keypairs):
 
-            lookup[index] = keypair
+            lookup[i] = keypair.key_name
 
             x.add_row(
                 [
-                    rst + userchoice_mapping(index) + '.' + frame,
-                    rst + keypair + frame
+                    rst + userchoice_mapping(i) + '.' + frame,
+                    rst + keypair.key_name + frame
                 ]
             )
 
@@ -317,6 +388,17 @@ def keypair_lookup(profile, region, debug):
     return choose_resource(lookup)
 
 
+def quantity(value):
+    """ argparse type of --quantity: number of instances, 1 or more """
+    try:
+        count = int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError('invalid quantity: {}'.format(value))
+    if count < 1:
+        raise argparse.ArgumentTypeError('quantity must be 1 or more: {}'.format(value))
+    return count
+
+
 def options(parser):
     """
     Summary.
@@ -330,11 +412,23 @@ def options(parser):
     parser.add_argument("-p", "--profile", nargs='?', default="default",
                               required=False, help="type (default: %(default)s)")
     parser.add_argument("-d", "--debug", dest='debug', action='store_true', default=False, required=False)
+    parser.add_argument(
+        "-l", "--inventory", dest='inventory', action='store_true', default=False, required=False
+    )
     parser.add_argument("-i", "--image", dest='imagetype', type=str, choices=current_ami.VALID_AMI_TYPES, required=False)
-    parser.add_argument("-q", "--quantity", dest='quantity', nargs='?', default=1, required=False)
+    parser.add_argument(
+        "-q", "--quantity", dest='quantity', type=quantity, nargs='?', const=1, default=1,
+        required=False
+    )
     parser.add_argument("-r", "--region", dest='regioncode', nargs='?', default=None, required=False)
     parser.add_argument("-s", "--instance-size", dest='instance_size', nargs='?', default='t3.micro', required=False)
     parser.add_argument("-t", "--tags", dest='tags', action='store_true', default=False, required=False)
+    parser.add_argument(
+        "-T", "--timings", dest='timings', action='store_true', default=False, required=False
+    )
+    parser.add_argument(
+        "-S", "--stats", dest='stats', action='store_true', default=False, required=False
+    )
     parser.add_argument("-u", "--userdata", dest='userdata', action='store_true', default=False, required=False)
     parser.add_argument("-V", "--version", dest='version', action='store_true', required=False)
     parser.add_argument("-h", "--help", dest='help', action='store_true', required=False)
@@ -348,6 +442,7 @@ def get_contents(content):
     return None
 
 
+@span('discovery', resource='images')
 def get_imageid(profile, image, region, debug):
     if which('machineimage'):
         cmd = 'machineimage --profile {} --image {} --region {}'.format(profile, image, region)
@@ -372,7 +467,6 @@ def profile_subnets(profile, region):
 
     try:
         client = boto3_session('ec2', region=region, profile=profile)
-        r = client.describe_subnets()['Subnets']
         return [
                 {
                     x['SubnetId']: {
@@ -382,15 +476,15 @@ def profile_subnets(profile, region):
                             'IpAddresses': 'Public' if x['MapPublicIpOnLaunch'] else 'Private',
                             'VpcId': x['VpcId']
                         }
-                } for x in r
+                } for x in paginate(client, 'describe_subnets')
             ]
     except ClientError as e:
         logger.warning(
-            '{}: Unable to retrieve subnets for region {}: {}'.format(inspect.stack()[0][3], region, e)
+            'Unable to retrieve subnets for region {}: {}'.format(region, e)
             )
 
 
-def get_subnet(profile, region, debug):
+def get_subnet(profile, region, debug, account=None):
     """
     Summary.
 
@@ -399,9 +493,11 @@ def get_subnet(profile, region, debug):
     Args:
         :profile (str): profile_name from local awscli configuration
         :region (str): AWS region code
+        :account (str): AWS AccountId; when given, subnets are sourced
+            from the local inventory store
 
     Returns:
-        subnet id chosen by user
+        Subnet chosen by user
 
     """
     # setup table
@@ -418,32 +514,34 @@ def get_subnet(profile, region, debug):
         bd + 'VpcId' + frame
     ]
 
-    #subnets = get_contents(account_file)[region]['Subnets']
-    subnets = profile_subnets(profile, region)
+    with span('discovery', resource='subnets', region=region):
+        subnets = index(load(
+            Subnet,
+            local_inventory('subnets', account, region, lambda: profile_subnets(profile, region))
+        ))
 
     # populate table
     lookup = {}
-    for index, row in enumerate(subnets):
-        for k,v in row.items():
-
-            lookup[index] = k
-
-            x.add_row(
-                [
-                    rst + userchoice_mapping(index) + '.' + frame,
-                    rst + k + frame,
-                    rst + v['AvailabilityZone'] + frame,
-                    rst + v['CidrBlock'] + frame,
-                    rst + v['IpAddresses'] + frame,
-                    rst + v['State'] + frame,
-                    rst + v['VpcId'] + frame
-                ]
-            )
+    for i, subnet in enumerate(subnets.values()):
+
+        lookup[i] = subnet.subnet_id
+
+        x.add_row(
+            [
+                rst + userchoice_mapping(i) + '.' + frame,
+                rst + subnet.subnet_id + frame,
+                rst + subnet.availability_zone + frame,
+                rst + subnet.cidr_block + frame,
+                rst + subnet.ip_addresses + frame,
+                rst + subnet.state + frame,
+                rst + subnet.vpc_id + frame
+            ]
+        )
 
     # Table showing selections
     print(f'\n\tSubnets in region {bd + region + rst}\n'.expandtabs(30))
     display_table(x)
-    return choose_resource(lookup)
+    return subnets.get(choose_resource(lookup))
 
 
 def nametag(imagetype, date, default=True):
@@ -475,7 +573,17 @@ def package_version():
     sys.exit(exit_codes['EX_OK']['Code'])
 
 
-def parameters_approved(alias, region, subid, imageid, sg, kp, ip, size, ct):
+def cost_summary(region, size, ct, imagetype=None):
+    """ Formatted on-demand hourly and monthly cost of a launch request """
+    hourly, monthly = estimate(PRICE_INDEX, region, size, imagetype, ct)
+    if hourly is None:
+        return 'unavailable', 'unavailable'
+    return '${:,.4f}'.format(hourly), '${:,.2f} ({} hrs)'.format(monthly, HOURS_PER_MONTH)
+
+
+@span('approval')
+def parameters_approved(alias, region, subid, imageid, sg, kp, ip, size, ct, imagetype=None):
+    hourly, monthly = cost_summary(region, size, ct, imagetype)
     print('\tEC2 Instance Launch Summary:\n')
     print('\t' + bd + 'AWS Account' + rst + ': \t\t{}'.format(alias))
     print('\t' + bd + 'Instance Count' + rst + ': \t{}'.format(ct))
@@ -486,6 +594,8 @@ def parameters_approved(alias, region, subid, imageid, sg, kp, ip, size, ct):
     print('\t' + bd + 'Security GroupId' + rst + ': \t{}'.format(sg))
     print('\t' + bd + 'Keypair Name' + rst + ': \t\t{}'.format(kp))
     print('\t' + bd + 'Instance Profile' + rst + ': \t{}'.format(ip))
+    print('\t' + bd + 'Cost per Hour' + rst + ': \t\t{}'.format(hourly))
+    print('\t' + bd + 'Cost per Month' + rst + ': \t{}'.format(monthly))
 
     choice = input('\n\tCreate EC2 instance? [yes]: ')
 
@@ -500,7 +610,6 @@ def profile_securitygroups(profile, region):
 
     try:
         client = boto3_session('ec2', region=region, profile=profile)
-        r = client.describe_security_groups()['SecurityGroups']
         sgs.append([
                 {
                     x['GroupId']: {
@@ -508,11 +617,11 @@ def profile_securitygroups(profile, region):
                         'GroupName': x['GroupName'],
                         'VpcId': x['VpcId']
                     }
-                } for x in r
+                } for x in paginate(client, 'describe_security_groups')
             ])
     except ClientError as e:
         logger.warning(
-            '{}: Unable to retrieve securitygroups for region {}'.format(inspect.stack()[0][3], rgn)
+            'Unable to retrieve securitygroups for region {}'.format(region)
             )
     return sgs[0]
 
@@ -522,7 +631,7 @@ def read(fname):
     return open(os.path.join(basedir, fname)).read()
 
 
-def sg_lookup(profile, region, debug):
+def sg_lookup(profile, region, debug, account=None, vpc_id=None):
     """
     Summary.
 
@@ -531,6 +640,10 @@ def sg_lookup(profile, region, debug):
     Args:
         :profile (str): profile_name from local awscli configuration
         :region (str): AWS region code
+        :account (str): AWS AccountId; when given, securitygroups are
+            sourced from the local inventory store
+        :vpc_id (str): VpcId of the launch subnet; only its securitygroups
+            are offered when it has any
 
     Returns:
         securitygroup ID chosen by user
@@ -542,13 +655,23 @@ def sg_lookup(profile, region, debug):
 
     x = VeryPrettyTable(border=True, header=True, padding_width=padding)
 
-    sgs = profile_securitygroups(profile, region)
-    for index, row in enumerate(sgs):
-        for k,v in row.items():
-            if len(v['GroupName']) > max_gn:
-                max_gn = len(v['GroupName'])
-            if len(v['Description']) > max_desc:
-                max_desc = len(v['GroupName'])
+    with span('discovery', resource='securitygroups', region=region):
+        sgs = index(load(
+            SecurityGroup,
+            local_inventory(
+                'securitygroups', account, region, lambda: profile_securitygroups(profile, region)
+            )
+        ))
+
+    # instances launch only with securitygroups of the subnet's vpc
+    in_vpc = [x for x in sgs.values() if x.vpc_id == vpc_id]
+    sgs = index(in_vpc) if in_vpc else sgs
+
+    for sg in sgs.values():
+        if len(sg.group_name) > max_gn:
+            max_gn = len(sg.group_name)
+        if len(sg.description) > max_desc:
+            max_desc = len(sg.group_name)
 
     if debug:
         print('max_gn = {}'.format(max_gn))
@@ -577,20 +700,19 @@ def sg_lookup(profile, region, debug):
 
     # populate table
     lookup = {}
-    for index, row in enumerate(sgs):
-        for k,v in row.items():
+    for i, sg in enumerate(sgs.values()):
 
-            lookup[index] = k
+        lookup[i] = sg.group_id
 
-            x.add_row(
-                [
-                    rst + userchoice_mapping(index) + '.' + frame,
-                    rst + k + frame,
-                    rst + v['GroupName'][:field_max_width] + frame,
-                    rst + v['VpcId'] + frame,
-                    rst + v['Description'][:field_max_width] + frame
-                ]
-            )
+        x.add_row(
+            [
+                rst + userchoice_mapping(i) + '.' + frame,
+                rst + sg.group_id + frame,
+                rst + sg.group_name[:field_max_width] + frame,
+                rst + sg.vpc_id + frame,
+                rst + sg.description[:field_max_width] + frame
+            ]
+        )
 
     # Table showing selections
     print(f'\n\tSecurity Groups in region {bd + region + rst}\n'.expandtabs(30))
@@ -643,12 +765,12 @@ def persist_launchconfig(alias, pf, region, imageid, imagetype, subid, sgroup, k
 
     except OSError as e:
         logger.exception(
-            '%s: Problem persisting launch configuration file (%s) on local fs' %
-            (inspect.stack()[0][3], fname))
+            'Problem persisting launch configuration file (%s) on local fs' % fname)
         return False
     return True
 
 
+@span('launch')
 def run_ec2_instance(pf, region, imageid, imagetype, subid, sgroup,
                             kp, ip_arn, size, count, userdata_content, debug):
     """
@@ -741,8 +863,8 @@ def run_ec2_instance(pf, region, imageid, imagetype, subid, sgroup,
             sys.exit(exit_codes['EX_NOPERM']['Code'])
         else:
             logger.critical(
-                "%s: Unknown problem launching EC2 Instance(s) (Code: %s Message: %s)" %
-                (inspect.stack()[0][3], e.response['Error']['Code'], e.response['Error']['Message']))
+                "Unknown problem launching EC2 Instance(s) (Code: %s Message: %s)" %
+                (e.response['Error']['Code'], e.response['Error']['Message']))
             return []
     return [x['InstanceId'] for x in response['Instances']]
 
@@ -772,12 +894,13 @@ def terminate_script(id_list, profile):
         stdout_message('Created terminate script: {}'.format(os.getcwd() + '/' + fname))
     except OSError as e:
         logger.exception(
-            '%s: Problem creating terminate script (%s) on local fs' %
-            (inspect.stack()[0][3], fname))
+            'Problem creating terminate script (%s) on local fs' % fname)
         return False
     return True
 
 
+@profiling.profiled(PACKAGE)
+@authentication_failures
 def init_cli():
     """
     Initializes commandline script
@@ -791,6 +914,11 @@ def init_cli():
         stdout_message(str(e), 'ERROR')
         sys.exit(exit_codes['EX_OK']['Code'])
 
+    if args.timings:
+        timings.enable()
+
+    stats.enable(PACKAGE, dump=args.stats)
+
     if len(sys.argv) == 1:
         help_menu()
         sys.exit(exit_codes['EX_OK']['Code'])
@@ -817,14 +945,42 @@ def init_cli():
             stdout_message(f'Region code: {regioncode}', prefix='DEBUG')
             stdout_message(f'Profilename is: {args.profile}', prefix='DEBUG')
 
+        valid, suggestions = validate_size(args.instance_size, regioncode)
+        if not valid:
+            stdout_message(
+                f'{args.instance_size} is not a valid instance size in {regioncode}', prefix='WARN'
+            )
+            if suggestions:
+                stdout_message(f'Nearest instance sizes: {", ".join(suggestions)}')
+            sys.exit(exit_codes['E_BADARG']['Code'])
+        elif suggestions:
+            # size unknown to the local sizes.txt list; the EC2 api validates it at launch
+            stdout_message(
+                f'{args.instance_size} not found in local instance sizes (make build-sizes '
+                f'installs a current catalog). Nearest instance sizes: {", ".join(suggestions)}',
+                prefix='WARN'
+            )
+
         if authenticated(profile=parse_profiles(args.profile)):
 
             account_alias = get_account_identifier(parse_profiles(args.profile or 'default'))
             DEFAULT_OUTPUTFILE = account_alias + '.profile'
-            subnet = get_subnet(parse_profiles(args.profile), regioncode, args.debug)
+
+            # resource source: local inventory store (--inventory) or AWS
+            if args.inventory:
+                account = get_account_identifier(parse_profiles(args.profile), returnAlias=False)
+            else:
+                account = None
+
+            # discovery spans time the api lookups only; selection prompts are timed separately
+            chosen = get_subnet(parse_profiles(args.profile), regioncode, args.debug, account)
+            subnet = chosen.subnet_id if chosen else None
             image = get_imageid(parse_profiles(args.profile), args.imagetype, regioncode, args.debug)
-            securitygroup = sg_lookup(parse_profiles(args.profile), regioncode, args.debug)
-            keypair = keypair_lookup(parse_profiles(args.profile), regioncode, args.debug)
+            securitygroup = sg_lookup(
+                parse_profiles(args.profile), regioncode, args.debug, account,
+                vpc_id=chosen.vpc_id if chosen else None
+            )
+            keypair = keypair_lookup(parse_profiles(args.profile), regioncode, args.debug, account)
             role_arn = ip_lookup(parse_profiles(args.profile), regioncode, args.debug)
             qty = args.quantity
 
@@ -861,7 +1017,7 @@ def init_cli():
                 )
 
             elif parameters_approved(account_alias, regioncode, subnet, image, securitygroup,
-                                                keypair, role_arn, args.instance_size, qty):
+                                     keypair, role_arn, args.instance_size, qty, args.imagetype):
                 persist_launchconfig(
                         alias=account_alias,
                         pf=parse_profiles(args.profile),
@@ -2,8 +2,12 @@
 Project-level logging module
 
 """
-import inspect
+import os
+import json
+import queue
+import atexit
 import logging
+import datetime
 import logging.handlers
 
 from ec2tools.statics import local_config
@@ -11,6 +15,12 @@
 syslog = logging.getLogger()
 syslog.setLevel(logging.DEBUG)
 
+# QUEUE mode: most records written per listener wake-up
+BATCH_SIZE = 256
+
+# QUEUE mode: process-wide queue, listener thread, and caller handlers
+_queue_state = {'queue': None, 'listener': None, 'handlers': []}
+
 
 def mode_assignment(arg):
     """
@@ -30,84 +40,250 @@ def mode_assignment(arg):
         return None
 
 
-def getLogger(*args, **kwargs):
+class BatchQueueListener(logging.handlers.QueueListener):
     """
     Summary.
 
-        custom format logger
+        Queue listener which drains all records waiting in the queue (up to
+        batch_size) per wake-up and writes each batch to stream and file
+        sinks under a single lock acquisition and flush
 
-    Args:
-        mode (str):  The Logger module supprts the following log modes:
+    """
+    def __init__(self, queue, *handlers, batch_size=BATCH_SIZE):
+        super().__init__(queue, *handlers, respect_handler_level=True)
+        self.batch_size = batch_size
 
-            - log to console / stdout. Log_mode = 'stream'
-            - log to file
-            - log to system logger (syslog)
+    def _monitor(self):
+        while True:
+            batch = [self.dequeue(True)]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.dequeue(False))
+                except queue.Empty:
+                    break
+            records = [x for x in batch if x is not self._sentinel]
+            if records:
+                self.handle_batch(records)
+            for _ in batch:
+                self.queue.task_done()
+            if len(records) < len(batch):
+                break
+
+    def handle_batch(self, records):
+        for handler in self.handlers:
+            accepted = [x for x in records if x.levelno >= handler.level]
+            if not isinstance(handler, logging.StreamHandler):
+                for record in accepted:
+                    handler.handle(record)
+                continue
+            handler.acquire()
+            try:
+                for record in accepted:
+                    if handler.filter(record):
+                        handler.stream.write(handler.format(record) + handler.terminator)
+                handler.flush()
+            except Exception:
+                handler.handleError(accepted[-1])
+            finally:
+                handler.release()
 
-    Returns:
-        logger object | TYPE: logging
 
+class LocalQueueHandler(logging.handlers.QueueHandler):
     """
-    log_mode = local_config['LOGGING']['LOG_MODE']
+    Summary.
+
+        QueueHandler for a listener in the same process.  Records are
+        queued as-is apart from merging args into the message; formatting,
+        including tracebacks, is left to the listener thread.
+
+    """
+    def prepare(self, record):
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    Summary.
+
+        Formats each record as a single line json object.  Fields of a
+        telemetry event attached to the record (extra={'telemetry': {...}})
+        are merged into the object.
+
+    """
+    def format(self, record):
+        entry = {
+            'time': datetime.datetime.fromtimestamp(
+                        record.created, datetime.timezone.utc
+                    ).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'module': record.module,
+            'function': record.funcName,
+            'line': record.lineno,
+            'process': record.process,
+            'message': record.getMessage()
+        }
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        entry.update(getattr(record, 'telemetry', {}))
+        return json.dumps(entry, default=str)
+
+
+def json_mode():
+    """ True when records are written in the JSON format (LOG_MODE, or QUEUE_SINK of QUEUE) """
+    log_mode = mode_assignment(local_config['LOGGING']['LOG_MODE'])
+    if log_mode == 'QUEUE':
+        log_mode = mode_assignment(local_config['LOGGING'].get('QUEUE_SINK', 'FILE'))
+    return log_mode == 'JSON'
+
+
+def sink_handler(log_mode):
+    """
+    Summary.
+
+        Handler writing to the destination of a log mode
+
+    Args:
+        log_mode (str):  FILE | STREAM | SYSLOG | JSON
+
+    Returns:
+        logging.Handler
 
+    """
     # log format - file
-    file_format = '%(asctime)s - %(pathname)s - %(name)s - [%(levelname)s]: %(message)s'
+    file_format = (
+        '%(asctime)s - %(pathname)s - %(name)s - [%(levelname)s]: %(funcName)s: %(message)s'
+    )
 
     # log format - stream
-    stream_format = '%(pathname)s - %(name)s - [%(levelname)s]: %(message)s'
+    stream_format = '%(pathname)s - %(name)s - [%(levelname)s]: %(funcName)s: %(message)s'
 
     # log format - syslog
-    syslog_format = '- %(pathname)s - %(name)s - [%(levelname)s]: %(message)s'
+    syslog_format = '- %(pathname)s - %(name)s - [%(levelname)s]: %(funcName)s: %(message)s'
     # set facility for syslog:
     if local_config['LOGGING']['SYSLOG_FILE']:
         syslog_facility = 'local7'
     else:
         syslog_facility = 'user'
 
-
     # all formats
     asctime_format = "%Y-%m-%d %H:%M:%S"
 
+    # branch on output format, default to stream
+    if mode_assignment(log_mode) == 'FILE':
+        # file handler
+        handler = logging.FileHandler(local_config['LOGGING']['LOG_PATH'])
+        handler.setFormatter(logging.Formatter(file_format, asctime_format))
+
+    elif mode_assignment(log_mode) == 'STREAM':
+        # stream handlers
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter(stream_format))
+
+    elif mode_assignment(log_mode) == 'JSON':
+        # json lines file handler
+        handler = logging.FileHandler(local_config['LOGGING']['LOG_PATH'])
+        handler.setFormatter(JsonFormatter())
+
+    elif mode_assignment(log_mode) == 'SYSLOG':
+        handler = logging.handlers.SysLogHandler(address='/dev/log', facility=syslog_facility)
+        handler.setFormatter(logging.Formatter(syslog_format))
+
+    else:
+        syslog.warning(
+            '[WARNING]: log_mode value of (%s) unrecognized - not supported' % str(log_mode)
+            )
+        ex = Exception(
+            'Unsupported mode indicated by log_mode value: %s' % str(log_mode)
+            )
+        raise ex
+    return handler
+
+
+def _start_listener():
+    """ Starts the background listener of QUEUE mode (once per process) """
+    sink = local_config['LOGGING'].get('QUEUE_SINK', 'FILE')
+    _queue_state['queue'] = queue.Queue(-1)
+    _queue_state['listener'] = BatchQueueListener(_queue_state['queue'], sink_handler(sink))
+    _queue_state['listener'].start()
+    atexit.register(_stop_listener)
+
+
+def _stop_listener():
+    """ Drains remaining records and stops the listener """
+    if _queue_state['listener'] is not None and _queue_state['listener']._thread is not None:
+        _queue_state['listener'].stop()
+
+
+def shutdown():
+    """ Writes queued records (QUEUE mode) and flushes and closes every handler """
+    _stop_listener()
+    logging.shutdown()
+
+
+def _restart_in_child():
+    """
+    Forked children (profileaccount --profiles) inherit queue handlers but
+    not the listener thread; give them a new queue and listener
+    """
+    if _queue_state['listener'] is None:
+        return
+    _queue_state['listener']._thread = None
+    _start_listener()
+    for handler in _queue_state['handlers']:
+        handler.queue = _queue_state['queue']
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_restart_in_child)
+
+
+def queue_handler():
+    """ QueueHandler feeding the shared background listener """
+    if _queue_state['listener'] is None:
+        _start_listener()
+    handler = LocalQueueHandler(_queue_state['queue'])
+    _queue_state['handlers'].append(handler)
+    return handler
+
+
+def getLogger(*args, **kwargs):
+    """
+    Summary.
+
+        custom format logger
+
+    Args:
+        mode (str):  The Logger module supprts the following log modes:
+
+            - log to console / stdout. Log_mode = 'stream'
+            - log to file
+            - log to system logger (syslog)
+            - json: one json object per line written to file, including
+              telemetry events of AWS api calls and command phases
+            - queue: records are queued by the caller and written by a
+              background thread, in batches, to the QUEUE_SINK destination
+              (file, stream, syslog, or json).  Logging never blocks on I/O.
+
+    Returns:
+        logger object | TYPE: logging
+
+    """
+    log_mode = local_config['LOGGING']['LOG_MODE']
+
     # objects
     logger = logging.getLogger(*args, **kwargs)
     logger.propagate = False
 
-
     try:
         if not logger.handlers:
-            # branch on output format, default to stream
-            if mode_assignment(log_mode) == 'FILE':
-                # file handler
-                f_handler = logging.FileHandler(local_config['LOGGING']['LOG_PATH'])
-                f_formatter = logging.Formatter(file_format, asctime_format)
-                f_handler.setFormatter(f_formatter)
-                logger.addHandler(f_handler)
-                logger.setLevel(logging.DEBUG)
-
-            elif mode_assignment(log_mode) == 'STREAM':
-                # stream handlers
-                s_handler = logging.StreamHandler()
-                s_formatter = logging.Formatter(stream_format)
-                s_handler.setFormatter(s_formatter)
-                logger.addHandler(s_handler)
-                logger.setLevel(logging.DEBUG)
-
-            elif mode_assignment(log_mode) == 'SYSLOG':
-                sys_handler = logging.handlers.SysLogHandler(address='/dev/log', facility=syslog_facility)
-                sys_formatter = logging.Formatter(syslog_format)
-                sys_handler.setFormatter(sys_formatter)
-                logger.addHandler(sys_handler)
-                logger.setLevel(logging.DEBUG)
-
+            if mode_assignment(log_mode) == 'QUEUE':
+                logger.addHandler(queue_handler())
             else:
-                syslog.warning(
-                    '%s: [WARNING]: log_mode value of (%s) unrecognized - not supported' %
-                    (inspect.stack()[0][3], str(log_mode))
-                    )
-                ex = Exception(
-                    '%s: Unsupported mode indicated by log_mode value: %s' %
-                    (inspect.stack()[0][3], str(log_mode))
-                    )
-                raise ex
+                logger.addHandler(sink_handler(log_mode))
+            logger.setLevel(logging.DEBUG)
     except OSError as e:
         raise e
     return logger
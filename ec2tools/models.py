@@ -0,0 +1,164 @@
+"""
+Summary.
+
+    Compact resource models.  Records of account profiles are held as
+    __slots__ objects rather than nested single-key dicts, with low
+    cardinality strings (availability zones, vpc ids, states) interned.
+    Models convert to and from the .profile json schema unchanged.
+
+    >>> s = Subnet.from_profile({'subnet-1': {'AvailabilityZone': 'us-east-1a',
+    ...     'CidrBlock': '10.0.0.0/24', 'State': 'available',
+    ...     'IpAddresses': 'Private', 'VpcId': 'vpc-1'}})
+    >>> s.id, s.cidr_block
+    ('subnet-1', '10.0.0.0/24')
+    >>> s.to_profile()['subnet-1']['VpcId']
+    'vpc-1'
+    >>> index([s])['subnet-1'] is s
+    True
+
+"""
+
+import sys
+
+
+class Record():
+    """
+    Summary.
+
+        Base class of resource models.  Subclasses declare __slots__ (the
+        id slot first) and FIELDS, the json key of each slot in order.
+
+    Class Attributes:
+        :FIELDS (tuple): json key corresponding to each slot
+        :KEYED (bool): True when the .profile record is {id: {fields}},
+            False when the id is a field of a flat record
+        :OPTIONAL (frozenset): json keys omitted on export when None, for
+            compatibility with profiles written before the key existed
+        :INTERN (frozenset): slots whose string values are interned
+
+    """
+    __slots__ = ()
+    FIELDS = ()
+    KEYED = True
+    OPTIONAL = frozenset()
+    INTERN = frozenset()
+
+    def __init__(self, *args, **kwargs):
+        values = dict(zip(self.__slots__, args), **kwargs)
+        for name in self.__slots__:
+            value = values.get(name)
+            if name in self.INTERN and isinstance(value, str):
+                value = sys.intern(value)
+            setattr(self, name, value)
+
+    def __repr__(self):
+        return '{}({!r})'.format(type(self).__name__, self.id)
+
+    def __eq__(self, other):
+        return type(self) is type(other) and self.astuple() == other.astuple()
+
+    def __hash__(self):
+        return hash((type(self).__name__, self.id))
+
+    @property
+    def id(self):
+        """ Resource identifier (first slot) """
+        return getattr(self, self.__slots__[0])
+
+    def astuple(self):
+        return tuple(getattr(self, x) for x in self.__slots__)
+
+    @classmethod
+    def from_dict(cls, fields, id=None):
+        """ Model from a flat dict of json keys """
+        values = [fields.get(k) for k in cls.FIELDS]
+        if id is not None:
+            values[0] = id
+        return cls(*values)
+
+    @classmethod
+    def from_profile(cls, record):
+        """ Model from a record of the .profile schema """
+        if cls.KEYED:
+            (rid, fields), = record.items()
+            return cls.from_dict(fields, rid)
+        return cls.from_dict(record)
+
+    def to_dict(self):
+        """ Flat dict of json keys, omitting unset OPTIONAL keys """
+        return {
+            k: getattr(self, name) for name, k in zip(self.__slots__, self.FIELDS)
+            if not (k in self.OPTIONAL and getattr(self, name) is None)
+        }
+
+    def to_profile(self):
+        """ Record in .profile schema """
+        fields = self.to_dict()
+        if self.KEYED:
+            return {fields.pop(self.FIELDS[0]): fields}
+        return fields
+
+
+class Subnet(Record):
+    __slots__ = (
+        'subnet_id', 'availability_zone', 'cidr_block', 'state', 'ip_addresses', 'vpc_id',
+        'available_ips'
+    )
+    FIELDS = (
+        'SubnetId', 'AvailabilityZone', 'CidrBlock', 'State', 'IpAddresses', 'VpcId',
+        'AvailableIpAddressCount'
+    )
+    OPTIONAL = frozenset(['AvailableIpAddressCount'])
+    INTERN = frozenset(['availability_zone', 'state', 'ip_addresses', 'vpc_id'])
+
+
+class SecurityGroup(Record):
+    __slots__ = ('group_id', 'group_name', 'description', 'vpc_id', 'ingress_rules', 'egress_rules')
+    FIELDS = ('GroupId', 'GroupName', 'Description', 'VpcId', 'IngressRules', 'EgressRules')
+    OPTIONAL = frozenset(['IngressRules', 'EgressRules'])
+    INTERN = frozenset(['vpc_id'])
+
+
+class KeyPair(Record):
+    """ Keypairs are plain names in the .profile schema """
+    __slots__ = ('key_name',)
+    FIELDS = ('KeyName',)
+    KEYED = False
+
+    @classmethod
+    def from_profile(cls, record):
+        return cls(record)
+
+    def to_profile(self):
+        return self.key_name
+
+
+class InstanceProfile(Record):
+    __slots__ = ('arn', 'instance_profile_name', 'create_date')
+    FIELDS = ('Arn', 'InstanceProfileName', 'CreateDate')
+    KEYED = False
+
+
+class Image(Record):
+    """ Machine image, from a describe_images record """
+    __slots__ = (
+        'image_id', 'name', 'description', 'creation_date', 'architecture',
+        'virtualization_type', 'root_device_type', 'owner_id'
+    )
+    FIELDS = (
+        'ImageId', 'Name', 'Description', 'CreationDate', 'Architecture',
+        'VirtualizationType', 'RootDeviceType', 'OwnerId'
+    )
+    KEYED = False
+    INTERN = frozenset(['architecture', 'virtualization_type', 'root_device_type', 'owner_id'])
+
+
+def load(model, records):
+    """ Models from a list of .profile records; None yields an empty list """
+    return [model.from_profile(x) for x in (records or [])]
+
+
+def index(items):
+    """ Id-keyed index of models, in original order """
+    return {x.id: x for x in items}
+
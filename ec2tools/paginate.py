@@ -0,0 +1,66 @@
+"""
+Summary.
+
+    Paginator layer for describe_* and list_* API calls.  Yields
+    records lazily, one page at a time, so that consumers iterate
+    complete result sets in bounded memory.
+
+"""
+
+from ec2tools import logd, __version__
+
+
+logger = logd.getLogger(__version__)
+
+
+# operation: key in the response containing the records
+RESULT_KEYS = {
+    'describe_images': 'Images',
+    'describe_key_pairs': 'KeyPairs',
+    'describe_security_groups': 'SecurityGroups',
+    'describe_subnets': 'Subnets',
+    'describe_vpcs': 'Vpcs',
+    'list_instance_profiles': 'InstanceProfiles'
+}
+
+# operation: server-side page size (MaxResults | MaxItems); the
+# largest value each API accepts, minimising round trips
+PAGE_SIZES = {
+    'describe_images': 1000,
+    'describe_security_groups': 1000,
+    'describe_subnets': 1000,
+    'describe_vpcs': 1000,
+    'list_instance_profiles': 1000
+}
+
+
+def paginate(client, operation, page_size=None, **kwargs):
+    """
+    Summary.
+
+        Generator yielding every record returned by an operation.
+        Operations without a botocore paginator (describe_key_pairs)
+        are called once.
+
+    Args:
+        :client (boto3 client): service client
+        :operation (str): client method name, a key of RESULT_KEYS
+        :page_size (int): records per page.  Default: PAGE_SIZES value
+        :kwargs: parameters passed to the operation (Owners, Filters, etc)
+
+    Yields:
+        record (dict)
+
+    """
+    key = RESULT_KEYS[operation]
+
+    if not client.can_paginate(operation):
+        yield from getattr(client, operation)(**kwargs).get(key, [])
+        return
+
+    config = {}
+    if page_size or PAGE_SIZES.get(operation):
+        config['PageSize'] = page_size or PAGE_SIZES[operation]
+
+    for page in client.get_paginator(operation).paginate(PaginationConfig=config, **kwargs):
+        yield from page.get(key, [])
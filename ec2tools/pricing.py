@@ -0,0 +1,168 @@
+"""
+Summary.
+
+    On-demand pricing index.  A compact binary file mapping
+    (region, instanceType, operatingSystem, tenancy) to the hourly USD
+    price, written by scripts/ec2sizes.py from the EC2 offer file and
+    memory mapped for lookup by binary search.
+
+    Layout (little endian):
+
+        header:   magic (8s), version (H), record count (I)
+        records:  key offset (I), key length (H), hourly price (d); sorted by key
+        keys:     utf-8 'region<TAB>instanceType<TAB>os<TAB>tenancy' strings
+
+    >>> import tempfile, os
+    >>> path = os.path.join(tempfile.mkdtemp(), 'prices.idx')
+    >>> write_index(path, {('us-east-1', 't3.micro', 'Linux', 'Shared'): 0.0104})
+    1
+    >>> with PriceIndex(path) as index:
+    ...     index.hourly('us-east-1', 't3.micro'), index.hourly('us-east-1', 't3.nano')
+    (0.0104, None)
+
+"""
+
+import os
+import mmap
+import struct
+
+
+MAGIC = b'EC2PRICE'
+VERSION = 1
+HEADER = struct.Struct('<8sHI')
+RECORD = struct.Struct('<IHd')
+SEPARATOR = '\t'
+HOURS_PER_MONTH = 730
+
+# operatingSystem of the offer file for each runmachine image type prefix
+IMAGE_OS = (
+    ('redhat', 'RHEL'),
+    ('windows', 'Windows'),
+    ('', 'Linux')
+)
+
+
+def image_os(imagetype):
+    """ Offer file operatingSystem of a runmachine image type (redhat7.5 -> RHEL) """
+    return next(v for k, v in IMAGE_OS if (imagetype or '').startswith(k))
+
+
+def index_key(region, instance_type, os_type='Linux', tenancy='Shared'):
+    return SEPARATOR.join((region, instance_type, os_type, tenancy)).encode('utf-8')
+
+
+def write_index(path, prices):
+    """
+    Summary.
+
+        Writes a pricing index.  The file is written to a temporary path and
+        moved into place when complete.
+
+    Args:
+        :path (str): index file path
+        :prices (dict): {(region, instanceType, os, tenancy): hourly price}
+
+    Returns:
+        number of prices written, TYPE: int
+
+    """
+    keys = sorted((index_key(*k), v) for k, v in prices.items())
+    tmp_path = path + '.tmp'
+
+    with open(tmp_path, 'wb') as f1:
+        f1.write(HEADER.pack(MAGIC, VERSION, len(keys)))
+        offset = 0
+        for key, price in keys:
+            f1.write(RECORD.pack(offset, len(key), price))
+            offset += len(key)
+        for key, _ in keys:
+            f1.write(key)
+    os.replace(tmp_path, path)
+    return len(keys)
+
+
+class PriceIndex():
+    """
+    Summary.
+
+        Read-only, memory mapped pricing index
+
+    Args:
+        :path (str): index file written by write_index
+
+    """
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f1:
+            self.mm = mmap.mmap(f1.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, self.count = HEADER.unpack_from(self.mm, 0)
+        if magic != MAGIC or version != VERSION:
+            self.mm.close()
+            raise ValueError('{} is not a version {} pricing index'.format(path, VERSION))
+        self.keys_start = HEADER.size + self.count * RECORD.size
+
+    def __len__(self):
+        return self.count
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        self.mm.close()
+
+    def _record(self, i):
+        offset, length, price = RECORD.unpack_from(self.mm, HEADER.size + i * RECORD.size)
+        start = self.keys_start + offset
+        return self.mm[start:start + length], price
+
+    def hourly(self, region, instance_type, os_type='Linux', tenancy='Shared'):
+        """
+        Summary.
+
+            Hourly on-demand price (USD) of one instance
+
+        Returns:
+            price (float) or None if not in the index
+
+        """
+        key = index_key(region, instance_type, os_type, tenancy)
+        lo, hi = 0, self.count
+
+        while lo < hi:
+            mid = (lo + hi) // 2
+            found, price = self._record(mid)
+            if found < key:
+                lo = mid + 1
+            elif found > key:
+                hi = mid
+            else:
+                return price
+        return None
+
+
+def estimate(path, region, instance_type, imagetype=None, count=1, tenancy='Shared'):
+    """
+    Summary.
+
+        Hourly and monthly on-demand cost of count instances
+
+    Returns:
+        (hourly, monthly) USD, TYPE: tuple; (None, None) if no index
+        is installed or the price is unknown
+
+    """
+    if not os.path.exists(path):
+        return None, None
+    try:
+        with PriceIndex(path) as index:
+            price = index.hourly(region, instance_type, image_os(imagetype), tenancy)
+    except (OSError, ValueError):
+        return None, None
+    if price is None:
+        return None, None
+    hourly = price * int(count)
+    return hourly, hourly * HOURS_PER_MONTH
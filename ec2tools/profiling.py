@@ -0,0 +1,195 @@
+"""
+Summary.
+
+    Opt-in profiling of a command run (EC2TOOLS_PROFILE).  Set to 'cpu',
+    the command runs under cProfile; to 'mem', under tracemalloc.  At
+    exit the profile is written to the log directory (~/logs) and a short
+    summary to stderr, leaving stdout output intact:
+
+        $ EC2TOOLS_PROFILE=cpu runmachine --profile prod
+        $ python3 -m pstats ~/logs/ec2tools-runmachine-20190301T120000-4242.prof
+
+    cpu profiles cover every thread of the command (region lookups run
+    in thread pools); profileaccount --profiles worker processes are not
+    profiled.  mem reports the allocations still held at exit grouped by
+    source line, plus the peak traced memory.
+
+"""
+
+import os
+import sys
+import time
+import pstats
+import cProfile
+import threading
+import functools
+import tracemalloc
+from ec2tools.statics import local_config
+from ec2tools import deadline
+from ec2tools import logd, __version__
+
+
+# globals
+logger = logd.getLogger(__version__)
+PROFILE_ENV = 'EC2TOOLS_PROFILE'
+MODES = ('cpu', 'mem')
+TRACE_FRAMES = 10           # stack frames kept per traced allocation
+TOP = 10                    # entries in the stderr summary
+TOP_FILE = 100              # entries in the written mem report
+
+
+def profile_dir():
+    """ Directory of the ec2tools log file """
+    log_path = local_config.get('LOGGING', {}).get('LOG_PATH')
+    if log_path:
+        return os.path.dirname(log_path)
+    return os.path.join(os.path.expanduser('~'), 'logs')
+
+
+def profile_path(command, suffix):
+    stamp = time.strftime('%Y%m%dT%H%M%S')
+    return os.path.join(
+        profile_dir(), 'ec2tools-{}-{}-{}{}'.format(command, stamp, os.getpid(), suffix)
+    )
+
+
+class CpuProfile():
+    """
+    Summary.
+
+        cProfile of the main thread and of each thread started while
+        enabled.  Python 3.12 and later profile all threads from one
+        profiler, so further thread profilers are then not started.
+
+    """
+    def __init__(self):
+        self.profiles = []
+        self.lock = threading.Lock()
+        self.started = time.perf_counter()
+
+    def _thread_start(self, frame, event, arg):
+        """ setprofile hook run once by each new thread; replaced by the thread's profiler """
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            sys.setprofile(None)
+            return
+        with self.lock:
+            self.profiles.append(profile)
+
+    def start(self):
+        profile = cProfile.Profile()
+        self.profiles.append(profile)
+        threading.setprofile(self._thread_start)
+        profile.enable()
+
+    def stop(self, command):
+        threading.setprofile(None)
+        elapsed = time.perf_counter() - self.started
+        with self.lock:
+            profiles = list(self.profiles)
+        stats = pstats.Stats(profiles[0])
+        for profile in profiles[1:]:
+            stats.add(profile)
+
+        path = profile_path(command, '.prof')
+        stats.dump_stats(path)
+
+        lines = ['{} cpu profile: {:.2f}s wall, {} calls in {} threads; written to {}'.format(
+            command, elapsed, stats.total_calls, len(profiles), path)]
+        lines.append(
+            '  {:>10} {:>10} {:>9}  {}'.format('tottime_s', 'cumtime_s', 'calls', 'function')
+        )
+        ranked = sorted(stats.stats.items(), key=lambda x: -x[1][2])[:TOP]
+        for (filename, line, name), (_, calls, tottime, cumtime, _) in ranked:
+            lines.append('  {:>10.3f} {:>10.3f} {:>9}  {}:{}({})'.format(
+                tottime, cumtime, calls, os.path.basename(filename), line, name))
+        return lines
+
+
+class MemoryProfile():
+    """ tracemalloc allocations held at exit, by source line """
+    def start(self):
+        tracemalloc.start(TRACE_FRAMES)
+
+    def stop(self, command):
+        snapshot = tracemalloc.take_snapshot().filter_traces([
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, '<frozen importlib._bootstrap*>')
+        ])
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        top = snapshot.statistics('lineno')
+
+        path = profile_path(command, '.mem.txt')
+        with open(path, 'w') as f1:
+            f1.write('{} traced memory: {:.1f} MB at exit, {:.1f} MB peak\n\n'.format(
+                command, current / 2**20, peak / 2**20))
+            for stat in top[:TOP_FILE]:
+                f1.write('{}\n'.format(stat))
+                for line in stat.traceback.format()[:-2]:
+                    f1.write('    {}\n'.format(line))
+
+        lines = ['{} mem profile: {:.1f} MB held at exit, {:.1f} MB peak; written to {}'.format(
+            command, current / 2**20, peak / 2**20, path)]
+        for stat in top[:TOP]:
+            frame = stat.traceback[0]
+            lines.append('  {:>9.1f} KB {:>7} blocks  {}:{}'.format(
+                stat.size / 1024, stat.count, os.path.basename(frame.filename), frame.lineno))
+        return lines
+
+
+_profile = {}
+
+
+def _at_exit(profiler, command):
+    try:
+        os.makedirs(profile_dir(), exist_ok=True)
+        lines = profiler.stop(command)
+    except Exception as e:
+        logger.warning('Unable to write {} profile: {}'.format(command, e))
+        return
+    sys.stderr.write('\n'.join(lines) + '\n')
+    sys.stderr.flush()
+
+
+def enable(command):
+    """
+    Summary.
+
+        Starts profiling this process when EC2TOOLS_PROFILE is set;
+        the profile is written at exit
+
+    Args:
+        :command (str): command name, part of the profile file name
+
+    Returns:
+        profiler, or None when not enabled
+
+    """
+    mode = os.environ.get(PROFILE_ENV, '').strip().lower()
+    if not mode or 'profiler' in _profile:
+        return _profile.get('profiler')
+    if mode not in MODES:
+        logger.warning(
+            'Ignoring {}={}; expected one of {}'.format(PROFILE_ENV, mode, ', '.join(MODES))
+        )
+        return None
+
+    profiler = CpuProfile() if mode == 'cpu' else MemoryProfile()
+    _profile['profiler'] = profiler
+    deadline.at_exit(_at_exit, profiler, command)
+    profiler.start()
+    return profiler
+
+
+def profiled(command):
+    """ Decorator profiling a console script entry point when EC2TOOLS_PROFILE is set """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            enable(command)
+            return func(*args, **kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,241 @@
+"""
+Summary.
+
+    Client-side rate limiting of AWS api calls.  One limiter is shared
+    by all clients of the same (account, region, service) in a process.
+    Each limiter combines a token bucket (sustained request rate and
+    burst) with an AIMD concurrency limit: the number of requests in
+    flight is halved when a request is throttled and, while requests
+    fill the limit, grows back by one per limit's worth of successful
+    requests.
+
+    Limiters attach to botocore clients through the before-send and
+    needs-retry events, so every http attempt, including the retries of
+    botocore's retry mode, waits for a token and a concurrency slot.  A
+    slot still held when a call fails without reaching needs-retry (an
+    exception raised by another event handler) is freed by after-call-error.
+
+    >>> limiter = AdaptiveLimiter(rate=100, capacity=100, limit=8)
+    >>> limiter.release(limiter.acquire(), throttled=True)
+    >>> limiter.limit
+    4.0
+    >>> tickets = [limiter.acquire() for _ in range(4)]
+    >>> for ticket in tickets:
+    ...     limiter.release(ticket)
+    >>> limiter.limit
+    4.25
+
+"""
+
+import time
+import threading
+import functools
+
+
+# error codes of throttled requests (botocore standard retry mode)
+THROTTLE_CODES = frozenset([
+    'Throttling', 'ThrottlingException', 'ThrottledException', 'RequestThrottledException',
+    'TooManyRequestsException', 'ProvisionedThroughputExceededException',
+    'TransactionInProgressException', 'RequestLimitExceeded', 'BandwidthLimitExceeded',
+    'LimitExceededException', 'RequestThrottled', 'SlowDown', 'PriorRequestNotComplete',
+    'EC2ThrottledException'
+])
+
+# service: (requests per second, burst) below the published api request
+# token bucket refill rates and sizes of each service
+SERVICE_RATES = {
+    'ec2': (20, 50),
+    'iam': (10, 20),
+    'sts': (20, 50)
+}
+DEFAULT_RATE = (10, 20)
+
+# concurrency limit: initial, minimum, maximum requests in flight
+CONCURRENCY = (8, 1, 32)
+
+# limiters by (account, region, service)
+_limiters = {}
+_registry_lock = threading.Lock()
+
+# limiter and ticket of the http attempt in progress on each thread
+_attempt = threading.local()
+
+
+class TokenBucket():
+    """
+    Summary.
+
+        Token bucket holding up to capacity tokens, refilled at rate
+        tokens per second
+
+    Args:
+        :rate (float): tokens added per second
+        :capacity (int): maximum tokens (burst size)
+        :clock (callable): monotonic time source
+        :sleep (callable): sleep function; replaceable in tests
+
+    """
+    def __init__(self, rate, capacity, clock=time.monotonic, sleep=time.sleep):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.clock = clock
+        self.sleep = sleep
+        self.updated = clock()
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = self.clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self):
+        """ Takes one token, waiting for it if necessary; returns seconds waited """
+        waited = 0.0
+        while True:
+            with self.lock:
+                self._refill()
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return waited
+                delay = (1 - self.tokens) / self.rate
+            self.sleep(delay)
+            waited += delay
+
+
+class AdaptiveLimiter():
+    """
+    Summary.
+
+        Token bucket with an additive increase, multiplicative decrease
+        limit on concurrent requests
+
+    Args:
+        :rate (float): sustained requests per second
+        :capacity (int): request burst
+        :limit (int): initial concurrency limit
+        :min_limit (int): concurrency limit floor
+        :max_limit (int): concurrency limit ceiling
+        :decrease (float): factor applied to the limit on a throttle
+
+    """
+    def __init__(self, rate, capacity, limit=CONCURRENCY[0], min_limit=CONCURRENCY[1],
+                 max_limit=CONCURRENCY[2], decrease=0.5, clock=time.monotonic, sleep=time.sleep):
+        self.bucket = TokenBucket(rate, capacity, clock, sleep)
+        self.limit = float(limit)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.decrease = decrease
+        self.clock = clock
+        self.inflight = 0
+        self.decreased_at = None
+        self.throttles = 0
+        self.condition = threading.Condition()
+
+    def acquire(self):
+        """
+        Summary.
+
+            Waits for a concurrency slot and a token
+
+        Returns:
+            ticket (start time of the request), passed to release
+
+        """
+        with self.condition:
+            while self.inflight >= max(int(self.limit), self.min_limit):
+                self.condition.wait()
+            self.inflight += 1
+        try:
+            self.bucket.acquire()
+        except BaseException:
+            self.release(None, success=False)
+            raise
+        return self.clock()
+
+    def release(self, ticket, throttled=False, success=True):
+        """
+        Summary.
+
+            Frees the slot of a completed request and adapts the limit.
+            Throttles of requests sent before the last decrease belong to
+            the same congestion event and do not decrease it again.
+
+        Args:
+            :ticket: value returned by acquire
+            :throttled (bool): the request was throttled
+            :success (bool): the request completed without error
+
+        """
+        with self.condition:
+            self.inflight -= 1
+            if throttled:
+                self.throttles += 1
+                if self.decreased_at is None or ticket is None or ticket >= self.decreased_at:
+                    self.limit = max(self.min_limit, self.limit * self.decrease)
+                    self.decreased_at = self.clock()
+            elif success and self.inflight + 1 >= int(self.limit):
+                # grow only while the limit, not demand, bounds concurrency
+                self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+            self.condition.notify_all()
+
+
+def limiter(account, region, service):
+    """ Limiter shared by all clients of (account, region, service) """
+    key = (account, region, service)
+    with _registry_lock:
+        if key not in _limiters:
+            rate, capacity = SERVICE_RATES.get(service, DEFAULT_RATE)
+            _limiters[key] = AdaptiveLimiter(rate, capacity)
+        return _limiters[key]
+
+
+def _before_send(limiter, **kwargs):
+    _attempt.held = (limiter, limiter.acquire())
+
+
+def _after_attempt(response, caught_exception, **kwargs):
+    held = getattr(_attempt, 'held', None)
+    if held is None:
+        return None
+    _attempt.held = None
+    code = response[1].get('Error', {}).get('Code') if response else None
+    held[0].release(
+        held[1],
+        throttled=code in THROTTLE_CODES,
+        success=caught_exception is None and code is None
+    )
+    return None
+
+
+def _after_error(**kwargs):
+    held = getattr(_attempt, 'held', None)
+    if held is not None:
+        _attempt.held = None
+        held[0].release(held[1], success=False)
+
+
+def register(client, account):
+    """
+    Summary.
+
+        Rate limits every http attempt of a boto3 client with the limiter
+        of its account, region, and service
+
+    Args:
+        :client (boto3 object): botocore client
+        :account (str): account (awscli profile name) the client belongs to
+
+    Returns:
+        client (boto3 object)
+
+    """
+    shared = limiter(account, client.meta.region_name, client.meta.service_model.service_name)
+    events = client.meta.events
+    events.register_first(
+        'before-send.*.*', functools.partial(_before_send, shared),
+        unique_id='ec2tools-ratelimit-send'
+    )
+    events.register('needs-retry.*.*', _after_attempt, unique_id='ec2tools-ratelimit-retry')
+    events.register('after-call-error.*.*', _after_error, unique_id='ec2tools-ratelimit-error')
+    return client
@@ -0,0 +1,260 @@
+"""
+Summary.
+
+    Region health cache.  The regions enabled for each account
+    (describe_regions OptInStatus) are cached for ENABLED_TTL seconds.
+    Regions whose api calls fail with a region level error (region not
+    opted in, AuthFailure, endpoint unreachable) are skipped by a
+    per-region circuit breaker until a cooldown has passed; the
+    cooldown doubles with each consecutive failure up to MAX_COOLDOWN
+    and the circuit closes on the next success.  EC2 answers rejected
+    credentials with AuthFailure too, so AuthFailure opens a circuit only
+    once the credentials of the profile are known to be accepted; until
+    then it is raised to the command.  State is kept per awscli
+    profile in ~/.config/ec2tools/regions.json and shared by all
+    commands; while responses are recorded or replayed (ec2tools.cassette)
+    state is kept in memory only, so every cassette holds, and every
+    replay sees, the regions of the recorded account.
+
+"""
+
+import os
+import json
+import time
+import threading
+from botocore.exceptions import ClientError, ConnectionError as BotoConnectionError
+from ec2tools.statics import local_config
+from ec2tools.session import boto3_session, credential_error, error_code
+from ec2tools import cassette
+from ec2tools import logd, __version__
+
+
+# globals
+logger = logd.getLogger(__version__)
+CACHE_PATH = os.path.join(local_config['CONFIG']['CONFIG_DIR'], 'regions.json')
+ENABLED_TTL = 86400             # seconds the enabled regions of an account are cached
+COOLDOWN = 900                  # seconds a region is skipped after a region level failure
+MAX_COOLDOWN = 86400
+
+# error codes of calls to a region which is not enabled for the account;
+# AuthFailure is also the answer to invalid credentials (RegionHealth.accepted)
+REGION_ERRORS = frozenset(['AuthFailure', 'OptInRequired'])
+
+
+def region_error(exception):
+    """
+    Summary.
+
+        Whether an exception indicates the region, rather than the
+        request, is unusable
+
+    Returns:
+        error code (str) or None
+
+    """
+    code = error_code(exception)
+    if code in REGION_ERRORS:
+        return code
+    if isinstance(exception, BotoConnectionError):
+        return type(exception).__name__
+    return None
+
+
+class RegionHealth():
+    """
+    Summary.
+
+        Enabled regions and circuit breaker state of each profile
+
+    Args:
+        :path (str): cache file location; None keeps state in memory
+        :clock (callable): time source (seconds since the epoch)
+
+    """
+    def __init__(self, path=CACHE_PATH, clock=time.time):
+        self.path = path
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.data = self._read()
+        self.verified = set()       # profiles whose credentials an api call accepted
+
+    def _read(self):
+        if self.path is None:
+            return {}
+        try:
+            with open(self.path) as f1:
+                return json.loads(f1.read())
+        except (OSError, ValueError):
+            return {}
+
+    def _save(self, profile):
+        """ Writes the state of profile, keeping other profiles written by other processes """
+        if self.path is None:
+            return
+        data = self._read()
+        data[profile] = self.data[profile]
+        tmp_path = '{}.{}.tmp'.format(self.path, os.getpid())
+        try:
+            with open(tmp_path, 'w') as f1:
+                f1.write(json.dumps(data, indent=4))
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logger.warning('Unable to write region health cache {}: {}'.format(self.path, e))
+
+    def _profile(self, profile):
+        return self.data.setdefault(profile, {'Enabled': [], 'Checked': 0, 'Circuits': {}})
+
+    def enabled(self, profile, ttl=ENABLED_TTL):
+        """
+        Summary.
+
+            Regions enabled for the account of profile; cached for ttl seconds
+
+        Returns:
+            region codes, TYPE: list
+
+        """
+        with self.lock:
+            state = self._profile(profile)
+            if state['Enabled'] and self.clock() - state['Checked'] < ttl:
+                return list(state['Enabled'])
+
+        client = boto3_session('ec2', profile=profile)
+        regions = client.describe_regions(AllRegions=True)['Regions']
+
+        with self.lock:
+            state = self._profile(profile)
+            state['Enabled'] = sorted(
+                x['RegionName'] for x in regions if x.get('OptInStatus') != 'not-opted-in'
+            )
+            state['Checked'] = int(self.clock())
+            self.verified.add(profile)
+            self._save(profile)
+            return list(state['Enabled'])
+
+    def accepted(self, profile):
+        """
+        Summary.
+
+            Whether the credentials of profile are accepted: a call of this
+            process succeeded, or describe_regions in the default region of
+            the profile succeeds.  Tells AuthFailure of a region not enabled
+            for the account from AuthFailure of rejected credentials.
+
+        """
+        with self.lock:
+            if profile in self.verified:
+                return True
+        try:
+            boto3_session('ec2', profile=profile).describe_regions()
+        except ClientError as e:
+            if credential_error(e) or error_code(e) == 'AuthFailure':
+                return False
+        except BotoConnectionError:
+            pass
+        with self.lock:
+            self.verified.add(profile)
+        return True
+
+    def available(self, profile, region):
+        """ False while the circuit of a region is open """
+        with self.lock:
+            circuit = self._profile(profile)['Circuits'].get(region)
+            return circuit is None or self.clock() >= circuit['OpenUntil']
+
+    def healthy(self, profile, regions=None):
+        """
+        Summary.
+
+            Enabled regions (or regions given) whose circuit is closed.
+            Should every region be open, all are returned rather than none.
+
+        Returns:
+            region codes, TYPE: list
+
+        """
+        regions = regions if regions is not None else self.enabled(profile)
+        healthy = [x for x in regions if self.available(profile, x)]
+        skipped = len(regions) - len(healthy)
+
+        if skipped and not healthy:
+            logger.warning(
+                'All {} regions failing for profile {}; retrying all'.format(skipped, profile)
+            )
+            return list(regions)
+        if skipped:
+            logger.info('Skipping {} failing regions for profile {}: {}'.format(
+                skipped, profile, ', '.join(x for x in regions if x not in healthy)))
+        return healthy
+
+    def failure(self, profile, region, exception):
+        """
+        Summary.
+
+            Records a failed call to a region.  Region level errors open
+            the circuit of the region; credential errors, and AuthFailure
+            while the credentials are not accepted, are raised.
+
+        Returns:
+            error code (str) if the circuit was opened, otherwise None
+
+        """
+        if credential_error(exception):
+            raise exception
+        code = region_error(exception)
+        if code is None:
+            return None
+        if code == 'AuthFailure' and not self.accepted(profile):
+            raise exception
+
+        with self.lock:
+            circuits = self._profile(profile)['Circuits']
+            failures = circuits.get(region, {}).get('Failures', 0) + 1
+            cooldown = min(COOLDOWN * 2 ** (failures - 1), MAX_COOLDOWN)
+            circuits[region] = {
+                'Failures': failures,
+                'Error': code,
+                'OpenUntil': int(self.clock() + cooldown)
+            }
+            self._save(profile)
+        logger.warning('Region {} unavailable to profile {} ({}); skipped for {} seconds'.format(
+            region, profile, code, cooldown))
+        return code
+
+    def success(self, profile, region):
+        """ Closes the circuit of a region after a successful call """
+        with self.lock:
+            self.verified.add(profile)
+            circuits = self._profile(profile)['Circuits']
+            if region in circuits:
+                del circuits[region]
+                self._save(profile)
+
+
+_health = {}
+
+
+def region_health():
+    """ RegionHealth of this process """
+    if 'cache' not in _health:
+        _health['cache'] = RegionHealth(None if cassette.active() else CACHE_PATH)
+    return _health['cache']
+
+
+def enabled_regions(profile=None):
+    """ Regions enabled for the account of profile (cached) """
+    return region_health().enabled(profile or 'default')
+
+
+def healthy_regions(profile=None, regions=None):
+    """ Enabled regions, or regions given, which are not skipped by the circuit breaker """
+    return region_health().healthy(profile or 'default', regions)
+
+
+def record_failure(profile, region, exception):
+    """ Records a failed call; returns the error code if the region is now skipped """
+    return region_health().failure(profile or 'default', region, exception)
+
+
+def record_success(profile, region):
+    region_health().success(profile or 'default', region)
@@ -0,0 +1,280 @@
+"""
+Summary.
+
+    Instrumented boto3 clients and command phase spans.  Clients returned
+    by boto3_session report every AWS api call (service, operation,
+    region, duration, retries, bytes received, outcome) through
+    botocore's before-call and after-call events, and every throttled
+    attempt, retried or not, through needs-retry.  span() times phases
+    of a command such as discovery, approval, and launch.  Events are
+    passed to each registered sink; the JSON log mode registers one
+    writing each event as a structured log record.
+
+"""
+
+import sys
+import time
+import functools
+from collections import OrderedDict
+from contextlib import contextmanager
+from botocore.exceptions import (
+    BotoCoreError, ClientError, NoCredentialsError, PartialCredentialsError
+)
+from pyaws.session import boto3_session as _boto3_session
+from pyaws.utils import stdout_message
+from ec2tools.ratelimit import THROTTLE_CODES, register
+from ec2tools import cassette, deadline
+from ec2tools import logd, __version__
+
+try:
+    from pyaws.core.oscodes_unix import exit_codes
+except Exception:
+    from pyaws.core.oscodes_win import exit_codes    # non-specific os-safe codes
+
+
+# globals
+logger = logd.getLogger(__version__)
+
+# error codes of invalid or expired credentials; these fail every region alike
+CREDENTIAL_ERRORS = frozenset([
+    'InvalidClientTokenId', 'UnrecognizedClientException', 'ExpiredToken',
+    'ExpiredTokenException', 'RequestExpired', 'SignatureDoesNotMatch'
+])
+
+# request context key holding the start time of an api call
+_START = 'ec2tools_start'
+
+# callables receiving each telemetry event (OrderedDict)
+_sinks = []
+
+
+def add_sink(sink):
+    """ Registers a callable receiving every telemetry event """
+    if sink not in _sinks:
+        _sinks.append(sink)
+
+
+def log_event(event):
+    """ Sink writing events as log records; fields are merged by the JSON formatter """
+    if event['event'] == 'aws_call':
+        message = '{service}.{operation} {region} {duration_ms}ms {outcome}'
+    elif event['event'] == 'throttle':
+        message = '{service}.{operation} {region} throttled ({error}), attempt {attempt}'
+    else:
+        message = 'span {phase} {duration_ms}ms {outcome}'
+    logger.info(message.format(**event), extra={'telemetry': event})
+
+
+def emit(event, **fields):
+    """ Sends a telemetry event to all sinks """
+    if not _sinks:
+        return
+    record = OrderedDict(event=event)
+    record.update(fields)
+    for sink in _sinks:
+        sink(record)
+
+
+def _elapsed_ms(start):
+    return round((time.perf_counter() - start) * 1000, 1) if start else None
+
+
+def _before_call(context, **kwargs):
+    context[_START] = time.perf_counter()
+
+
+def _after_call(region, http_response, parsed, model, context, **kwargs):
+    error = parsed.get('Error', {}).get('Code') if http_response.status_code >= 300 else None
+    emit(
+        'aws_call',
+        service=model.service_model.service_name,
+        operation=model.name,
+        region=region,
+        duration_ms=_elapsed_ms(context.get(_START)),
+        retries=parsed.get('ResponseMetadata', {}).get('RetryAttempts', 0),
+        bytes=len(http_response.content or b''),
+        outcome='error' if error else 'ok',
+        error=error
+    )
+
+
+def _after_call_error(service, region, exception, context, event_name, **kwargs):
+    emit(
+        'aws_call',
+        service=service,
+        operation=event_name.rsplit('.', 1)[1],
+        region=region,
+        duration_ms=_elapsed_ms(context.get(_START)),
+        retries=max(context.get('retries', {}).get('attempt', 1) - 1, 0),
+        bytes=0,
+        outcome='error',
+        error=type(exception).__name__
+    )
+
+
+def _needs_retry(service, region, response, operation, attempts, **kwargs):
+    """ Reports throttled attempts; returns None, leaving the retry decision to botocore """
+    if response is None:
+        return None
+    code = response[1].get('Error', {}).get('Code')
+    if code in THROTTLE_CODES:
+        emit(
+            'throttle',
+            service=service,
+            operation=operation.name,
+            region=region,
+            attempt=attempts,
+            error=code
+        )
+    return None
+
+
+def instrument(client):
+    """
+    Summary.
+
+        Registers telemetry handlers, and the check refusing calls after
+        the --deadline (ec2tools.deadline), on the event system of a
+        boto3 client
+
+    Returns:
+        client (boto3 object)
+
+    """
+    region = client.meta.region_name
+    service = client.meta.service_model.service_name
+    events = client.meta.events
+
+    events.register('before-call.*.*', deadline.check, unique_id='ec2tools-deadline')
+    events.register('before-call.*.*', _before_call, unique_id='ec2tools-before-call')
+    events.register(
+        'after-call.*.*', functools.partial(_after_call, region), unique_id='ec2tools-after-call'
+    )
+    events.register(
+        'after-call-error.*.*', functools.partial(_after_call_error, service, region),
+        unique_id='ec2tools-after-call-error'
+    )
+    events.register(
+        'needs-retry.*.*', functools.partial(_needs_retry, service, region),
+        unique_id='ec2tools-needs-retry'
+    )
+    return client
+
+
+def boto3_session(service, region=None, profile=None):
+    """
+    Summary.
+
+        pyaws.session.boto3_session returning an instrumented client,
+        rate limited by the limiter shared by all clients of the profile,
+        region, and service (ec2tools.ratelimit).  Responses are recorded
+        or replayed when a cassette is enabled (ec2tools.cassette).
+
+    Args:
+        :service (str): boto3 service abbreviation ('ec2', 'iam', etc)
+        :region (str): AWS region code, optional
+        :profile (str): profile_name of an iam user from local awscli config
+
+    Returns:
+        client (boto3 object), None if the profile does not exist
+
+    """
+    if region is None:
+        client = _boto3_session(service, profile=profile)
+    else:
+        client = _boto3_session(service, region=region, profile=profile)
+    if client is None:
+        return None
+    return register(instrument(cassette.attach(client)), profile or 'default')
+
+
+def authenticated(profile):
+    """
+    Summary.
+
+        pyaws.session.authenticated using an instrumented client, so the
+        check is counted, timed, and recorded with the other api calls
+
+    Returns:
+        TYPE: bool, True (Authenticated) | False (Unauthenticated)
+
+    """
+    try:
+        sts_client = boto3_session(service='sts', profile=profile)
+        if sts_client is None:
+            return False
+        return sts_client.get_caller_identity()['ResponseMetadata']['HTTPStatusCode'] == 200
+
+    except ClientError as e:
+        logger.warning('Unable to authenticate profile user {} ({})'.format(
+            profile, e.response['Error']['Code']))
+    except (BotoCoreError, cassette.CassetteMiss) as e:
+        logger.warning('Unable to authenticate profile user {}: {}'.format(profile, e))
+    return False
+
+
+def error_code(exception):
+    """ Error code of an api error, None for other exceptions """
+    if isinstance(exception, ClientError):
+        return exception.response.get('Error', {}).get('Code')
+    return None
+
+
+def credential_error(exception):
+    """ Whether an exception is caused by the credentials of the profile """
+    if isinstance(exception, (NoCredentialsError, PartialCredentialsError)):
+        return True
+    return error_code(exception) in CREDENTIAL_ERRORS
+
+
+def authentication_failures(func):
+    """
+    Summary.
+
+        Decorator of command entry points.  Credential errors raised by
+        any api call of the command end it with an authentication failure
+        message and exit code E_AUTHFAIL rather than a traceback.
+        AuthFailure is one of them here: region level AuthFailure (region
+        not enabled for the account) is absorbed by ec2tools.regions.
+
+    """
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        try:
+            return func(*args, **kwargs)
+        except (ClientError, NoCredentialsError, PartialCredentialsError) as e:
+            if not (credential_error(e) or error_code(e) == 'AuthFailure'):
+                raise
+            stdout_message('Authentication failed: {}'.format(e), prefix='AUTH', severity='WARNING')
+            sys.exit(exit_codes['E_AUTHFAIL']['Code'])
+    return wrapper
+
+
+@contextmanager
+def span(phase, **fields):
+    """
+    Summary.
+
+        Times a phase of a command; usable as a context manager or
+        decorator.  The event is emitted when the phase ends, with outcome
+        error and the exception type if it raised.
+
+    Args:
+        :phase (str): phase name (discovery, approval, launch)
+        :fields: additional event fields (profile, region, ...)
+
+    """
+    start = time.perf_counter()
+    outcome = 'ok'
+    try:
+        yield fields
+    except BaseException as e:
+        outcome = 'error'
+        fields['error'] = type(e).__name__
+        raise
+    finally:
+        emit('span', phase=phase, duration_ms=_elapsed_ms(start), outcome=outcome, **fields)
+
+
+if logd.json_mode():
+    add_sink(log_event)
@@ -0,0 +1,105 @@
+"""
+Summary.
+
+    Securitygroup rule entries.  Flattens the securitygroups of a region
+    profile to one Rule per source (cidr, securitygroup, or prefix list)
+    with a closed port interval.  Rules are held in the inventory sgrules
+    table, whose (direction, protocol, from_port, to_port) index answers
+    exposure questions such as "which securitygroups open port 22 to
+    0.0.0.0/0"; source cidr containment is checked on the rules selected.
+
+"""
+
+import functools
+import ipaddress
+from collections import namedtuple
+
+
+ALL_PORTS = (0, 65535)
+
+# IpProtocol numbers AWS may return in place of names
+PROTOCOLS = {'6': 'tcp', '17': 'udp', '1': 'icmp', '58': 'icmpv6', 'all': '-1'}
+
+# profile rule keys holding rule sources
+SOURCES = ('Cidrs', 'Groups', 'PrefixLists')
+
+# one securitygroup rule entry; cidr holds the source: an address range,
+# or the id of a securitygroup (sg-) or prefix list (pl-) the rule refers to
+Rule = namedtuple('Rule', [
+    'account', 'region', 'group_id', 'group_name', 'direction', 'protocol', 'from_port', 'to_port',
+    'cidr'
+])
+
+
+def normalize_protocol(protocol):
+    """ Returns protocol name for IpProtocol name or number (-1 = all) """
+    protocol = str(protocol).lower()
+    return PROTOCOLS.get(protocol, protocol)
+
+
+def port_range(protocol, from_port, to_port):
+    """
+    Summary.
+
+        Closed port interval of a rule.  All-traffic rules and rules without
+        ports cover every port.  Icmp rules carry an icmp type and code in
+        place of ports (echo request: type 8, code 0) and also cover every
+        port.
+
+    >>> port_range('-1', None, None)
+    (0, 65535)
+    >>> port_range('tcp', 22, 22)
+    (22, 22)
+    >>> port_range('icmp', 8, 0)
+    (0, 65535)
+    """
+    if protocol in ('-1', 'icmp', 'icmpv6') or from_port in (None, -1) or to_port in (None, -1):
+        return ALL_PORTS
+    return (int(from_port), int(to_port))
+
+
+def region_rules(account, region, region_profile):
+    """
+    Summary.
+
+        Yields a Rule for every source (cidr, securitygroup, prefix list)
+        of every rule of every securitygroup of a region profile
+
+    """
+    for row in region_profile.get('SecurityGroups', []):
+        for group_id, sg in row.items():
+            for direction, key in (('ingress', 'IngressRules'), ('egress', 'EgressRules')):
+                for rule in sg.get(key, []):
+                    protocol = normalize_protocol(rule['IpProtocol'])
+                    start, end = port_range(protocol, rule.get('FromPort'), rule.get('ToPort'))
+                    for source in [y for x in SOURCES for y in rule.get(x, [])]:
+                        yield Rule(
+                            account, region, group_id, sg['GroupName'], direction, protocol,
+                            start, end, source
+                        )
+
+
+@functools.lru_cache(maxsize=None)
+def _network(cidr):
+    return ipaddress.ip_network(cidr, strict=False)
+
+
+def covers(source, cidr):
+    """
+    Summary.
+
+        True if the rule source is an address range containing cidr (same
+        address family).  Securitygroup and prefix list sources are not
+        resolved to addresses and contain no cidr.
+
+    >>> covers('10.0.0.0/8', '10.1.1.1/32')
+    True
+    >>> covers('10.0.0.0/8', '::/0')
+    False
+    >>> covers('sg-0a1b2c3d', '10.1.1.1/32')
+    False
+    """
+    if '/' not in source:
+        return False
+    a, b = _network(source), _network(cidr)
+    return a.version == b.version and b.subnet_of(a)
@@ -54,6 +54,7 @@
     # logging parameters
     enable_logging = True
     log_mode = 'STREAM'
+    queue_sink = 'FILE'         # destination of log_mode QUEUE: FILE | STREAM | SYSLOG | JSON
     log_filename = PACKAGE + '.log'
     log_dir = os_parityPath(user_home + '/' + 'logs')
     log_path = os_parityPath(log_dir + '/' + log_filename)
@@ -61,6 +62,11 @@
     # runtime parameters
     max_field_width = 90
 
+    # telemetry parameters
+    # write api call counters for the node_exporter textfile collector
+    prometheus_textfile = False
+    textfile_dir = os_parityPath(config_dir + '/metrics')
+
     seed_config = {
         "PROJECT": {
             "PACKAGE": PACKAGE,
@@ -73,6 +79,7 @@
             "LOG_FILENAME": log_filename,
             "LOG_PATH": log_path,
             "LOG_MODE": log_mode,
+            "QUEUE_SINK": queue_sink,
             "SYSLOG_FILE": False
         },
         "CONFIG": {
@@ -84,6 +91,10 @@
         },
         "RUNTIME": {
             "MAX_FIELD_WIDTH":  max_field_width
+        },
+        "TELEMETRY": {
+            "PROMETHEUS_TEXTFILE": prometheus_textfile,
+            "TEXTFILE_DIR": textfile_dir
         }
     }
 
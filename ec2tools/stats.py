@@ -0,0 +1,225 @@
+"""
+Summary.
+
+    Per-process AWS api budget counters (--stats).  Counts api calls,
+    errors, retries, throttled attempts, and bytes received per
+    (service, operation, region) from the telemetry events of
+    ec2tools.session.  At exit the counters are written as json to
+    stderr (--stats) and, when TELEMETRY.PROMETHEUS_TEXTFILE is enabled
+    in the local configuration, added to the cumulative counters of a
+    Prometheus textfile (node_exporter textfile collector) in
+    TELEMETRY.TEXTFILE_DIR.  Concurrent processes update the textfile
+    under an exclusive lock.
+
+"""
+
+import os
+import re
+import sys
+import json
+import datetime
+import threading
+from collections import OrderedDict
+from ec2tools.statics import local_config
+from ec2tools import deadline, session, logd, __version__
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
+# globals
+logger = logd.getLogger(__version__)
+TEXTFILE_NAME = 'ec2tools.prom'
+
+# counter: (metric name, help text)
+COUNTERS = OrderedDict([
+    ('calls', ('ec2tools_api_calls_total', 'AWS api calls')),
+    ('errors', ('ec2tools_api_errors_total', 'AWS api calls which failed')),
+    ('retries', ('ec2tools_api_retries_total', 'Retried attempts of AWS api calls')),
+    ('throttles', ('ec2tools_api_throttles_total', 'Throttled attempts of AWS api calls')),
+    ('bytes', ('ec2tools_api_received_bytes_total', 'Response bytes received from AWS api calls'))
+])
+RUNS = ('ec2tools_runs_total', 'Command invocations reporting api counters')
+
+SAMPLE = re.compile(r'^(\w+)\{(.*)\} (\S+)$')
+LABEL = re.compile(r'(\w+)="([^"]*)"')
+
+
+class StatsCollector():
+    """
+    Summary.
+
+        Telemetry sink accumulating api budget counters of this process
+
+    Args:
+        :command (str): name of the command (machineimage, runmachine, ...)
+
+    """
+    def __init__(self, command):
+        self.command = command
+        self.started = datetime.datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%SZ')
+        self.counters = {}
+        self.lock = threading.Lock()
+
+    def _counter(self, event):
+        key = (event['service'], event['operation'], event['region'])
+        if key not in self.counters:
+            self.counters[key] = dict.fromkeys(COUNTERS, 0)
+        return self.counters[key]
+
+    def __call__(self, event):
+        if event['event'] not in ('aws_call', 'throttle'):
+            return
+        with self.lock:
+            counter = self._counter(event)
+            if event['event'] == 'throttle':
+                counter['throttles'] += 1
+                return
+            counter['calls'] += 1
+            counter['errors'] += event['outcome'] != 'ok'
+            counter['retries'] += event['retries'] or 0
+            counter['bytes'] += event['bytes'] or 0
+
+    def totals(self):
+        with self.lock:
+            totals = dict.fromkeys(COUNTERS, 0)
+            for counter in self.counters.values():
+                for name, value in counter.items():
+                    totals[name] += value
+        return totals
+
+    def to_dict(self):
+        """ Counters of this process, operations with the most calls first """
+        with self.lock:
+            operations = [
+                OrderedDict(
+                    [('service', k[0]), ('operation', k[1]), ('region', k[2])] + list(v.items())
+                )
+                for k, v in sorted(self.counters.items(), key=lambda x: -x[1]['calls'])
+            ]
+        return OrderedDict([
+            ('command', self.command),
+            ('pid', os.getpid()),
+            ('started', self.started),
+            ('totals', self.totals()),
+            ('operations', operations)
+        ])
+
+    def dump(self, stream=None):
+        """ Writes the counters as json; to stderr to keep stdout output intact """
+        stream = stream or sys.stderr
+        stream.write(json.dumps(self.to_dict(), indent=4) + '\n')
+        stream.flush()
+
+    def samples(self):
+        """ Prometheus samples of this process: {(metric, labels): value} """
+        samples = {(RUNS[0], (('command', self.command),)): 1}
+        with self.lock:
+            for (service, operation, region), counter in self.counters.items():
+                labels = (
+                    ('command', self.command), ('operation', operation),
+                    ('region', region or ''), ('service', service)
+                )
+                for name, (metric, _) in COUNTERS.items():
+                    samples[(metric, labels)] = counter[name]
+        return samples
+
+
+def read_textfile(path):
+    """ Samples of a textfile written by write_textfile: {(metric, labels): value} """
+    samples = {}
+    try:
+        with open(path) as f1:
+            for line in f1:
+                match = SAMPLE.match(line.strip())
+                if match:
+                    labels = tuple(sorted(LABEL.findall(match.group(2))))
+                    samples[(match.group(1), labels)] = float(match.group(3))
+    except OSError:
+        pass
+    return samples
+
+
+def format_textfile(samples):
+    """ Prometheus text exposition format of samples, grouped by metric """
+    helps = dict(list(COUNTERS.values()) + [RUNS])
+    lines = []
+    for metric in sorted({x[0] for x in samples}):
+        lines.append('# HELP {} {}'.format(metric, helps.get(metric, metric)))
+        lines.append('# TYPE {} counter'.format(metric))
+        for (name, labels), value in sorted(samples.items()):
+            if name == metric:
+                label_str = ','.join('{}="{}"'.format(k, v) for k, v in labels)
+                lines.append('{}{{{}}} {}'.format(metric, label_str, int(value)))
+    return '\n'.join(lines) + '\n'
+
+
+def write_textfile(collector, directory):
+    """
+    Summary.
+
+        Adds the counters of a collector to the cumulative counters of
+        the textfile in directory.  The file is replaced atomically so the
+        textfile collector never reads a partial file.
+
+    Returns:
+        textfile path, TYPE: str
+
+    """
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, TEXTFILE_NAME)
+
+    with open(path + '.lock', 'w') as lock:
+        if fcntl:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+        samples = read_textfile(path)
+        for key, value in collector.samples().items():
+            samples[key] = samples.get(key, 0) + value
+        tmp_path = '{}.{}.tmp'.format(path, os.getpid())
+        with open(tmp_path, 'w') as f1:
+            f1.write(format_textfile(samples))
+        os.replace(tmp_path, path)
+    return path
+
+
+def _at_exit(collector, dump, textfile_dir):
+    if dump:
+        collector.dump()
+    if textfile_dir:
+        try:
+            write_textfile(collector, textfile_dir)
+        except OSError as e:
+            logger.warning('Unable to write prometheus textfile in {}: {}'.format(textfile_dir, e))
+
+
+def enable(command, dump=False):
+    """
+    Summary.
+
+        Starts counting api calls when --stats is given or the prometheus
+        textfile exporter is configured
+
+    Args:
+        :command (str): command name, the command label of exported counters
+        :dump (bool): write the counters as json to stderr at exit
+
+    Returns:
+        StatsCollector, or None when neither output is enabled
+
+    """
+    telemetry = local_config.get('TELEMETRY', {})
+    textfile_dir = None
+
+    if telemetry.get('PROMETHEUS_TEXTFILE'):
+        textfile_dir = telemetry.get(
+            'TEXTFILE_DIR', os.path.join(local_config['CONFIG']['CONFIG_DIR'], 'metrics')
+        )
+    if not (dump or textfile_dir):
+        return None
+
+    collector = StatsCollector(command)
+    session.add_sink(collector)
+    deadline.at_exit(_at_exit, collector, dump, textfile_dir)
+    return collector
@@ -0,0 +1,125 @@
+"""
+Summary.
+
+    Per-invocation timing report (--timings).  Collects the telemetry
+    events of ec2tools.session and, when the command exits, prints the
+    call count, total, p50 and p95 latency of every AWS api call per
+    (service, operation, region) and of command phases (discovery,
+    rendering, prompts, launch).  Calls made in worker processes
+    (profileaccount --profiles) are not included.
+
+"""
+
+import sys
+import math
+import time
+import threading
+from collections import defaultdict
+from veryprettytable import VeryPrettyTable
+from ec2tools import deadline, session
+
+
+def percentile(values, pct):
+    """
+    Summary.
+
+        Nearest-rank percentile of a list of values
+
+    >>> percentile([5, 1, 3, 2, 4], 50), percentile([5, 1, 3, 2, 4], 95)
+    (3, 5)
+    """
+    ordered = sorted(values)
+    return ordered[max(math.ceil(pct / 100 * len(ordered)) - 1, 0)]
+
+
+def summarize(durations):
+    """ count, total, p50, p95 of a list of durations (ms) """
+    return (
+        len(durations),
+        round(sum(durations), 1),
+        percentile(durations, 50),
+        percentile(durations, 95)
+    )
+
+
+class TimingCollector():
+    """
+    Summary.
+
+        Telemetry sink recording the duration of each api call and
+        command phase.  Thread safe; regions are profiled concurrently.
+
+    """
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.calls = defaultdict(list)
+        self.phases = defaultdict(list)
+        self.lock = threading.Lock()
+
+    def __call__(self, event):
+        if event.get('duration_ms') is None:
+            return
+        with self.lock:
+            if event['event'] == 'aws_call':
+                key = (event['service'], event['operation'], event['region'])
+                self.calls[key].append(event['duration_ms'])
+            elif event['event'] == 'span':
+                self.phases[event['phase']].append(event['duration_ms'])
+
+    def call_rows(self):
+        """ (service, operation, region, count, total, p50, p95), largest total first """
+        with self.lock:
+            rows = [k + summarize(v) for k, v in self.calls.items()]
+        return sorted(rows, key=lambda x: -x[4])
+
+    def phase_rows(self):
+        """ (phase, count, total, p50, p95), largest total first """
+        with self.lock:
+            rows = [(k,) + summarize(v) for k, v in self.phases.items()]
+        return sorted(rows, key=lambda x: -x[2])
+
+    def report(self, stream=None):
+        """ Prints the timing tables; written to stderr to keep stdout output intact """
+        stream = stream or sys.stderr
+        elapsed = round((time.perf_counter() - self.start) * 1000, 1)
+        calls, phases = self.call_rows(), self.phase_rows()
+
+        table = VeryPrettyTable(
+            ['Service', 'Operation', 'Region', 'Calls', 'Total ms', 'p50 ms', 'p95 ms']
+        )
+        for row in calls:
+            table.add_row(row)
+        table.align = 'r'
+        table.align['Operation'] = 'l'
+        stream.write('\n\tAWS API calls:\n\n' + table.get_string() + '\n')
+
+        if phases:
+            table = VeryPrettyTable(['Phase', 'Count', 'Total ms', 'p50 ms', 'p95 ms'])
+            for row in phases:
+                table.add_row(row)
+            table.align = 'r'
+            table.align['Phase'] = 'l'
+            stream.write('\n\tPhases:\n\n' + table.get_string() + '\n')
+
+        stream.write(
+            '\n\tWall clock: {} ms, {} AWS api calls ({} ms summed across threads)\n\n'.format(
+                elapsed, sum(x[3] for x in calls), round(sum(x[4] for x in calls), 1)
+            )
+        )
+        stream.flush()
+
+
+def enable():
+    """
+    Summary.
+
+        Starts collecting timings; the report is printed at exit
+
+    Returns:
+        TimingCollector
+
+    """
+    collector = TimingCollector()
+    session.add_sink(collector)
+    deadline.at_exit(collector.report)
+    return collector
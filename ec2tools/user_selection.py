@@ -13,6 +13,7 @@
 from pyaws.utils import stdout_message, userchoice_mapping
 from pyaws import Colors
 from ec2tools.statics import local_config
+from ec2tools.session import span
 from ec2tools import logd, __version__
 
 try:
@@ -45,6 +46,7 @@ def range_test(min, max, value):
     return False
 
 
+@span('prompt')
 def choose_resource(choices, selector='letters', default='a'):
     """
 
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+Summary.
+
+    Compares the cost of logging an error with the caller name taken from
+    inspect.stack() (message prefix) against the %(funcName)s field of the
+    ec2tools log formats, which the logging module fills in from the
+    calling frame when the record is created.
+
+    Usage:
+
+        $ python3 scripts/bench_logging.py [--depth 25] [--calls 2000]
+
+"""
+
+import io
+import inspect
+import logging
+import argparse
+import timeit
+
+
+FORMAT = '%(asctime)s - %(pathname)s - %(name)s - [%(levelname)s]: %(message)s'
+FUNCNAME_FORMAT = (
+    '%(asctime)s - %(pathname)s - %(name)s - [%(levelname)s]: %(funcName)s: %(message)s'
+)
+
+
+def memory_logger(name, fmt):
+    """ Logger writing to an in-memory stream """
+    handler = logging.StreamHandler(io.StringIO())
+    handler.setFormatter(logging.Formatter(fmt))
+    logger = logging.getLogger(name)
+    logger.handlers = [handler]
+    logger.propagate = False
+    logger.setLevel(logging.INFO)
+    return logger, handler.stream
+
+
+def nested(depth, fx):
+    """ Calls fx with depth additional frames on the stack """
+    if depth:
+        return nested(depth - 1, fx)
+    return fx()
+
+
+def options(argv=None):
+    parser = argparse.ArgumentParser(description='caller name capture benchmark')
+    parser.add_argument('--depth', type=int, default=25, help='stack depth of the failing call')
+    parser.add_argument('--calls', type=int, default=2000, help='failures logged per measurement')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = options(argv)
+    stack_logger, stack_out = memory_logger('bench.stack', FORMAT)
+    record_logger, record_out = memory_logger('bench.record', FUNCNAME_FORMAT)
+
+    def describe_images_stack():
+        try:
+            raise KeyError('ImageId')
+        except KeyError as e:
+            stack_logger.warning(
+                '%s: Boto error while retrieving AMI data (%s)' % (inspect.stack()[0][3], str(e))
+            )
+
+    def describe_images_record():
+        try:
+            raise KeyError('ImageId')
+        except KeyError as e:
+            record_logger.warning('Boto error while retrieving AMI data (%s)' % str(e))
+
+    results = []
+    for label, fx in (
+        ('inspect.stack()', describe_images_stack),
+        ('%(funcName)s', describe_images_record)
+    ):
+        elapsed = min(timeit.repeat(lambda: nested(args.depth, fx), number=args.calls, repeat=3))
+        results.append((label, elapsed / args.calls))
+
+    print('\nError path logging, stack depth {}, {} calls:\n'.format(args.depth, args.calls))
+    for label, per_call in results:
+        print('  {:<18} {:>10.1f} us/call'.format(label, per_call * 1e6))
+    print('\n  speedup: {:.0f}x\n'.format(results[0][1] / results[1][1]))
+
+    # both formats identify the failing function
+    print('  ' + stack_out.getvalue().splitlines()[-1].split(': ', 1)[1])
+    print('  ' + record_out.getvalue().splitlines()[-1].split(': ', 1)[1])
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
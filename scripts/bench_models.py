@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Summary.
+
+    Compares memory and lookup cost of account profile data held in the
+    .profile schema (lists of single-key dicts) with ec2tools.models
+    __slots__ records and id-keyed indexes.
+
+    Usage:
+
+        $ python3 scripts/bench_models.py [--subnets 20000] [--lookups 2000]
+
+"""
+
+import sys
+import json
+import random
+import argparse
+import timeit
+import tracemalloc
+from ec2tools.models import Subnet, SecurityGroup, load, index
+
+
+def synthetic_profile(subnets, sgs, vpcs=200, seed=7):
+    """ Subnet and securitygroup records in .profile schema """
+    rnd = random.Random(seed)
+    zones = ['us-east-1' + x for x in 'abcdef']
+    return (
+        [
+            {
+                'subnet-%017x' % rnd.getrandbits(68): {
+                    'AvailabilityZone': rnd.choice(zones),
+                    'CidrBlock': '10.%d.%d.0/24' % (i // 256 % 256, i % 256),
+                    'State': 'available',
+                    'IpAddresses': rnd.choice(['Public', 'Private']),
+                    'AvailableIpAddressCount': rnd.randint(0, 251),
+                    'VpcId': 'vpc-%017x' % rnd.randrange(vpcs)
+                }
+            } for i in range(subnets)
+        ],
+        [
+            {
+                'sg-%017x' % rnd.getrandbits(68): {
+                    'Description': 'securitygroup %d' % i,
+                    'GroupName': 'group-%d' % i,
+                    'VpcId': 'vpc-%017x' % rnd.randrange(vpcs)
+                }
+            } for i in range(sgs)
+        ]
+    )
+
+
+def measure(build):
+    """ Returns (object, bytes allocated) for the object built by build() """
+    tracemalloc.start()
+    obj = build()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return obj, size
+
+
+def build_models(text):
+    """ Id-keyed model indexes from .profile json text """
+    subnets, sgs = json.loads(text)
+    return index(load(Subnet, subnets)), index(load(SecurityGroup, sgs))
+
+
+def scan(records, rid):
+    """ Lookup as performed on the .profile schema: loop over row.items() """
+    for row in records:
+        for k, v in row.items():
+            if k == rid:
+                return v
+    return None
+
+
+def options(argv):
+    parser = argparse.ArgumentParser(prog='bench_models')
+    parser.add_argument('--subnets', type=int, default=20000)
+    parser.add_argument('--sgs', type=int, default=20000)
+    parser.add_argument('--lookups', type=int, default=2000)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = options(argv if argv is not None else sys.argv[1:])
+    raw_subnets, raw_sgs = synthetic_profile(args.subnets, args.sgs)
+    text = json.dumps([raw_subnets, raw_sgs])
+
+    # build both representations from identical source text so neither shares strings
+    dicts, dict_bytes = measure(lambda: json.loads(text))
+    models, model_bytes = measure(lambda: build_models(text))
+    subnet_ids = [next(iter(x)) for x in dicts[0]]
+    sample = random.Random(11).sample(subnet_ids, min(args.lookups, len(subnet_ids)))
+
+    scan_s = timeit.timeit(lambda: [scan(dicts[0], x) for x in sample], number=1)
+    index_s = timeit.timeit(lambda: [models[0][x] for x in sample], number=1)
+
+    assert [x.to_profile() for x in models[0].values()] == dicts[0]
+
+    print('records: {} subnets, {} securitygroups'.format(args.subnets, args.sgs))
+    print('{:<28}{:>14}{:>14}'.format('', '.profile dicts', 'models'))
+    print('{:<28}{:>14,}{:>14,}'.format('memory (bytes)', dict_bytes, model_bytes))
+    lookups = '{} subnet lookups (s)'.format(len(sample))
+    print('{:<28}{:>14.4f}{:>14.4f}'.format(lookups, scan_s, index_s))
+    print('memory reduction: {:.1%}'.format(1 - model_bytes / dict_bytes))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,368 @@
+#!/usr/bin/env python3
+"""
+Summary.
+
+    Performance benchmarks of the three console scripts against AWS
+    faked at scale by moto: machineimage (current_ami.main, all regions),
+    profileaccount (discovery.profile_account, all regions), and
+    runmachine resource discovery (subnet, securitygroup, keypair, and
+    instance profile listings of one region).  A synthetic estate
+    (scripts/estate.py) is seeded once; each benchmark then runs in a
+    forked process so that caches, rate limiters, and memory start
+    fresh.  Reported per benchmark: wall time (min, median, mean of
+    --rounds), AWS api calls and bytes per round, peak RSS and RSS growth
+    during the benchmark.
+
+    Results can be saved as a json baseline and later runs compared with
+    it; a run regresses when median wall time or RSS growth exceed the
+    baseline by more than --tolerance, or api calls increase.  moto
+    handles requests in process, so wall times include its request
+    handling; compare only with baselines of the same machine and moto
+    version.
+
+    Usage:
+
+        $ python3 scripts/benchmark.py [--scale 0.1] [--rounds 3]
+        $ python3 scripts/benchmark.py --save scripts/benchmark-baseline.json
+        $ python3 scripts/benchmark.py --compare scripts/benchmark-baseline.json
+
+    Baselines are machine specific and are not committed; record one
+    with --save (make benchmark SAVE=true) before comparing.  Requires
+    moto (pip install moto); ec2tools is imported from this repository.
+    The full scale estate needs several GB of memory; --scale 0.1 runs
+    in under a minute.  tests/test_benchmark.py runs the benchmarks on a
+    small estate under pytest.
+
+"""
+
+import io
+import os
+import sys
+import json
+import time
+import math
+import platform
+import argparse
+import datetime
+import resource
+import statistics
+import tempfile
+import threading
+import multiprocessing
+from collections import OrderedDict
+import estate
+
+# ec2tools of this repository (repository root); inherited by the forked benchmark processes
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+# full scale estate; every count is multiplied by --scale
+AMIS = 5000                 # images per owner per region
+SECURITYGROUPS = 10000      # account total
+SUBNETS = 5000              # account total
+KEYPAIRS = 500              # account total
+INSTANCE_PROFILES = 200
+REGIONS = 30
+
+# estate seed (scripts/estate.py); fixed so that runs compare
+SEED = 'benchmark'
+
+# runmachine discovery region; holds half of the securitygroups, subnets, and keypairs
+DISCOVERY_REGION = 'us-east-1'
+
+BENCHMARKS = ('machineimage', 'profileaccount', 'runmachine-discovery')
+
+# regression thresholds ignore differences below these floors
+MIN_SECONDS = 0.05
+MIN_RSS_MB = 5
+
+
+def scaled(count, scale):
+    return max(int(math.ceil(count * scale)), 1)
+
+
+def maxrss_mb():
+    """ Peak resident set size of this process in MB """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def serialize_moto():
+    """
+    moto's in-process request handling is not thread safe (shared
+    response serializer state); requests of concurrent region threads
+    are handled one at a time, as the GIL largely does anyway
+    """
+    from moto.core.botocore_stubber import BotocoreStubber
+
+    handle = BotocoreStubber.__call__
+    lock = threading.Lock()
+
+    def locked(self, *args, **kwargs):
+        with lock:
+            return handle(self, *args, **kwargs)
+
+    BotocoreStubber.__call__ = locked
+
+
+def benchmark_regions(count):
+    """ First count ec2 regions, the discovery region first """
+    return estate.estate_regions(count)
+
+
+def split(total, regions):
+    """ Resources per region: half in the discovery region, the rest evenly spread """
+    if len(regions) == 1:
+        return {regions[0]: total}
+    rest, others = total // 2, len(regions) - 1
+    share = {DISCOVERY_REGION: total - rest}
+    for index, region in enumerate(regions[1:]):
+        share[region] = rest // others + (index < rest % others)
+    return share
+
+
+def seed(args):
+    """ Populates the moto backends with a synthetic estate; returns the region codes seeded """
+    import boto3
+    from moto.core import DEFAULT_ACCOUNT_ID
+    from moto.ec2.models import ec2_backends
+
+    regions = benchmark_regions(args.regions)
+    subnets = split(scaled(SUBNETS, args.scale), regions)
+    securitygroups = split(scaled(SECURITYGROUPS, args.scale), regions)
+    keypairs = split(scaled(KEYPAIRS, args.scale), regions)
+    families = sorted({estate.family_of(x) for x in args.images})
+
+    for region in regions:
+        estate.add_images(
+            ec2_backends[DEFAULT_ACCOUNT_ID][region],
+            estate.image_records(SEED, region, families, scaled(AMIS, args.scale))
+        )
+        estate.create_network(
+            boto3.client('ec2', region_name=region),
+            estate.network_plan(
+                SEED, region, 1, subnets[region], securitygroups[region], keypairs[region]
+            )
+        )
+    estate.create_instance_profiles(
+        boto3.client('iam'), SEED, scaled(INSTANCE_PROFILES, args.scale)
+    )
+    return regions
+
+
+def machineimage(args):
+    from ec2tools import current_ami
+
+    for image in args.images:
+        current_ami.main(
+            profile='default', imagetype=image, format='json', details=False, debug=False
+        )
+
+
+def profileaccount(args):
+    from ec2tools import discovery
+    from ec2tools.jsonstream import JSONStreamWriter
+
+    writer = JSONStreamWriter(io.StringIO())
+    discovery.profile_account('default', writer=writer)
+    writer.close()
+
+
+def runmachine_discovery(args):
+    """
+    Resources listed by the runmachine prompts of one region.  The prompt
+    tables themselves are not built: their letter choices
+    (userchoice_mapping) end after 78 rows.
+    """
+    from ec2tools import launcher
+    from ec2tools.models import Subnet, SecurityGroup, KeyPair, InstanceProfile, load
+
+    load(Subnet, launcher.profile_subnets('default', DISCOVERY_REGION))
+    load(SecurityGroup, launcher.profile_securitygroups('default', DISCOVERY_REGION))
+    load(KeyPair, launcher.profile_keypairs('default', DISCOVERY_REGION)[DISCOVERY_REGION])
+    load(InstanceProfile, launcher.source_instanceprofiles('default'))
+
+
+def run_child(name, args, regions, conn):
+    """ Runs a benchmark in a forked process; sends its measurements through conn """
+    sys.stdout = open(os.devnull, 'w')
+
+    from ec2tools import regions as region_health, session, stats
+
+    # enabled regions are fixed to the regions seeded, keeping the user's cache untouched
+    cache = os.path.join(tempfile.mkdtemp(), 'regions.json')
+    with open(cache, 'w') as f1:
+        f1.write(json.dumps(
+            {'default': {'Enabled': regions, 'Checked': int(time.time()), 'Circuits': {}}}
+        ))
+    region_health._health['cache'] = region_health.RegionHealth(cache)
+
+    collector = stats.StatsCollector(name)
+    session.add_sink(collector)
+    target = {'machineimage': machineimage, 'profileaccount': profileaccount,
+              'runmachine-discovery': runmachine_discovery}[name]
+
+    rss_start = maxrss_mb()
+    durations = []
+    for _ in range(args.rounds):
+        start = time.perf_counter()
+        target(args)
+        durations.append(time.perf_counter() - start)
+
+    totals = collector.totals()
+    conn.send(OrderedDict([
+        ('rounds', args.rounds),
+        ('wall_min_s', round(min(durations), 4)),
+        ('wall_median_s', round(statistics.median(durations), 4)),
+        ('wall_mean_s', round(statistics.mean(durations), 4)),
+        ('api_calls', totals['calls'] // args.rounds),
+        ('api_errors', totals['errors'] // args.rounds),
+        ('bytes', totals['bytes'] // args.rounds),
+        ('peak_rss_mb', maxrss_mb()),
+        ('rss_growth_mb', round(maxrss_mb() - rss_start, 1))
+    ]))
+    conn.close()
+
+
+def run_isolated(name, args, regions):
+    context = multiprocessing.get_context('fork')
+    receiver, sender = context.Pipe(duplex=False)
+    process = context.Process(target=run_child, args=(name, args, regions, sender))
+    process.start()
+    sender.close()
+    try:
+        result = receiver.recv()
+    except EOFError:
+        result = None
+    process.join()
+    return result
+
+
+def compare(results, baseline, tolerance):
+    """
+    Summary.
+
+        Regressions of results relative to a baseline
+
+    Returns:
+        descriptions of regressions, TYPE: list
+
+    """
+    regressions = []
+    for name, result in results.items():
+        base = baseline['benchmarks'].get(name)
+        if not (base and result):
+            continue
+        if result['wall_median_s'] > base['wall_median_s'] * (1 + tolerance) + MIN_SECONDS:
+            regressions.append('{}: median wall time {}s, baseline {}s'.format(
+                name, result['wall_median_s'], base['wall_median_s']))
+        if result['api_calls'] > base['api_calls']:
+            regressions.append('{}: {} api calls, baseline {}'.format(
+                name, result['api_calls'], base['api_calls']))
+        if result['rss_growth_mb'] > base['rss_growth_mb'] * (1 + tolerance) + MIN_RSS_MB:
+            regressions.append('{}: rss growth {} MB, baseline {} MB'.format(
+                name, result['rss_growth_mb'], base['rss_growth_mb']))
+    return regressions
+
+
+def print_results(results, baseline=None):
+    fields = ('wall_median_s', 'api_calls', 'bytes', 'peak_rss_mb', 'rss_growth_mb')
+    print('\n  {:<22}'.format('benchmark') + ''.join('{:>16}'.format(x) for x in fields))
+    for name, result in results.items():
+        if result is None:
+            print('  {:<22}{:>16}'.format(name, 'FAILED'))
+            continue
+        print('  {:<22}'.format(name) + ''.join('{:>16}'.format(result[x]) for x in fields))
+        base = (baseline or {}).get('benchmarks', {}).get(name)
+        if base:
+            print('  {:<22}'.format('  baseline')
+                  + ''.join('{:>16}'.format(base.get(x, '')) for x in fields))
+    print('')
+
+
+def options(argv=None):
+    parser = argparse.ArgumentParser(description='ec2tools performance benchmarks (moto)')
+    parser.add_argument('--scale', type=float, default=1.0,
+                        help='fraction of the full scale estate')
+    parser.add_argument('--regions', type=int, default=REGIONS, help='number of regions seeded')
+    parser.add_argument('--images', nargs='+', default=['amazonlinux2'],
+                        help='image types looked up by machineimage (amazonlinux2, '
+                        'ubuntu18.04, ...); the family of images of each type is seeded')
+    parser.add_argument('--rounds', type=int, default=3, help='runs of each benchmark')
+    parser.add_argument('--benchmarks', nargs='+', default=list(BENCHMARKS), choices=BENCHMARKS)
+    parser.add_argument('--save', default=None, help='write results as a json baseline')
+    parser.add_argument('--compare', default=None, help='json baseline to compare results with')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='allowed fractional increase')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = options(argv)
+
+    if args.compare and not os.path.exists(args.compare):
+        sys.stderr.write(
+            '\n  No benchmark baseline at {0}.  Record one on this machine first:\n'
+            '      make benchmark SAVE=true\n'
+            '  or  python3 scripts/benchmark.py --save {0}\n\n'.format(args.compare)
+        )
+        return 2
+
+    # fake credentials; moto's default images are replaced by the seeded families
+    for key in ('AWS_ACCESS_KEY_ID', 'AWS_SECRET_ACCESS_KEY'):
+        os.environ[key] = 'benchmark'
+    os.environ['AWS_DEFAULT_REGION'] = DISCOVERY_REGION
+    os.environ['MOTO_EC2_LOAD_DEFAULT_AMIS'] = 'false'
+    for key in ('AWS_PROFILE', 'EC2TOOLS_RECORD', 'EC2TOOLS_REPLAY'):
+        os.environ.pop(key, None)
+
+    from moto import mock_aws
+    import moto
+
+    serialize_moto()
+    results = OrderedDict()
+    with mock_aws():
+        start = time.perf_counter()
+        regions = seed(args)
+        print('\n  Seeded {} regions (scale {}) in {:.1f}s, rss {} MB'.format(
+            len(regions), args.scale, time.perf_counter() - start, maxrss_mb()))
+
+        for name in args.benchmarks:
+            results[name] = run_isolated(name, args, regions)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f1:
+            baseline = json.loads(f1.read())
+        if baseline.get('scale') != args.scale or baseline.get('regions') != len(regions):
+            print('  WARNING: baseline scale {} / {} regions differs from this run'.format(
+                baseline.get('scale'), baseline.get('regions')))
+
+    print_results(results, baseline)
+
+    if None in results.values():
+        return 1
+
+    if args.save:
+        with open(args.save, 'w') as f1:
+            f1.write(json.dumps(OrderedDict([
+                ('created', datetime.datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%SZ')),
+                ('python', platform.python_version()),
+                ('moto', moto.__version__),
+                ('scale', args.scale),
+                ('regions', len(regions)),
+                ('images', args.images),
+                ('benchmarks', results)
+            ]), indent=4) + '\n')
+        print('  Baseline written to {}\n'.format(args.save))
+
+    if baseline:
+        regressions = compare(results, baseline, args.tolerance)
+        for regression in regressions:
+            print('  REGRESSION ' + regression)
+        print('  {} regressions (tolerance {:.0%})\n'.format(len(regressions), args.tolerance))
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
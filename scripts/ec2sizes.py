@@ -2,23 +2,29 @@
 """
 Summary.
 
-    Generates a list of all valid Amazon EC2 instance sizes
-    from most recent price file
+    Generates a list of all valid Amazon EC2 instance sizes and
+    the instance type catalog (catalog.db) and on-demand pricing index
+    (prices.idx) from the most recent price file of every region
 
 """
 
 import os
 import sys
-import json
+import sqlite3
 import datetime
 import subprocess
 import inspect
-import urllib.request
-import urllib.error
 import requests
+from urllib.parse import urlsplit
 from pyaws import Colors
 from pyaws.utils import stdout_message
 from init import logger
+from pricestream import products, sections
+
+# pricing index format is shared with the ec2tools package (repository root)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from ec2tools.pricing import write_index
+from httpfetch import Fetcher, IntegrityError
 
 try:
 
@@ -34,11 +40,36 @@
 
 MAX_AGE_DAYS = 10
 FORCE = False
+USE_MMAP = False            # --mmap: read price file through a memory map
 index_url = 'https://pricing.us-east-1.amazonaws.com/offers/v1.0/aws/index.json'
-index_url = 'https://pricing.us-east-1.amazonaws.com/offers/v1.0/aws/AmazonEC2/current/index.json'
 tmpdir = '/tmp'
+fetcher = Fetcher(tmpdir)       # one http client per run; json documents fetched once
 pricee_url = None
 output_filename = 'sizes.txt'
+catalog_filename = 'catalog.db'
+prices_filename = 'prices.idx'
+
+CATALOG_SCHEMA = """
+    CREATE TABLE instance_types (
+        instance_type TEXT PRIMARY KEY,
+        family TEXT,
+        size TEXT,
+        vcpu INTEGER,
+        memory REAL,
+        network TEXT,
+        architecture TEXT,
+        gpu INTEGER,
+        current_generation INTEGER
+    ) WITHOUT ROWID;
+    CREATE TABLE regions (
+        region TEXT,
+        instance_type TEXT,
+        PRIMARY KEY (region, instance_type)
+    ) WITHOUT ROWID;
+    CREATE TABLE metadata (key TEXT PRIMARY KEY, value TEXT);
+    CREATE INDEX ix_types_family ON instance_types (family);
+    CREATE INDEX ix_regions_type ON regions (instance_type);
+"""
 bdwt = Colors.BOLD + Colors.BRIGHT_WHITE
 yl = Colors.GOLD3
 rst = Colors.RESET
@@ -66,43 +97,25 @@ def download_fileobject(url, overwrite=False):
     """
     Summary.
 
-        Retrieve latest ec2 pricefile
+        Retrieve latest ec2 pricefile.  Downloads are conditional (ETag,
+        Last-Modified) and resume interrupted transfers; see httpfetch
 
     Args:
         :url (str): http/s universal resource locator
-        :overwrite (bool): flag optionally force overwrite of objects
-         previously downloaded
+        :overwrite (bool): revalidate objects previously downloaded with
+         the server, transferring them again only if changed
 
     Returns:
         path (str):  full fs path to downloaded file object
 
     """
-    def exists(object_path):
-        if os.path.exists(object_path):
-            return True
-        else:
-            msg = 'File object %s failed to download' % (object_path)
-            logger.warning(msg)
-            stdout_message('%s: %s' % (inspect.stack()[0][3], msg))
-            return False
-
     try:
-        filename = os.path.split(url)[1]
-        path = tmpdir + '/' + filename
-
-        if overwrite and exists(path):
-            os.remove(path)
-        elif not overwrite and exists(path):
-            return path
+        path = fetcher.fetch(url, revalidate=overwrite)
 
-        r = urllib.request.urlretrieve(url, path)
-        if not exists(path):
-            stdout_message(message=f'Failed to retrieve file object {path}', prefix='WARN')
-
-    except urllib.error.HTTPError as e:
+    except (requests.exceptions.RequestException, IntegrityError) as e:
         stdout_message(
-            message='%s: Failed to retrive file object: %s. Exception: %s, data: %s' %
-            (inspect.stack()[0][3], url, str(e), e.read()),
+            message='%s: Failed to retrive file object: %s. Exception: %s' %
+            (inspect.stack()[0][3], url, str(e)),
             prefix='WARN'
         )
         raise e
@@ -110,11 +123,8 @@ def exists(object_path):
 
 
 def eliminate_duplicates(d_list):
-    uniques = []
-    for record in d_list:
-        if record not in uniques and '.' in record:
-            uniques.append(record)
-    return uniques
+    """ Unique size types (family.size) in order of first appearance; O(n) """
+    return list(dict.fromkeys(x for x in d_list if '.' in x))
 
 
 def file_age(filepath, unit='seconds'):
@@ -140,35 +150,54 @@ def file_age(filepath, unit='seconds'):
     return round(delta.seconds, 2)
 
 
-def get_service_url(service, url=index_url):
+def get_service_url(service, url=index_url, region='us-east-1'):
+    """
+    Summary.
+
+        Retrieve the current offer file url of a service in one region
+
+    Args:
+        :url (str): universal resource locator for Amazon API Index file.
+            index file details the current url locations for retrieving the
+            most up to date API data files
+        :region (str): AWS region code
+    Returns:
+        Current URL of the regional price file (str), None if not found
+
+    """
+    return get_service_urls(service, url).get(region)
+
+
+def get_service_urls(service, url=index_url):
     """
     Summary.
 
-        Retrieve Amazon API Global Offer File (Service API Index) File
+        Retrieve the current offer file url of a service in every region
+        from the Amazon API Global Offer File (Service API Index) and the
+        service region index
 
     Args:
         :url (str): universal resource locator for Amazon API Index file.
             index file details the current url locations for retrieving the
             most up to date API data files
     Returns:
-        Current URL of EC2 Price file (str), Publication date (str)
+        {region code: current URL of the regional price file}, TYPE: dict
 
     """
-    url_prefix = 'https://pricing.us-east-1.amazonaws.com'
+    # offer file urls are relative to the host of the index file
+    url_prefix = '{0.scheme}://{0.netloc}'.format(urlsplit(url))
     converted_name = name_lookup(service, url)
 
     if not converted_name:
         logger.critical(
             f'{inspect.stack()[0][3]}: The boto3 service name provided could \
             not be found in the index file')
-        return None
+        return {}
 
-    r = requests.get(url)
-    f1 = json.loads(r.content)
+    f1 = fetcher.get_json(url)
     index_url = url_prefix + f1['offers'][converted_name]['currentRegionIndexUrl']
-    data = json.loads(requests.get(index_url).content)
-    url_suffix = data['regions']['us-east-1']['currentVersionUrl']
-    return url_prefix + url_suffix
+    data = fetcher.get_json(index_url)
+    return {k: url_prefix + v['currentVersionUrl'] for k, v in sorted(data['regions'].items())}
 
 
 def git_root():
@@ -198,10 +227,8 @@ def name_lookup(service, url=index_url):
     """
     key = None
 
-    r = requests.get(url)
-
     try:
-        for key in [x for x in json.loads(r.content)['offers']]:
+        for key in [x for x in fetcher.get_json(url)['offers']]:
             if (service.upper() or service.title()) in key:
                 return key
     except KeyError as e:
@@ -209,50 +236,44 @@ def name_lookup(service, url=index_url):
     return None
 
 
-def retrieve_raw_data(service_url):
+def retrieve_raw_data(service_url, use_mmap=False):
     """
     Summary.
 
-        Retrieve url of current ec2 price file
+        Retrieve current ec2 price file; products are parsed lazily
 
     Args:
         :service_url (str): universal resource locator for Amazon API Index file.
             index file details the current url locations for retrieving the
             most up to date API data files
+        :use_mmap (bool): read price file through a memory map
 
     Returns:
-        :data (json):  ec2 price api parsed data in json format
+        :data (generator):  (sku, product) pairs of the ec2 price file
 
     """
     file_path = tmpdir + '/' + 'index.json'
 
     try:
-        if not os.path.exists(file_path):
-            path = urllib.request.urlretrieve(service_url, file_path)[0]
-        else:
-            path = file_path
-
-        if os.path.exists(file_path) and path:
-            with open(path) as f1:
-                data = json.loads(f1.read())
-        else:
-            return None
-    except urllib.error.HTTPError as e:
+        path = fetcher.fetch(service_url, file_path)
+    except (requests.exceptions.RequestException, IntegrityError) as e:
         logger.exception(
-            '%s: Failed to retrive file object: %s. Exception: %s, data: %s' %
-            (inspect.stack()[0][3], file_path, str(e), e.read()))
+            '%s: Failed to retrive file object: %s. Exception: %s' %
+            (inspect.stack()[0][3], file_path, str(e)))
         raise e
-    return data
+    return products(path, use_mmap)
 
 
-def sizetypes(pricefile):
+def sizetypes(pricefile, use_mmap=False):
     """
     Summary.
 
-        Finds all EC2 size types in price file
+        Finds all EC2 size types in price file.  The price file is streamed
+        one product at a time; memory use is independent of file size.
 
     Args:
         :pricefile (str): complete path to file on local fs containing ec2 price data
+        :use_mmap (bool): read price file through a memory map
 
     Returns:
         size type list (list)
@@ -261,12 +282,9 @@ def sizetypes(pricefile):
     sizes = []
     count = 0
 
-    with open(pricefile) as f1:
-        f2 = json.loads(f1.read())
-
-    for sku in [x for x in f2['products']]:
+    for sku, product in products(pricefile, use_mmap):
         try:
-            sizes.append(f2['products'][sku]['attributes']['instanceType'])
+            sizes.append(product['attributes']['instanceType'])
             count += 1
         except KeyError:
             logger.info(f'No size type found at count {count}, sku {sku}')
@@ -274,6 +292,153 @@ def sizetypes(pricefile):
     return sizes
 
 
+def catalog_record(attributes):
+    """
+    Summary.
+
+        Catalog fields of an instance type from price file product attributes
+
+    Returns:
+        (instance_type, family, size, vcpu, memory, network, architecture,
+        gpu, current_generation), TYPE: tuple
+
+    """
+    def number(value, cast=int):
+        try:
+            return cast(str(value).split()[0].replace(',', ''))
+        except (ValueError, IndexError):
+            return None
+
+    name = attributes['instanceType']
+    family, size = name.split('.', 1)
+    processor = attributes.get('physicalProcessor', '')
+    return (
+        name,
+        family,
+        size,
+        number(attributes.get('vcpu')),
+        number(attributes.get('memory'), float),
+        attributes.get('networkPerformance'),
+        'arm64' if 'graviton' in processor.lower() else 'x86_64',
+        number(attributes.get('gpu')) or 0,
+        attributes.get('currentGeneration') == 'Yes'
+    )
+
+
+def scan_pricefile(pricefile, use_mmap=False):
+    """
+    Summary.
+
+        Collects instance type catalog records, regional availability, and
+        on-demand hourly prices in a single streaming pass over the price file
+
+    Args:
+        :pricefile (str): complete path to file on local fs containing ec2 price data
+        :use_mmap (bool): read price file through a memory map
+
+    Returns:
+        types {name: catalog record}, regions {(region, name)},
+        prices {(region, name, os, tenancy): hourly USD}, TYPE: tuple
+
+    """
+    types, regions, skus, prices = {}, set(), {}, {}
+    keys = (('products',), ('terms', 'OnDemand'))
+
+    for section, sku, value in sections(pricefile, keys, use_mmap):
+        if section == ('products',):
+            attrs = value.get('attributes', {})
+            compute = value.get('productFamily', '').startswith('Compute Instance')
+            if not compute or '.' not in attrs.get('instanceType', '.'):
+                continue
+            name = attrs['instanceType']
+            if name not in types:
+                types[name] = catalog_record(attrs)
+            # regionCode only; location holds display names ('US East (N. Virginia)')
+            region = attrs.get('regionCode')
+            if not region:
+                continue
+            regions.add((region, name))
+
+            # priced configurations: on-demand capacity, no preinstalled software or byol license
+            if (attrs.get('capacitystatus', 'Used') == 'Used'
+                    and attrs.get('preInstalledSw', 'NA') == 'NA'
+                    and 'Bring your own' not in attrs.get('licenseModel', '')):
+                key = (region, name, attrs.get('operatingSystem', ''), attrs.get('tenancy', ''))
+                skus[sku] = tuple(sys.intern(x) for x in key)
+        elif sku in skus:
+            for term in value.values():
+                for dimension in term.get('priceDimensions', {}).values():
+                    usd = dimension.get('pricePerUnit', {}).get('USD')
+                    if dimension.get('unit') == 'Hrs' and usd:
+                        key = skus[sku]
+                        prices[key] = min(float(usd), prices.get(key, float('inf')))
+    return types, regions, prices
+
+
+def scan_pricefiles(pricefiles, use_mmap=False):
+    """
+    Summary.
+
+        scan_pricefile over the regional price files of every region, merged
+        into one catalog, regional availability, and pricing index
+
+    Args:
+        :pricefiles (iterable): paths of regional price files
+        :use_mmap (bool): read price files through a memory map
+
+    Returns:
+        types, regions, prices as returned by scan_pricefile, TYPE: tuple
+
+    """
+    types, regions, prices = {}, set(), {}
+
+    for pricefile in pricefiles:
+        file_types, file_regions, file_prices = scan_pricefile(pricefile, use_mmap)
+        for name, record in file_types.items():
+            types.setdefault(name, record)
+        regions |= file_regions
+        for key, usd in file_prices.items():
+            prices[key] = min(usd, prices.get(key, float('inf')))
+    return types, regions, prices
+
+
+def write_catalog(path, types, regions):
+    """
+    Summary.
+
+        Creates the instance type catalog (SQLite).  The catalog is written
+        to a temporary file and moved into place when complete.
+
+    Args:
+        :path (str): catalog database path
+        :types (dict): {instance type: catalog record}
+        :regions (set): {(region, instance type)}
+
+    Returns:
+        instance type names, TYPE: list
+
+    """
+    tmp_path = path + '.tmp'
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+
+    conn = sqlite3.connect(tmp_path)
+    with conn:
+        conn.executescript(CATALOG_SCHEMA)
+        conn.executemany(
+            'INSERT INTO instance_types VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)', types.values()
+        )
+        conn.executemany('INSERT INTO regions VALUES (?, ?)', sorted(regions))
+        conn.execute(
+            'INSERT INTO metadata VALUES (?, ?)',
+            ('CreateDate', datetime.datetime.utcnow().isoformat())
+        )
+    conn.execute('VACUUM')
+    conn.close()
+    os.replace(tmp_path, path)
+    return sorted(types)
+
+
 def split_list(monolith, n):
     """
     Summary.
@@ -309,8 +474,13 @@ def write_sizetypes(path, types_list):
 if __name__ == '__main__':
 
     output_path = git_root() + '/bash/' + output_filename
+    catalog_path = git_root() + '/bash/' + catalog_filename
+    prices_path = git_root() + '/bash/' + prices_filename
+
+    args = [x for x in sys.argv[1:] if x != '--mmap']
+    USE_MMAP = len(args) < len(sys.argv[1:])
 
-    if len(sys.argv) > 1:
+    if args:
         FORCE = True
 
     if os.path.exists(output_path) and file_age(output_path, 'days') < MAX_AGE_DAYS and not FORCE:
@@ -329,21 +499,28 @@ def write_sizetypes(path, types_list):
         ## create new or refresh size types file  ##
         ############################################
 
-        # download, process index file
-        index_path = download_fileobject(index_url)
-        if index_path:
-            stdout_message(message=f'index file {index_url} downloaded successfully')
-
-        # download, process  price file
-        price_url = get_service_url('ec2')
+        # index files retrieved once (conditionally); locate the price file of each region
+        price_urls = get_service_urls('ec2')
+        stdout_message(
+            message=f'index file {index_url} retrieved successfully: {len(price_urls)} regions'
+        )
 
-        # download, process price file
-        price_file = download_fileobject(price_url, overwrite=True)
-        if price_file:
-            stdout_message(message=f'Price file {price_file} downloaded successfully')
+        def price_files():
+            for region, price_url in price_urls.items():
+                price_file = download_fileobject(price_url, overwrite=True)
+                stdout_message(
+                    message=f'Price file of {region} ({price_file}) downloaded successfully'
+                )
+                yield price_file
 
-        # generate new size type list; dedup list
-        current_sizetypes = eliminate_duplicates(sizetypes(price_file))
+        # generate instance type catalog, pricing index, and size type list; one pass per region
+        types, regions, prices = scan_pricefiles(price_files(), USE_MMAP)
+        current_sizetypes = write_catalog(catalog_path, types, regions)
+        stdout_message(
+            message=f'New EC2 instance type catalog ({catalog_path}) created successfully'
+        )
+        count = write_index(prices_path, prices)
+        stdout_message(message=f'New EC2 pricing index ({prices_path}) created with {count} prices')
 
         if write_sizetypes(output_path, sorted(current_sizetypes)):
             stdout_message(message=f'New EC2 sizetype file ({output_path}) created successfully')
@@ -0,0 +1,460 @@
+#!/usr/bin/env python3
+"""
+Summary.
+
+    Synthetic AWS estate generator for scale testing.  Builds an account
+    that looks like a real one: per region, vpcs with tagged subnets
+    (some public) spread over availability zones, securitygroups with
+    ingress rules (some open to 0.0.0.0/0), and keypairs; iam instance
+    profiles with roles; and machine image families named as the filters
+    of current_ami match (amzn-ami-hvm, amzn2-ami-hvm, CentOS, Fedora,
+    RHEL-*GA*, ubuntu/images/hvm-ssd, Windows_Server), mixed with images
+    of the same owners which the filters must skip.  The estate is
+    reproducible from --seed; each region is generated from the seed and
+    its region code alone, so adding regions leaves the others unchanged.
+
+    Targets:
+
+        amis:      writes the images as json for a moto server, which
+                   loads them into every region at start (MOTO_AMIS_PATH)
+        server:    creates the other resources through the api endpoint
+                   of a running moto server
+        cassette:  creates the estate in an in-process moto and records
+                   the AWS responses of machineimage and profileaccount
+                   lookups to a replay cassette (ec2tools.cassette)
+
+    Usage:
+
+        $ python3 scripts/estate.py --seed 7 --regions 4 amis --output amis.json
+        $ MOTO_AMIS_PATH=amis.json moto_server -p 5000 &
+        $ python3 scripts/estate.py --seed 7 --regions 4 server --endpoint http://localhost:5000
+
+        $ python3 scripts/estate.py --seed 7 --regions 4 cassette --output estate.cassette
+        $ EC2TOOLS_REPLAY=estate.cassette machineimage --image amazonlinux2
+
+    Requires moto for the amis and cassette targets and ec2tools
+    importable (installed, or PYTHONPATH set to the repository root) for
+    the cassette target.
+
+"""
+
+import io
+import os
+import re
+import sys
+import json
+import random
+import argparse
+import datetime
+from collections import OrderedDict
+
+
+# family: (owner id, owner alias, versions, matching name, skipped name)
+FAMILIES = OrderedDict([
+    ('amazonlinux1', (
+        '137112412989', 'amazon', ['2018.03.0'],
+        'amzn-ami-hvm-{version}.{date}-x86_64-gp2',
+        'amzn-ami-minimal-pv-{version}.{date}-x86_64-s3'
+    )),
+    ('amazonlinux2', (
+        '137112412989', 'amazon', ['2.0'],
+        'amzn2-ami-hvm-{version}.{date}.0-x86_64-gp2',
+        'amzn2-ami-minimal-hvm-{version}.{date}.0-arm64-ebs'
+    )),
+    ('centos', (
+        '679593333241', 'aws-marketplace', ['6', '7'],
+        'CentOS Linux {version} x86_64 HVM EBS ENA {date}',
+        'CentOS Atomic Host {version} aarch64 {date}'
+    )),
+    ('fedora', (
+        '125523088429', None, ['29', '30'],
+        'Fedora-Cloud-Base-{version}-{date}.0.x86_64-hvm-gp2-0',
+        'Fedora-Cloud-Base-{version}-{date}.0.aarch64-hvm-gp2-0'
+    )),
+    ('redhat', (
+        '309956199498', None, ['7.4', '7.5', '7.6'],
+        'RHEL-{version}_HVM_GA-{date}-x86_64-1-Hourly2-GP2',
+        'RHEL-{version}_HVM_BETA-{date}-x86_64-0-Hourly2-GP2'
+    )),
+    ('ubuntu', (
+        '099720109477', None, ['trusty-14.04', 'xenial-16.04', 'bionic-18.04'],
+        'ubuntu/images/hvm-ssd/ubuntu-{version}-amd64-server-{date}',
+        'ubuntu/images/ebs/ubuntu-{version}-amd64-server-{date}'
+    )),
+    ('windows', (
+        '801119661308', 'amazon', ['2012-R2_RTM', '2016'],
+        'Windows_Server-{version}-English-Full-Base-{date}',
+        'Windows_Server-{version}-Japanese-Full-SQL_2017_Web-{date}'
+    ))
+])
+
+# fraction of each family the current_ami filters must skip
+SKIPPED_FRACTION = 0.25
+
+# ingress rules: (protocol, from port, to port)
+PORTS = [
+    ('tcp', 22, 22), ('tcp', 80, 80), ('tcp', 443, 443), ('tcp', 3306, 3306),
+    ('tcp', 5432, 5432), ('tcp', 8080, 8080), ('tcp', 1024, 65535), ('udp', 53, 53),
+    ('icmp', -1, -1)
+]
+OPEN_FRACTION = 0.15        # rules open to 0.0.0.0/0
+PUBLIC_FRACTION = 0.3       # subnets assigning public ip addresses
+
+# imported as the material of every keypair, keeping fingerprints reproducible
+PUBLIC_KEY = (
+    'ssh-rsa AAAAB3NzaC1yc2EAAAADAQABAAABAQC/QIPplFYGDzIm4C7VwKVynxl+5fI8hsL3LRcUKVR9nlfuyA5j'
+    '3C1Poau7uIMAbAzVroD8Y0YZruvhEO/aHPlUWcpPTyuLN+r7ZdiSG4bNqasBgST2WcwdCbH9B1UeTOB9uVSWpAve'
+    'bKYaXG5Wp0sjtjf/7qxDv8VL/X/mTQFdOk+CCdfKAquiB5LokReHan1xwJIUx2ds8adChFGmKWCMfE4AUH/VDP73'
+    '1XZ/Zdc+tNkFeJ7Z73axaPvq4zvYOorxJlvUZc3Ui/bHyGZYCIkQB6ZYPXb9gs/2wvMlimnhiS4wQmD9pGvUzj8C'
+    'p9siegW6UsfjZFiSvTGugSVsRUup estate'
+)
+
+ASSUME_ROLE_POLICY = json.dumps({
+    'Version': '2012-10-17',
+    'Statement': [{
+        'Effect': 'Allow',
+        'Principal': {'Service': 'ec2.amazonaws.com'},
+        'Action': 'sts:AssumeRole'
+    }]
+})
+
+FIRST_REGION = 'us-east-1'
+
+
+def family_of(imagetype):
+    """ Image family of a machineimage --image type (ubuntu18.04: ubuntu) """
+    return next(x for x in FAMILIES if imagetype.startswith(x))
+
+
+def region_random(seed, region):
+    """ Random generator of a region, independent of the other regions generated """
+    return random.Random('{}:{}'.format(seed, region))
+
+
+def estate_regions(count):
+    """ First count ec2 regions in name order, us-east-1 first """
+    import boto3
+
+    regions = sorted(boto3.Session().get_available_regions('ec2'))
+    regions.remove(FIRST_REGION)
+    return [FIRST_REGION] + regions[:count - 1]
+
+
+def image_records(seed, region, families, count):
+    """
+    Summary.
+
+        Images of each family in a region, in the schema of moto's image
+        resource files (MOTO_AMIS_PATH)
+
+    Args:
+        :seed: estate seed
+        :region (str): region code
+        :families (list): family names, keys of FAMILIES
+        :count (int): images per family
+
+    Returns:
+        image records, TYPE: list
+
+    """
+    rnd = region_random(seed, region + ':images')
+    start = datetime.datetime(2017, 1, 1)
+    records = []
+
+    for family in families:
+        owner_id, owner_alias, versions, matching, skipped = FAMILIES[family]
+        for i in range(count):
+            created = start + datetime.timedelta(minutes=rnd.randrange(4 * 365 * 24 * 60))
+            template = skipped if rnd.random() < SKIPPED_FRACTION else matching
+            name = template.format(version=rnd.choice(versions), date=created.strftime('%Y%m%d'))
+            records.append(OrderedDict([
+                ('ami_id', 'ami-%017x' % rnd.getrandbits(68)),
+                ('name', name),
+                ('description', name),
+                ('owner_id', owner_id),
+                ('owner_alias', owner_alias),
+                ('public', True),
+                ('virtualization_type', 'hvm'),
+                ('architecture', 'arm64' if 'arm64' in name or 'aarch64' in name else 'x86_64'),
+                ('state', 'available'),
+                ('platform', 'windows' if family == 'windows' else None),
+                ('hypervisor', 'xen'),
+                ('root_device_name', '/dev/xvda'),
+                ('root_device_type', 'ebs'),
+                ('sriov', 'simple'),
+                ('creation_date', created.strftime('%Y-%m-%dT%H:%M:%S.000Z'))
+            ]))
+    return records
+
+
+def network_plan(seed, region, vpcs, subnets, securitygroups, keypairs, rules=(1, 6)):
+    """
+    Summary.
+
+        Vpcs, subnets, securitygroups with ingress rules, and keypairs of
+        a region.  Each vpc is a /16 holding up to 256 /24 subnets; vpcs
+        are added as needed to hold the subnets requested.
+
+    Args:
+        :rules (tuple): minimum, maximum ingress rules per securitygroup
+
+    Returns:
+        region plan, TYPE: dict
+
+    """
+    rnd = region_random(seed, region + ':network')
+    vpcs = max(vpcs, -(-subnets // 256), 1)
+    plan = {'Vpcs': [], 'Subnets': [], 'SecurityGroups': [], 'KeyPairs': []}
+
+    for v in range(vpcs):
+        plan['Vpcs'].append({
+            'Name': 'vpc-{}-{:02d}'.format(rnd.choice(['prod', 'stage', 'dev']), v),
+            'CidrBlock': '10.{}.0.0/16'.format(v)
+        })
+    for s in range(subnets):
+        plan['Subnets'].append({
+            'Vpc': s % vpcs,
+            'CidrBlock': '10.{}.{}.0/24'.format(s % vpcs, s // vpcs),
+            'Zone': rnd.randrange(64),
+            'Public': rnd.random() < PUBLIC_FRACTION,
+            'Name': 'subnet-{:05d}'.format(s)
+        })
+    for g in range(securitygroups):
+        permissions = set()
+        for _ in range(rnd.randint(*rules)):
+            protocol, from_port, to_port = rnd.choice(PORTS)
+            if rnd.random() < OPEN_FRACTION:
+                cidr = '0.0.0.0/0'
+            else:
+                cidr = rnd.choice([
+                    '10.0.0.0/8',
+                    '10.{}.{}.0/24'.format(rnd.randrange(256), rnd.randrange(256)),
+                    '203.0.113.{}/32'.format(rnd.randrange(256))
+                ])
+            permissions.add((protocol, from_port, to_port, cidr))
+        plan['SecurityGroups'].append({
+            'Vpc': rnd.randrange(vpcs),
+            'GroupName': 'sg-{}-{:05d}'.format(
+                rnd.choice(['web', 'db', 'app', 'bastion', 'cache']), g
+            ),
+            'Rules': sorted(permissions)
+        })
+    plan['KeyPairs'] = [
+        '{}-{:04d}'.format(rnd.choice(['deploy', 'admin', 'ci', 'ops']), k) for k in range(keypairs)
+    ]
+    return plan
+
+
+def tags(name):
+    return [{'Key': 'Name', 'Value': name}]
+
+
+def create_network(client, plan):
+    """ Creates the resources of a region plan through an ec2 client """
+    zones = [x['ZoneName'] for x in client.describe_availability_zones()['AvailabilityZones']]
+    vpc_ids = [
+        client.create_vpc(
+            CidrBlock=x['CidrBlock'],
+            TagSpecifications=[{'ResourceType': 'vpc', 'Tags': tags(x['Name'])}]
+        )['Vpc']['VpcId'] for x in plan['Vpcs']
+    ]
+    for subnet in plan['Subnets']:
+        subnet_id = client.create_subnet(
+            VpcId=vpc_ids[subnet['Vpc']], CidrBlock=subnet['CidrBlock'],
+            AvailabilityZone=zones[subnet['Zone'] % len(zones)],
+            TagSpecifications=[{'ResourceType': 'subnet', 'Tags': tags(subnet['Name'])}]
+        )['Subnet']['SubnetId']
+        if subnet['Public']:
+            client.modify_subnet_attribute(SubnetId=subnet_id, MapPublicIpOnLaunch={'Value': True})
+
+    for group in plan['SecurityGroups']:
+        group_id = client.create_security_group(
+            GroupName=group['GroupName'], Description='{} securitygroup'.format(group['GroupName']),
+            VpcId=vpc_ids[group['Vpc']]
+        )['GroupId']
+        if group['Rules']:
+            client.authorize_security_group_ingress(GroupId=group_id, IpPermissions=[
+                {'IpProtocol': p, 'FromPort': f, 'ToPort': t, 'IpRanges': [{'CidrIp': c}]}
+                for p, f, t, c in group['Rules']
+            ])
+    for name in plan['KeyPairs']:
+        client.import_key_pair(KeyName=name, PublicKeyMaterial=PUBLIC_KEY)
+
+
+def create_instance_profiles(iam, seed, count):
+    """ Instance profiles, each with a role of the same name """
+    rnd = region_random(seed, 'iam')
+    for i in range(count):
+        name = 'ec2-{}-{:04d}'.format(rnd.choice(['s3ops', 'logs', 'ssm', 'deploy', 'backup']), i)
+        iam.create_role(RoleName=name, AssumeRolePolicyDocument=ASSUME_ROLE_POLICY)
+        iam.create_instance_profile(InstanceProfileName=name)
+        iam.add_role_to_instance_profile(InstanceProfileName=name, RoleName=name)
+
+
+def add_images(backend, records):
+    """ Adds image records to the backend of an in-process moto region """
+    from moto.ec2.models.amis import Ami
+
+    for record in records:
+        image = dict(record, creation_date=datetime.datetime.strptime(
+            record['creation_date'], '%Y-%m-%dT%H:%M:%S.000Z'))
+        backend.amis[record['ami_id']] = Ami(backend, **image)
+
+
+def build(args, endpoint=None):
+    """
+    Summary.
+
+        Creates the estate, other than images, through boto3 clients of
+        an endpoint (moto server) or of the in-process moto
+
+    Returns:
+        region codes, TYPE: list
+
+    """
+    import boto3
+
+    regions = estate_regions(args.regions)
+    for region in regions:
+        plan = network_plan(
+            args.seed, region, args.vpcs, args.subnets, args.securitygroups, args.keypairs,
+            tuple(args.rules)
+        )
+        create_network(boto3.client('ec2', region_name=region, endpoint_url=endpoint), plan)
+    create_instance_profiles(
+        boto3.client('iam', endpoint_url=endpoint), args.seed, args.instance_profiles
+    )
+    return regions
+
+
+def restrict_regions(interactions, regions):
+    """ Recorded DescribeRegions responses listing the regions of the estate, all enabled """
+    item = re.compile(r'<item>((?:(?!</item>).)*)</item>', re.S)
+    name = re.compile(r'<regionName>([^<]+)</regionName>')
+    opt_in = re.compile(r'<optInStatus>[^<]*</optInStatus>')
+
+    def keep(match):
+        region = name.search(match.group(1))
+        if region is None or region.group(1) not in regions:
+            return ''
+        return opt_in.sub('<optInStatus>opt-in-not-required</optInStatus>', match.group(0))
+
+    for interaction in interactions:
+        if interaction['Operation'] == 'DescribeRegions':
+            interaction['Body'] = item.sub(keep, interaction['Body'])
+    return interactions
+
+
+def record_cassette(args):
+    """
+    Summary.
+
+        Creates the estate in an in-process moto and records the
+        responses of machineimage lookups of each image type given and
+        of profileaccount to a cassette
+
+    Returns:
+        cassette path, TYPE: str
+
+    """
+    from ec2tools import cassette, current_ami, discovery, regions as region_cache
+    from ec2tools.jsonstream import JSONStreamWriter
+
+    os.environ[cassette.RECORD_ENV] = args.output
+    os.environ['MOTO_EC2_LOAD_DEFAULT_AMIS'] = 'false'
+
+    from moto import mock_aws
+    from moto.core import DEFAULT_ACCOUNT_ID
+    from moto.ec2.models import ec2_backends
+
+    with mock_aws():
+        regions = build(args)
+        families = sorted({family_of(x) for x in args.images})
+        for region in regions:
+            add_images(
+                ec2_backends[DEFAULT_ACCOUNT_ID][region],
+                image_records(args.seed, region, families, args.amis)
+            )
+
+        # record the enabled regions as the estate's regions only, and look
+        # up only those while recording (moto enables every region)
+        recorder = cassette.active()
+        region_cache.enabled_regions('default')
+        restrict_regions(recorder.interactions, regions)
+        region_cache.region_health().data['default']['Enabled'] = sorted(regions)
+
+        stdout, sys.stdout = sys.stdout, io.StringIO()
+        try:
+            for imagetype in args.images:
+                current_ami.main(
+                    profile='default', imagetype=imagetype, format='json', details=False,
+                    debug=False
+                )
+            writer = JSONStreamWriter(io.StringIO())
+            discovery.profile_account('default', writer=writer)
+            writer.close()
+        finally:
+            sys.stdout = stdout
+
+        return cassette.write_cassette(args.output, recorder.interactions)
+
+
+def options(argv=None):
+    parser = argparse.ArgumentParser(description='synthetic AWS estate generator')
+    parser.add_argument('--seed', default='0',
+                        help='estate seed; equal seeds generate equal estates')
+    parser.add_argument('--regions', type=int, default=4, help='number of regions')
+    parser.add_argument('--vpcs', type=int, default=3,
+                        help='vpcs per region (more if needed for --subnets)')
+    parser.add_argument('--subnets', type=int, default=24, help='subnets per region')
+    parser.add_argument('--securitygroups', type=int, default=50, help='securitygroups per region')
+    parser.add_argument('--rules', type=int, nargs=2, default=[1, 6], metavar=('MIN', 'MAX'),
+                        help='ingress rules per securitygroup')
+    parser.add_argument('--keypairs', type=int, default=10, help='keypairs per region')
+    parser.add_argument('--instance-profiles', dest='instance_profiles', type=int, default=20)
+    parser.add_argument('--amis', type=int, default=200, help='images per family per region')
+    parser.add_argument('--families', nargs='+', default=list(FAMILIES), choices=list(FAMILIES),
+                        help='image families (amis target)')
+
+    targets = parser.add_subparsers(dest='target')
+    targets.required = True
+    amis = targets.add_parser('amis', help='write images as json for MOTO_AMIS_PATH')
+    amis.add_argument('--output', required=True)
+    server = targets.add_parser('server', help='create resources through a moto server endpoint')
+    server.add_argument('--endpoint', required=True)
+    cassette = targets.add_parser('cassette',
+                                  help='record machineimage and profileaccount responses')
+    cassette.add_argument('--output', required=True)
+    cassette.add_argument('--images', nargs='+', default=['amazonlinux2'],
+                          help='machineimage --image types recorded '
+                               '(amazonlinux2, ubuntu18.04, ...)')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = options(argv)
+
+    if args.target == 'amis':
+        # a moto server loads the same images into every region
+        records = image_records(args.seed, 'moto-server', args.families, args.amis)
+        with open(args.output, 'w') as f1:
+            f1.write(json.dumps(records, indent=2))
+        print('{} images written to {}'.format(len(records), args.output))
+
+    elif args.target == 'server':
+        for key in ('AWS_ACCESS_KEY_ID', 'AWS_SECRET_ACCESS_KEY'):
+            os.environ.setdefault(key, 'estate')
+        regions = build(args, endpoint=args.endpoint)
+        print('Estate created in {} regions at {}'.format(len(regions), args.endpoint))
+
+    elif args.target == 'cassette':
+        for key in ('AWS_ACCESS_KEY_ID', 'AWS_SECRET_ACCESS_KEY'):
+            os.environ[key] = 'estate'
+        os.environ.setdefault('AWS_DEFAULT_REGION', FIRST_REGION)
+        path = record_cassette(args)
+        print('Cassette written to {}'.format(path))
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
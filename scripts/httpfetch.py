@@ -0,0 +1,163 @@
+"""
+Summary.
+
+    Conditional, resumable http downloads.  Validators (ETag,
+    Last-Modified) of each download are kept in a json sidecar file
+    (<path>.meta) and sent with later requests so unchanged files are not
+    transferred again.  Interrupted downloads continue from a <path>.part
+    file with a Range request.  Completed downloads are checked against
+    the expected length and, when the ETag is a plain md5 digest (single
+    part S3 objects), against the digest.
+
+"""
+
+import os
+import re
+import json
+import hashlib
+import requests
+
+
+CHUNK_SIZE = 1024 * 1024
+TIMEOUT = (10, 60)          # connect, read (seconds)
+MD5_ETAG = re.compile(r'^"?([0-9a-f]{32})"?$')
+
+
+class IntegrityError(Exception):
+    """ Downloaded content does not match the length or digest advertised """
+    pass
+
+
+class Fetcher():
+    """
+    Summary.
+
+        Http client with conditional and resumable file downloads and a
+        per-instance cache of json documents
+
+    Args:
+        :cachedir (str): directory downloads are written to
+        :session (requests.Session): optional preconfigured session
+
+    """
+    def __init__(self, cachedir='/tmp', session=None, chunk_size=CHUNK_SIZE):
+        self.cachedir = cachedir
+        self.session = session or requests.Session()
+        self.chunk_size = chunk_size
+        self.documents = {}
+        self.transferred = 0        # bytes received, all downloads
+
+    def _meta(self, path):
+        try:
+            with open(path + '.meta') as f1:
+                return json.loads(f1.read())
+        except (OSError, ValueError):
+            return {}
+
+    def _write_meta(self, path, meta):
+        with open(path + '.meta', 'w') as f1:
+            f1.write(json.dumps(meta, indent=4))
+
+    def path(self, url):
+        """ Local path of the download of url; unique per url (offer files share names) """
+        digest = hashlib.sha1(url.encode('utf-8')).hexdigest()[:12]
+        return os.path.join(self.cachedir, '{}-{}'.format(digest, os.path.split(url)[1]))
+
+    def fetch(self, url, path=None, revalidate=True):
+        """
+        Summary.
+
+            Downloads url to path unless the local copy is current
+
+        Args:
+            :url (str): http/s universal resource locator
+            :path (str): local file path.  Default: cachedir/<url filename>
+            :revalidate (bool): when False, a complete local copy is used
+                without contacting the server
+
+        Returns:
+            path (str), local path of current content
+
+        """
+        path = path or self.path(url)
+        meta = self._meta(path)
+        part = path + '.part'
+        # byte ranges, lengths, and digests of the content stored
+        headers = {'Accept-Encoding': 'identity'}
+        complete = os.path.exists(path) and meta.get('size') == os.path.getsize(path)
+
+        if complete and meta.get('url') == url:
+            if not revalidate:
+                return path
+            if meta.get('etag'):
+                headers['If-None-Match'] = meta['etag']
+            if meta.get('last_modified'):
+                headers['If-Modified-Since'] = meta['last_modified']
+
+        elif os.path.exists(part) and meta.get('url') == url and self._validator(meta):
+            # resume only if the server object is unchanged since the partial transfer began
+            headers['Range'] = 'bytes={}-'.format(os.path.getsize(part))
+            headers['If-Range'] = self._validator(meta)
+
+        with self.session.get(url, headers=headers, stream=True, timeout=TIMEOUT) as r:
+            if r.status_code == 304:
+                return path
+            if r.status_code == 416 and 'Range' in headers:
+                os.remove(part)
+                return self.fetch(url, path, revalidate)
+            r.raise_for_status()
+
+            meta = {
+                'url': url,
+                'etag': r.headers.get('ETag'),
+                'last_modified': r.headers.get('Last-Modified')
+            }
+            resumed = r.status_code == 206
+            expected = self._expected_length(r, part if resumed else None)
+            self._write_meta(path, meta)
+
+            with open(part, 'ab' if resumed else 'wb') as f1:
+                for chunk in r.iter_content(self.chunk_size):
+                    f1.write(chunk)
+                    self.transferred += len(chunk)
+
+        self._verify(part, expected, meta['etag'])
+        os.replace(part, path)
+        meta['size'] = os.path.getsize(path)
+        self._write_meta(path, meta)
+        return path
+
+    def _validator(self, meta):
+        """ If-Range value: strong ETag, else Last-Modified, else None """
+        etag = meta.get('etag') or ''
+        return etag if etag.startswith('"') else meta.get('last_modified')
+
+    def _expected_length(self, response, part=None):
+        """ Total length of the object, or None when not advertised """
+        if part:
+            total = response.headers.get('Content-Range', '').rpartition('/')[2]
+            return int(total) if total.isdigit() else None
+        length = response.headers.get('Content-Length')
+        return int(length) if length and length.isdigit() else None
+
+    def _verify(self, path, expected, etag):
+        size = os.path.getsize(path)
+        if expected is not None and size != expected:
+            raise IntegrityError('{}: received {} of {} bytes'.format(path, size, expected))
+
+        match = MD5_ETAG.match(etag or '')
+        if match:
+            digest = hashlib.md5()
+            with open(path, 'rb') as f1:
+                for chunk in iter(lambda: f1.read(self.chunk_size), b''):
+                    digest.update(chunk)
+            if digest.hexdigest() != match.group(1):
+                os.remove(path)
+                raise IntegrityError('{}: md5 digest does not match ETag {}'.format(path, etag))
+
+    def get_json(self, url, path=None):
+        """ Json document at url; (conditionally) downloaded once per Fetcher """
+        if url not in self.documents:
+            with open(self.fetch(url, path)) as f1:
+                self.documents[url] = json.loads(f1.read())
+        return self.documents[url]
@@ -0,0 +1,235 @@
+"""
+Summary.
+
+    Streaming parser for Amazon price list (offer) files.  Walks the
+    top-level "products" object one product at a time, so multi-gigabyte
+    EC2 offer files are processed in constant memory.  Input is read in
+    fixed size chunks from a regular file or, optionally, a read-only
+    memory map.
+
+    >>> import io
+    >>> doc = (b'{"version": "1", "products": '
+    ...        b'{"A": {"attributes": {"instanceType": "t3.micro"}}, "B": {}}}')
+    >>> [(sku, p.get('attributes')) for sku, p in iter_products(io.BytesIO(doc), chunk_size=7)]
+    [('A', {'instanceType': 't3.micro'}), ('B', None)]
+
+"""
+
+import re
+import json
+import mmap
+import codecs
+from contextlib import contextmanager
+
+
+CHUNK_SIZE = 1024 * 1024    # bytes read per refill
+WHITESPACE = re.compile(r'[ \t\r\n]*')
+
+
+class _StreamReader():
+    """ Buffered, incrementally decoded json token reader over a binary file object """
+
+    def __init__(self, fileobj, chunk_size=CHUNK_SIZE):
+        self.fileobj = fileobj
+        self.chunk_size = chunk_size
+        self.decoder = json.JSONDecoder()
+        self.utf8 = codecs.getincrementaldecoder('utf-8')()
+        self.buf = ''
+        self.pos = 0
+        self.eof = False
+
+    def fill(self):
+        """ Appends the next chunk to the unread buffer; False at end of input """
+        if self.eof:
+            return False
+        data = self.fileobj.read(self.chunk_size)
+        self.eof = not data
+        self.buf = self.buf[self.pos:] + self.utf8.decode(data, final=self.eof)
+        self.pos = 0
+        return not self.eof
+
+    def peek(self):
+        """ Next non-whitespace character, not consumed; '' at end of input """
+        while True:
+            self.pos = WHITESPACE.match(self.buf, self.pos).end()
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self.fill():
+                return ''
+
+    def expect(self, char):
+        found = self.peek()
+        if found != char:
+            raise ValueError('Expected {!r} at offset {}, found {!r}'.format(char, self.pos, found))
+        self.pos += 1
+
+    def value(self):
+        """ Decodes and consumes the next complete json value """
+        self.peek()
+        while True:
+            try:
+                obj, end = self.decoder.raw_decode(self.buf, self.pos)
+                # a number ending at the buffer boundary may continue in the next chunk
+                if end < len(self.buf) or self.eof:
+                    self.pos = end
+                    return obj
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            self.fill()
+
+    def skip(self):
+        """ Consumes the next json value without building it; constant memory """
+        char = self.peek()
+        if char not in ('{', '['):
+            self.value()
+            return
+        close = '}' if char == '{' else ']'
+        self.pos += 1
+        while self.peek() != close:
+            if close == '}':
+                self.value()
+                self.expect(':')
+            self.skip()
+            if self.peek() == ',':
+                self.expect(',')
+        self.expect(close)
+
+
+def _entries(reader):
+    """ Yields key, value of each member of the json object at the reader position """
+    reader.expect('{')
+    while reader.peek() != '}':
+        key = reader.value()
+        reader.expect(':')
+        yield key, reader.value()
+        if reader.peek() == ',':
+            reader.expect(',')
+    reader.expect('}')
+
+
+def iter_sections(fileobj, sections, chunk_size=CHUNK_SIZE):
+    """
+    Summary.
+
+        Yields members of nested objects of an offer file in a single
+        pass, e.g. sections (('products',), ('terms', 'OnDemand')).  Other
+        values are skipped without being built; reading stops once every
+        section has been read.
+
+    Args:
+        :fileobj (file): binary file object (or mmap) positioned at the start
+        :sections (tuple): key paths of the objects to stream
+        :chunk_size (int): bytes read per buffer refill
+
+    Yields:
+        section (tuple), key (str), value
+
+    """
+    reader = _StreamReader(fileobj, chunk_size)
+    pending = set(sections)
+
+    def walk(path):
+        reader.expect('{')
+        while pending and reader.peek() != '}':
+            key = reader.value()
+            reader.expect(':')
+            current = path + (key,)
+            if current in pending:
+                yield from ((current, k, v) for k, v in _entries(reader))
+                pending.discard(current)
+            elif any(x[:len(current)] == current for x in pending):
+                yield from walk(current)
+            else:
+                reader.skip()
+            if reader.peek() == ',':
+                reader.expect(',')
+        if pending:
+            reader.expect('}')
+
+    yield from walk(())
+
+
+def iter_products(fileobj, chunk_size=CHUNK_SIZE):
+    """
+    Summary.
+
+        Yields (sku, product) pairs from the products object of an offer
+        file.  Keys following products (terms) are never read.
+
+    Args:
+        :fileobj (file): binary file object (or mmap) positioned at the start
+        :chunk_size (int): bytes read per buffer refill
+
+    Yields:
+        sku (str), product (dict)
+
+    """
+    for _, sku, product in iter_sections(fileobj, (('products',),), chunk_size):
+        yield sku, product
+
+
+@contextmanager
+def open_pricefile(path, use_mmap=False):
+    """ Opens a price file for binary reading, optionally memory mapped """
+    with open(path, 'rb') as f1:
+        if not use_mmap:
+            yield f1
+            return
+        mm = mmap.mmap(f1.fileno(), 0, access=mmap.ACCESS_READ)
+        if hasattr(mm, 'madvise'):
+            mm.madvise(mmap.MADV_SEQUENTIAL)
+        try:
+            yield mm
+        finally:
+            mm.close()
+
+
+def products(path, use_mmap=False, chunk_size=CHUNK_SIZE):
+    """
+    Summary.
+
+        Yields (sku, product) pairs of the price file at path
+
+    Args:
+        :path (str): local price file
+        :use_mmap (bool): read through a read-only memory map
+        :chunk_size (int): bytes decoded per buffer refill
+
+    """
+    with open_pricefile(path, use_mmap) as f1:
+        yield from iter_products(f1, chunk_size)
+
+
+def sections(path, keys, use_mmap=False, chunk_size=CHUNK_SIZE):
+    """
+    Summary.
+
+        Yields (section, key, value) members of the sections of the price
+        file at path; see iter_sections
+
+    """
+    with open_pricefile(path, use_mmap) as f1:
+        yield from iter_sections(f1, keys, chunk_size)
+
+
+def attributes(path, fields, use_mmap=False):
+    """
+    Summary.
+
+        Yields selected attributes of each product which has all of them
+
+    Args:
+        :path (str): local price file
+        :fields (tuple): attribute names (instanceType, operatingSystem, ...)
+
+    Yields:
+        sku (str), attribute values (tuple)
+
+    """
+    for sku, product in products(path, use_mmap):
+        attrs = product.get('attributes', {})
+        try:
+            yield sku, tuple(attrs[x] for x in fields)
+        except KeyError:
+            continue
@@ -227,7 +227,13 @@ def user_home():
         ),
         (
             user_home() + '/' + '.config/' + _package,
-            ['bash/iam_identities.py', 'bash/regions.py', 'bash/sizes.txt']
+            [
+                x for x in [
+                    'bash/iam_identities.py', 'bash/regions.py', 'bash/sizes.txt',
+                    'bash/catalog.db', 'bash/prices.idx'
+                ]
+                if os.path.exists(os.path.join(_root, x))
+            ]
         )
     ],
     entry_points={
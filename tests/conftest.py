@@ -0,0 +1,120 @@
+"""
+Summary.
+
+    Shared fixtures.  http_server serves canned responses from a local
+    http.server on a background thread, standing in for S3 and the AWS
+    pricing endpoints.  Like S3, it answers conditional requests
+    (If-None-Match, If-Modified-Since) of unchanged objects with 304 and
+    byte range requests (Range, If-Range) with 206 or 416.
+
+"""
+
+import os
+import re
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for path in (ROOT, os.path.join(ROOT, 'scripts'), os.path.join(ROOT, 'userdata')):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+
+def conditional(status, headers, body, request):
+    """ Response to a conditional or range request of an object (status 200, headers, body) """
+    etag, modified = headers.get('ETag'), headers.get('Last-Modified')
+
+    if (etag and request.get('If-None-Match') == etag) or (
+            modified and not etag and request.get('If-Modified-Since') == modified):
+        return 304, headers, b''
+
+    match = re.match(r'^bytes=(\d+)-$', request.get('Range', ''))
+    if_range = request.get('If-Range')
+    if match and (if_range is None or if_range in (etag, modified)):
+        start = int(match.group(1))
+        if start >= len(body):
+            headers['Content-Range'] = 'bytes */{}'.format(len(body))
+            return 416, headers, b''
+        headers['Content-Range'] = 'bytes {}-{}/{}'.format(start, len(body) - 1, len(body))
+        return 206, headers, body[start:]
+    return status, headers, body
+
+
+class LocalServer():
+    """
+    Summary.
+
+        Canned http responses by path, with a record of the requests and
+        client connections served
+
+    Attributes:
+        :routes (dict): {path: (status, headers (dict), body (bytes))}, or
+            {path: [responses]} answered in turn, the last repeating.
+            Conditional and range requests apply to 200 responses; others
+            are sent as given
+        :requests (list): paths requested, in order
+        :headers (list): request headers (dict) of each request, in order
+        :connections (set): client (host, port) pairs seen
+
+    """
+    def __init__(self):
+        self.routes = {}
+        self.requests = []
+        self.headers = []
+        self.connections = set()
+        self.lock = threading.Lock()
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), self._handler())
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+
+    @property
+    def url(self):
+        return 'http://127.0.0.1:{}'.format(self.httpd.server_address[1])
+
+    def response(self, path, headers):
+        with self.lock:
+            self.requests.append(path)
+            self.headers.append(headers)
+            route = self.routes.get(path, (404, {}, b''))
+            if isinstance(route, list):
+                route = route.pop(0) if len(route) > 1 else route[0]
+        status, response_headers, body = route
+        if status != 200:
+            return route
+        return conditional(status, dict(response_headers), body, headers)
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'       # keep-alive
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                with server.lock:
+                    server.connections.add(self.client_address)
+                status, headers, body = server.response(self.path, dict(self.headers))
+                self.send_response(status)
+                for k, v in headers.items():
+                    self.send_header(k, v)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        return Handler
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+@pytest.fixture
+def http_server():
+    server = LocalServer()
+    yield server
+    server.close()
@@ -0,0 +1,63 @@
+"""
+Summary.
+
+    scripts/benchmark.py on a small moto estate: every benchmark runs,
+    baselines are written and compared, and regressions are reported.
+    Skipped when moto is not installed.
+
+"""
+
+import json
+import pytest
+import benchmark
+
+
+def result(wall=1.0, calls=10, growth=10.0):
+    return {'wall_median_s': wall, 'api_calls': calls, 'rss_growth_mb': growth}
+
+
+def test_compare():
+    baseline = {'benchmarks': {'machineimage': result(), 'profileaccount': result()}}
+    results = {
+        'machineimage': result(wall=1.2, calls=10, growth=14.0),
+        'profileaccount': result(wall=2.0, calls=11, growth=40.0),
+        'runmachine-discovery': result()
+    }
+    regressions = benchmark.compare(results, baseline, tolerance=0.25)
+    assert regressions == [
+        'profileaccount: median wall time 2.0s, baseline 1.0s',
+        'profileaccount: 11 api calls, baseline 10',
+        'profileaccount: rss growth 40.0 MB, baseline 10.0 MB'
+    ]
+
+
+def test_missing_baseline(tmp_path, capsys):
+    assert benchmark.main(['--compare', str(tmp_path / 'baseline.json')]) == 2
+    assert 'make benchmark SAVE=true' in capsys.readouterr().err
+
+
+@pytest.fixture
+def environment(monkeypatch):
+    """ environment variables set by benchmark.main, restored afterwards """
+    pytest.importorskip('moto')
+    for key in ('AWS_ACCESS_KEY_ID', 'AWS_SECRET_ACCESS_KEY', 'AWS_DEFAULT_REGION',
+                'MOTO_EC2_LOAD_DEFAULT_AMIS'):
+        monkeypatch.setenv(key, '')
+    for key in ('AWS_PROFILE', 'EC2TOOLS_RECORD', 'EC2TOOLS_REPLAY'):
+        monkeypatch.delenv(key, raising=False)
+
+
+def test_small_estate(environment, tmp_path):
+    path = str(tmp_path / 'baseline.json')
+    argv = ['--scale', '0.005', '--regions', '2', '--rounds', '1']
+
+    assert benchmark.main(argv + ['--save', path]) == 0
+    with open(path) as f1:
+        baseline = json.loads(f1.read())
+    assert sorted(baseline['benchmarks']) == sorted(benchmark.BENCHMARKS)
+    for name, measured in baseline['benchmarks'].items():
+        assert measured['api_calls'] > 0, name
+        assert measured['api_errors'] == 0, name
+
+    # api call counts are deterministic; timings are not compared at this scale
+    assert benchmark.main(argv + ['--compare', path, '--tolerance', '100']) == 0
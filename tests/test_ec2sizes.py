@@ -0,0 +1,151 @@
+"""
+Summary.
+
+    scripts/ec2sizes.py against a local stand-in for the AWS pricing
+    endpoint: offer index, region index, and one canned EC2 price file
+    per region
+
+"""
+
+import json
+import pytest
+from ec2tools.catalog import Catalog
+from ec2tools.pricing import PriceIndex, write_index
+
+
+INDEX_PATH = '/offers/v1.0/aws/index.json'
+REGION_INDEX_PATH = '/offers/v1.0/aws/AmazonEC2/current/region_index.json'
+PRICEFILE_PATH = '/offers/v1.0/aws/AmazonEC2/20240101000000/{}/index.json'
+
+
+def product(instance_type, region, vcpu, memory, processor='Intel Xeon'):
+    return {
+        'productFamily': 'Compute Instance',
+        'attributes': {
+            'instanceType': instance_type,
+            'regionCode': region,
+            'vcpu': str(vcpu),
+            'memory': '{} GiB'.format(memory),
+            'networkPerformance': 'Up to 5 Gigabit',
+            'physicalProcessor': processor,
+            'currentGeneration': 'Yes',
+            'operatingSystem': 'Linux',
+            'tenancy': 'Shared',
+            'capacitystatus': 'Used',
+            'preInstalledSw': 'NA',
+            'licenseModel': 'No License required'
+        }
+    }
+
+
+def unlocated(record):
+    """ product of an older price file: location display name, no regionCode """
+    record['attributes']['location'] = 'EU (Ireland)'
+    del record['attributes']['regionCode']
+    return record
+
+
+def ondemand(usd):
+    return {'term': {'priceDimensions': {'dim': {'unit': 'Hrs', 'pricePerUnit': {'USD': usd}}}}}
+
+
+# one offer file per region, as published by AWS
+PRICEFILES = {
+    'us-east-1': {
+        'formatVersion': 'v1.0',
+        'products': {
+            'SKU1': product('m6i.large', 'us-east-1', 2, 8),
+            'SKU3': product('t4g.micro', 'us-east-1', 2, 1, 'AWS Graviton2 Processor'),
+            'SKU4': {'productFamily': 'Storage', 'attributes': {'volumeType': 'gp3'}}
+        },
+        'terms': {
+            'OnDemand': {
+                'SKU1': ondemand('0.0960000000'),
+                'SKU3': ondemand('0.0084000000')
+            }
+        }
+    },
+    'eu-west-1': {
+        'formatVersion': 'v1.0',
+        'products': {
+            'SKU2': product('m6i.large', 'eu-west-1', 2, 8),
+            'SKU5': product('c6g.xlarge', 'eu-west-1', 4, 8, 'AWS Graviton2 Processor'),
+            'SKU6': unlocated(product('r6i.large', 'eu-west-1', 2, 16))
+        },
+        'terms': {
+            'OnDemand': {
+                'SKU2': ondemand('0.1070000000'),
+                'SKU5': ondemand('0.1550000000')
+            }
+        }
+    }
+}
+
+
+@pytest.fixture
+def ec2sizes(http_server, tmp_path, monkeypatch):
+    import ec2sizes
+    from httpfetch import Fetcher
+
+    def document(doc):
+        return (200, {'Content-Type': 'application/json'}, json.dumps(doc).encode('utf-8'))
+
+    http_server.routes.update({
+        INDEX_PATH: document({
+            'offers': {'AmazonEC2': {'currentRegionIndexUrl': REGION_INDEX_PATH}}
+        }),
+        REGION_INDEX_PATH: document({
+            'regions': {x: {'currentVersionUrl': PRICEFILE_PATH.format(x)} for x in PRICEFILES}
+        })
+    })
+    http_server.routes.update({
+        PRICEFILE_PATH.format(k): document(v) for k, v in PRICEFILES.items()
+    })
+    monkeypatch.setattr(ec2sizes, 'tmpdir', str(tmp_path))
+    monkeypatch.setattr(ec2sizes, 'fetcher', Fetcher(str(tmp_path)))
+    return ec2sizes
+
+
+def test_service_urls(ec2sizes, http_server):
+    urls = ec2sizes.get_service_urls('ec2', http_server.url + INDEX_PATH)
+    assert urls == {
+        x: http_server.url + PRICEFILE_PATH.format(x) for x in ('eu-west-1', 'us-east-1')
+    }
+    url = ec2sizes.get_service_url('ec2', http_server.url + INDEX_PATH, 'eu-west-1')
+    assert url == http_server.url + PRICEFILE_PATH.format('eu-west-1')
+
+
+def test_catalog_and_prices(ec2sizes, http_server, tmp_path):
+    urls = ec2sizes.get_service_urls('ec2', http_server.url + INDEX_PATH)
+    price_files = [ec2sizes.download_fileobject(x, overwrite=True) for x in urls.values()]
+
+    types, regions, prices = ec2sizes.scan_pricefiles(price_files)
+    names = ec2sizes.write_catalog(str(tmp_path / 'catalog.db'), types, regions)
+    assert names == ['c6g.xlarge', 'm6i.large', 'r6i.large', 't4g.micro']
+    assert write_index(str(tmp_path / 'prices.idx'), prices) == 4
+
+    catalog = Catalog(str(tmp_path / 'catalog.db'))
+    try:
+        assert catalog.get('t4g.micro').architecture == 'arm64'
+        assert catalog.get('m6i.large').memory == 8.0
+        assert catalog.regions('m6i.large') == ['eu-west-1', 'us-east-1']
+        assert catalog.regions('r6i.large') == []
+        assert catalog.offered('eu-west-1') == {'c6g.xlarge', 'm6i.large'}
+        assert catalog.offered('ap-south-1') is None
+        assert catalog.available('c6g.xlarge', 'eu-west-1')
+        assert not catalog.available('c6g.xlarge', 'us-east-1')
+        assert not catalog.available('t4g.micro', 'eu-west-1')
+    finally:
+        catalog.close()
+
+    with PriceIndex(str(tmp_path / 'prices.idx')) as index:
+        assert index.hourly('us-east-1', 'm6i.large') == pytest.approx(0.096)
+        assert index.hourly('eu-west-1', 'm6i.large') == pytest.approx(0.107)
+        assert index.hourly('eu-west-1', 'c6g.xlarge') == pytest.approx(0.155)
+        assert index.hourly('eu-west-1', 't4g.micro') is None
+
+
+def test_index_fetched_once(ec2sizes, http_server):
+    """ json documents are cached per run; the offer index is requested once """
+    ec2sizes.get_service_urls('ec2', http_server.url + INDEX_PATH)
+    assert http_server.requests.count(INDEX_PATH) == 1
@@ -0,0 +1,127 @@
+"""
+Summary.
+
+    scripts/httpfetch.py downloads from a local http server: conditional
+    revalidation, resumed partial transfers, and integrity checks
+
+"""
+
+import os
+import json
+import hashlib
+import pytest
+from httpfetch import Fetcher, IntegrityError
+
+
+BODY = b''.join(b'%08d\n' % i for i in range(4000))
+MD5_ETAG = '"{}"'.format(hashlib.md5(BODY).hexdigest())
+LAST_MODIFIED = 'Fri, 01 Mar 2019 12:00:00 GMT'
+PATH = '/offers/v1.0/aws/AmazonEC2/current/us-east-1/index.json'
+
+
+@pytest.fixture
+def fetcher(tmp_path):
+    return Fetcher(str(tmp_path), chunk_size=4096)
+
+
+def interrupted(fetcher, url, received, etag=MD5_ETAG):
+    """ Leaves the .part and .meta files of a transfer interrupted after received bytes """
+    path = fetcher.path(url)
+    with open(path + '.part', 'wb') as f1:
+        f1.write(BODY[:received])
+    with open(path + '.meta', 'w') as f1:
+        f1.write(json.dumps({'url': url, 'etag': etag, 'last_modified': LAST_MODIFIED}))
+    return path
+
+
+def test_etag_revalidation(fetcher, http_server):
+    http_server.routes[PATH] = (200, {'ETag': MD5_ETAG}, BODY)
+    url = http_server.url + PATH
+
+    path = fetcher.fetch(url)
+    assert fetcher.fetch(url) == path
+    assert fetcher.fetch(url, revalidate=False) == path
+
+    assert http_server.headers[1]['If-None-Match'] == MD5_ETAG
+    assert len(http_server.requests) == 2          # the local copy is used without revalidation
+    assert fetcher.transferred == len(BODY)
+    with open(path, 'rb') as f1:
+        assert f1.read() == BODY
+
+
+def test_last_modified_revalidation(fetcher, http_server):
+    http_server.routes[PATH] = (200, {'Last-Modified': LAST_MODIFIED}, BODY)
+    url = http_server.url + PATH
+
+    fetcher.fetch(url)
+    fetcher.fetch(url)
+    assert http_server.headers[1]['If-Modified-Since'] == LAST_MODIFIED
+    assert fetcher.transferred == len(BODY)
+
+
+def test_changed_object_transferred(fetcher, http_server):
+    url = http_server.url + PATH
+    http_server.routes[PATH] = (200, {'ETag': '"v1"'}, b'first')
+    fetcher.fetch(url)
+    http_server.routes[PATH] = (200, {'ETag': '"v2"'}, b'second')
+
+    with open(fetcher.fetch(url), 'rb') as f1:
+        assert f1.read() == b'second'
+
+
+def test_partial_download_resumed(fetcher, http_server):
+    http_server.routes[PATH] = (200, {'ETag': MD5_ETAG}, BODY)
+    url = http_server.url + PATH
+    path = interrupted(fetcher, url, 10000)
+
+    assert fetcher.fetch(url) == path
+    assert http_server.headers[0]['Range'] == 'bytes=10000-'
+    assert http_server.headers[0]['If-Range'] == MD5_ETAG
+    assert fetcher.transferred == len(BODY) - 10000
+    with open(path, 'rb') as f1:
+        assert f1.read() == BODY
+
+
+def test_changed_object_not_resumed(fetcher, http_server):
+    """ If-Range of a changed object is answered with the whole new object """
+    http_server.routes[PATH] = (200, {'ETag': MD5_ETAG}, BODY)
+    url = http_server.url + PATH
+    path = interrupted(fetcher, url, 10000, etag='"previous"')
+
+    fetcher.fetch(url)
+    assert fetcher.transferred == len(BODY)
+    with open(path, 'rb') as f1:
+        assert f1.read() == BODY
+
+
+def test_unsatisfiable_range_restarts(fetcher, http_server):
+    """ a partial file as long as the object gets 416; the transfer starts over """
+    http_server.routes[PATH] = (200, {'ETag': MD5_ETAG}, BODY)
+    url = http_server.url + PATH
+    path = interrupted(fetcher, url, len(BODY))
+
+    fetcher.fetch(url)
+    assert [x.get('Range') for x in http_server.headers] == ['bytes={}-'.format(len(BODY)), None]
+    with open(path, 'rb') as f1:
+        assert f1.read() == BODY
+
+
+def test_length_mismatch(fetcher, http_server):
+    """ a resumed transfer ending short of the advertised total length """
+    headers = {'ETag': MD5_ETAG, 'Content-Range': 'bytes 100-199/50000'}
+    http_server.routes[PATH] = (206, headers, BODY[100:200])
+    url = http_server.url + PATH
+    interrupted(fetcher, url, 100)
+
+    with pytest.raises(IntegrityError, match='received 200 of 50000 bytes'):
+        fetcher.fetch(url)
+
+
+def test_md5_mismatch(fetcher, http_server):
+    http_server.routes[PATH] = (200, {'ETag': MD5_ETAG}, BODY[:-1] + b'x')
+    url = http_server.url + PATH
+
+    with pytest.raises(IntegrityError, match='md5 digest'):
+        fetcher.fetch(url)
+    assert not os.path.exists(fetcher.path(url))
+    assert not os.path.exists(fetcher.path(url) + '.part')
@@ -0,0 +1,114 @@
+"""
+Summary.
+
+    ec2tools.ratelimit attached to a botocore client whose http attempts
+    are answered by a fake endpoint: throttling, success, and failures
+    raised by other event handlers
+
+"""
+
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import boto3
+import pytest
+from botocore.awsrequest import AWSResponse
+from botocore.config import Config
+from botocore.exceptions import ClientError
+from ec2tools import ratelimit
+
+
+THROTTLED = b"""<?xml version="1.0" encoding="UTF-8"?>
+<Response><Errors><Error><Code>Throttling</Code><Message>Rate exceeded</Message></Error></Errors>
+<RequestID>throttled</RequestID></Response>"""
+
+OK = b"""<?xml version="1.0" encoding="UTF-8"?>
+<DescribeRegionsResponse xmlns="http://ec2.amazonaws.com/doc/2016-11-15/">
+<requestId>ok</requestId><regionInfo/></DescribeRegionsResponse>"""
+
+
+class RawBody():
+    def __init__(self, body):
+        self.body = body
+
+    def stream(self, **kwargs):
+        yield self.body
+
+
+class FakeEndpoint():
+    """
+    before-send handler answering each attempt with the next canned
+    (status, body), then with success; each answer takes latency seconds
+    """
+    def __init__(self, latency=0.0):
+        self.responses = []
+        self.error = None
+        self.latency = latency
+        self.lock = threading.Lock()
+
+    def __call__(self, request, **kwargs):
+        if self.error:
+            raise self.error
+        with self.lock:
+            status, body = self.responses.pop(0) if self.responses else (200, OK)
+        time.sleep(self.latency)
+        return AWSResponse(request.url, status, {}, RawBody(body))
+
+
+@pytest.fixture
+def client(monkeypatch):
+    shared = ratelimit.AdaptiveLimiter(rate=1000, capacity=1000, limit=8)
+    monkeypatch.setitem(ratelimit._limiters, ('fake', 'us-east-1', 'ec2'), shared)
+
+    client = boto3.client(
+        'ec2', region_name='us-east-1', aws_access_key_id='fake', aws_secret_access_key='fake',
+        config=Config(retries={'mode': 'standard', 'total_max_attempts': 1})
+    )
+    ratelimit.register(client, 'fake')
+    endpoint = FakeEndpoint()
+    client.meta.events.register('before-send.*.*', endpoint)
+    return client, endpoint, shared
+
+
+def test_throttles_decrease_and_successes_recover(client):
+    client, endpoint, shared = client
+    endpoint.responses = [(400, THROTTLED)] * 3
+
+    for _ in range(3):
+        with pytest.raises(ClientError):
+            client.describe_regions()
+    assert shared.limit == 1.0
+    assert shared.throttles == 3
+    assert shared.inflight == 0
+
+    # the limit grows only while callers fill it
+    endpoint.latency = 0.002
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        list(pool.map(lambda _: client.describe_regions(), range(200)))
+    assert shared.limit >= 6.0
+    assert shared.inflight == 0
+
+
+def test_slot_released_when_handler_raises(client):
+    client, endpoint, shared = client
+    endpoint.error = RuntimeError('no recorded response')
+
+    for _ in range(10):
+        with pytest.raises(RuntimeError):
+            client.describe_regions()
+    assert shared.inflight == 0
+    assert shared.limit == 8.0
+
+
+def test_slot_released_when_needs_retry_handler_raises(client):
+    """ a failing needs-retry handler ahead of the limiter's skips its release """
+    client, endpoint, shared = client
+    endpoint.responses = [(200, OK)]
+
+    def fail(**kwargs):
+        raise RuntimeError('handler failed')
+
+    client.meta.events.register_first('needs-retry.*.*', fail)
+    with pytest.raises(RuntimeError):
+        client.describe_regions()
+    assert shared.inflight == 0
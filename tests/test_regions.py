@@ -0,0 +1,94 @@
+"""
+Summary.
+
+    ec2tools.regions circuit breaker and the command entry point handling
+    of credential errors: AuthFailure of a region not enabled for the
+    account against AuthFailure of rejected credentials
+
+"""
+
+import pytest
+from botocore.exceptions import ClientError, NoCredentialsError
+from ec2tools import regions, session
+
+
+def error(code):
+    return ClientError({'Error': {'Code': code, 'Message': code}}, 'DescribeSubnets')
+
+
+class FakeClient():
+    """ ec2 client of the default region whose describe_regions raises error, if any """
+    def __init__(self, error=None):
+        self.error = error
+        self.calls = 0
+
+    def describe_regions(self, **kwargs):
+        self.calls += 1
+        if self.error:
+            raise self.error
+        return {'Regions': [{'RegionName': 'us-east-1', 'OptInStatus': 'opt-in-not-required'}]}
+
+
+@pytest.fixture
+def health(monkeypatch):
+    client = FakeClient()
+    monkeypatch.setattr(regions, 'boto3_session', lambda *args, **kwargs: client)
+    return regions.RegionHealth(path=None, clock=lambda: 1000), client
+
+
+def test_authfailure_of_disabled_region(health):
+    health, client = health
+    assert health.failure('default', 'ap-east-1', error('AuthFailure')) == 'AuthFailure'
+    assert not health.available('default', 'ap-east-1')
+    assert client.calls == 1
+
+    # credentials already accepted; not checked again
+    assert health.failure('default', 'me-south-1', error('AuthFailure')) == 'AuthFailure'
+    assert client.calls == 1
+
+
+def test_authfailure_after_success_not_checked(health):
+    health, client = health
+    health.success('default', 'us-east-1')
+    assert health.failure('default', 'ap-east-1', error('AuthFailure')) == 'AuthFailure'
+    assert client.calls == 0
+
+
+def test_authfailure_of_rejected_credentials(health):
+    health, client = health
+    client.error = error('AuthFailure')
+    with pytest.raises(ClientError):
+        health.failure('default', 'us-west-2', error('AuthFailure'))
+    assert health.available('default', 'us-west-2')
+
+
+def test_credential_errors_raised(health):
+    health, client = health
+    for exception in (error('ExpiredToken'), NoCredentialsError()):
+        with pytest.raises(type(exception)):
+            health.failure('default', 'us-west-2', exception)
+    assert health.failure('default', 'us-west-2', error('UnauthorizedOperation')) is None
+    assert client.calls == 0
+
+
+@pytest.mark.parametrize(
+    'exception', [error('AuthFailure'), error('ExpiredToken'), NoCredentialsError()]
+)
+def test_entry_point_authentication_failure(exception, capsys):
+    @session.authentication_failures
+    def command():
+        raise exception
+
+    with pytest.raises(SystemExit) as e:
+        command()
+    assert e.value.code == session.exit_codes['E_AUTHFAIL']['Code']
+    assert 'Authentication failed' in capsys.readouterr().out
+
+
+def test_entry_point_other_errors_raised():
+    @session.authentication_failures
+    def command():
+        raise error('UnauthorizedOperation')
+
+    with pytest.raises(ClientError):
+        command()
@@ -0,0 +1,87 @@
+"""
+Summary.
+
+    Artifact downloads of userdata/python3_generic.py against a local
+    http.server: keep-alive reuse, redirects, retries, and destinations
+    which cannot be written
+
+"""
+
+import pytest
+
+
+@pytest.fixture
+def generic():
+    import python3_generic
+    return python3_generic
+
+
+def artifact(body):
+    return (200, {'Content-Type': 'application/octet-stream'}, body)
+
+
+def test_keepalive_reuse(generic, http_server, tmp_path):
+    bodies = {
+        '/config/file{}'.format(i): 'content {}\n'.format(i).encode() * 1000 for i in range(12)
+    }
+    http_server.routes.update({k: artifact(v) for k, v in bodies.items()})
+    artifacts = [(http_server.url + k, str(tmp_path / k.split('/')[-1])) for k in bodies]
+
+    results = generic.fetch_all(artifacts, workers=3)
+
+    assert all(results.values())
+    for k, v in bodies.items():
+        assert (tmp_path / k.split('/')[-1]).read_bytes() == v
+    assert len(http_server.requests) == 12
+    assert len(http_server.connections) <= 3
+
+
+def test_redirect_followed(generic, http_server, tmp_path):
+    http_server.routes.update({
+        '/ec2tools/bashrc': (301, {'Location': '/moved/bashrc'}, b''),
+        '/moved/bashrc': (302, {'Location': http_server.url + '/final/bashrc'}, b''),
+        '/final/bashrc': artifact(b'export PATH\n')
+    })
+    pool = generic.ConnectionPool()
+    try:
+        assert generic.fetch(pool, http_server.url + '/ec2tools/bashrc', str(tmp_path / 'bashrc'))
+    finally:
+        pool.close()
+
+    assert (tmp_path / 'bashrc').read_bytes() == b'export PATH\n'
+    assert http_server.requests == ['/ec2tools/bashrc', '/moved/bashrc', '/final/bashrc']
+    assert len(http_server.connections) == 1
+
+
+def test_redirect_loop(generic, http_server, tmp_path):
+    http_server.routes['/loop'] = (302, {'Location': '/loop'}, b'')
+    pool = generic.ConnectionPool()
+    try:
+        assert not generic.fetch(pool, http_server.url + '/loop', str(tmp_path / 'loop'), backoff=0)
+    finally:
+        pool.close()
+    assert len(http_server.requests) == generic.MAX_REDIRECTS + 1
+    assert not list(tmp_path.iterdir())
+
+
+def test_server_error_retried(generic, http_server, tmp_path):
+    http_server.routes['/colors.sh'] = [(503, {}, b'busy'), artifact(b'RED=1\n')]
+    pool = generic.ConnectionPool()
+    try:
+        dst = str(tmp_path / 'colors.sh')
+        assert generic.fetch(pool, http_server.url + '/colors.sh', dst, backoff=0)
+    finally:
+        pool.close()
+    assert (tmp_path / 'colors.sh').read_bytes() == b'RED=1\n'
+    assert http_server.requests == ['/colors.sh', '/colors.sh']
+
+
+def test_missing_directory_not_retried(generic, http_server, tmp_path):
+    http_server.routes['/colors.sh'] = artifact(b'RED=1\n')
+    pool = generic.ConnectionPool()
+    try:
+        dst = str(tmp_path / 'missing' / 'colors.sh')
+        assert not generic.fetch(pool, http_server.url + '/colors.sh', dst, backoff=10)
+    finally:
+        pool.close()
+    assert http_server.requests == []
@@ -15,17 +15,22 @@
 import os
 import sys
 import json
-import inspect
+import time
 import platform
-import subprocess
-import urllib
+import threading
+import http.client
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
 from pwd import getpwnam as userinfo
-from shutil import which
 import logging
 import logging.handlers
 import distro
 
 
+# replaced by the syslog logger when run as a script
+logger = logging.getLogger('1.0')
+
+
 map_url = 'https://s3.us-east-2.amazonaws.com/http-imagestore/ec2tools/config/s3map.json'
 url_bashrc = 'https://s3.us-east-2.amazonaws.com/http-imagestore/ec2tools/config/bash/bashrc'
 url_aliases = 'https://s3.us-east-2.amazonaws.com/http-imagestore/ec2tools/config/bash/bash_aliases'
@@ -40,6 +45,15 @@
     'os_distro.sh'
 ]
 
+# artifact downloads
+WORKERS = 8                 # concurrent downloads, each on its own keep-alive connection
+RETRIES = 3                 # further attempts after a failed download
+BACKOFF = 0.5               # seconds before the first retry, doubling each retry
+TIMEOUT = 30                # connect and read timeout (seconds)
+CHUNK_SIZE = 64 * 1024
+REDIRECTS = (301, 302, 303, 307, 308)
+MAX_REDIRECTS = 5           # redirects followed per download
+
 
 def directory_operations(path, groupid, userid, permissions):
     """
@@ -64,9 +78,8 @@ def directory_operations(path, groupid, userid, permissions):
                 os.chown(os.path.join(root, d), groupid, userid)
                 logger.info('Changed owner on fs object {} to {}'.format(d, userid))
             except OSError as e:
-                fx = inspect.stack()[0][3]
                 logger.exception(
-                    '{}: Error during owner or perms reset on fs object {}:\n{}'.format(fx, d, e))
+                    'Error during owner or perms reset on fs object {}:\n{}'.format(d, e))
                 continue
 
         for f in files:
@@ -76,46 +89,203 @@ def directory_operations(path, groupid, userid, permissions):
                 os.chown(os.path.join(root, f), groupid, userid)
                 logger.info('Changed owner on fs object {} to {}'.format(f, userid))
             except OSError as e:
-                fx = inspect.stack()[0][3]
                 logger.exception(
-                    '{}: Error during owner or perms reset on fs object {}:\n{}'.format(fx, f, e))
+                    'Error during owner or perms reset on fs object {}:\n{}'.format(f, e))
                 continue
     return True
 
 
-def download(url_list):
-    """
-    Retrieve remote file object
+class ConnectionPool():
     """
-    def exists(fname):
-        if os.path.exists(os.getcwd() + '/' + fname):
-            return True
-        else:
-            msg = 'File object %s failed to download to %s. Exit' % (fname, os.getcwd())
-            logger.warning(msg)
-            return False
-    try:
-        for url in url_list:
+    Summary.
 
-            if which('wget'):
-                cmd = 'wget ' + url
-                subprocess.getoutput(cmd)
-                logger.info("downloading " + url)
+        Keep-alive http(s) connections, one per thread and host, reused
+        by every download of the thread
 
-            elif which('curl'):
-                cmd = 'curl -o ' + os.path.basename(url) + ' ' + url
-                subprocess.getoutput(cmd)
-                logger.info("downloading " + url)
+    Args:
+        timeout (int):  connect and read timeout (seconds)
 
+    """
+    def __init__(self, timeout=TIMEOUT):
+        self.timeout = timeout
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.opened = []
+
+    def _connections(self):
+        if not hasattr(self.local, 'connections'):
+            self.local.connections = {}
+        return self.local.connections
+
+    def connection(self, scheme, netloc):
+        connections = self._connections()
+        if (scheme, netloc) not in connections:
+            if scheme == 'https':
+                conn = http.client.HTTPSConnection(netloc, timeout=self.timeout)
             else:
-                logger.info('Failed to download {} no url binary found'.format(os.path.basename(url)))
-                return False
-    except Exception as e:
-        logger.info(
-            'Error downloading file: {}, URL: {}, Error: {}'.format(os.path.basename(url), url, e)
-        )
+                conn = http.client.HTTPConnection(netloc, timeout=self.timeout)
+            connections[(scheme, netloc)] = conn
+            with self.lock:
+                self.opened.append(conn)
+        return connections[(scheme, netloc)]
+
+    def discard(self, scheme, netloc):
+        """Closes a connection which failed; the next request opens a new one"""
+        conn = self._connections().pop((scheme, netloc), None)
+        if conn is not None:
+            conn.close()
+
+    def close(self):
+        with self.lock:
+            for conn in self.opened:
+                conn.close()
+            self.opened = []
+
+
+def _transfer(pool, url, f1, retries, backoff):
+    """
+    Summary.
+
+        GET url into the open file f1, following redirects.  Connection
+        errors, 5xx and 429 responses are retried; redirects do not count
+        as attempts.
+
+    Returns:
+        (bytes written, or None on failure, last error, attempts), TYPE: tuple
+
+    """
+    attempt, redirects, error = 0, 0, None
+
+    while attempt <= retries:
+        parts = urllib.parse.urlsplit(url)
+        path = (parts.path or '/') + ('?' + parts.query if parts.query else '')
+        try:
+            conn = pool.connection(parts.scheme, parts.netloc)
+            conn.request('GET', path, headers={'Connection': 'keep-alive'})
+            response = conn.getresponse()
+
+            if response.status in REDIRECTS and response.getheader('Location'):
+                response.read()
+                redirects += 1
+                if redirects > MAX_REDIRECTS:
+                    return None, 'more than {} redirects'.format(MAX_REDIRECTS), attempt + 1
+                url = urllib.parse.urljoin(url, response.getheader('Location'))
+                continue
+
+            if response.status == 200:
+                f1.seek(0)
+                f1.truncate()
+                size = 0
+                for chunk in iter(lambda: response.read(CHUNK_SIZE), b''):
+                    try:
+                        size += f1.write(chunk)
+                    except OSError as e:
+                        # local write failure (disk full); not retried
+                        pool.discard(parts.scheme, parts.netloc)
+                        return None, repr(e), attempt + 1
+                return size, None, attempt + 1
+
+            response.read()         # drain, keeping the connection usable
+            error = 'HTTP {} {}'.format(response.status, response.reason)
+            if response.status < 500 and response.status != 429:
+                return None, error, attempt + 1
+
+        except (OSError, http.client.HTTPException) as e:
+            pool.discard(parts.scheme, parts.netloc)
+            error = repr(e)
+
+        attempt += 1
+        if attempt <= retries:
+            logger.info(
+                'Download of {} failed ({}); retry {} of {}'.format(url, error, attempt, retries)
+            )
+            time.sleep(backoff * 2 ** (attempt - 1))
+
+    return None, error, attempt
+
+
+def fetch(pool, url, dst, retries=RETRIES, backoff=BACKOFF):
+    """
+    Summary.
+
+        Downloads url to dst over a pooled keep-alive connection,
+        following redirects.  Connection errors, 5xx and 429 responses
+        are retried with exponential backoff; the file is written to
+        dst.part and moved into place once complete.  A dst.part which
+        cannot be created or written fails the download without retries.
+
+    Args:
+        pool (ConnectionPool):  connections of the download threads
+        url (str):  http or https url
+        dst (str):  local file path
+        retries (int):  further attempts after a failure
+
+    Returns:
+        Success | Failure, TYPE: bool
+
+    """
+    start = time.perf_counter()
+    try:
+        f1 = open(dst + '.part', 'wb')
+    except OSError as e:
+        logger.warning('Failed to download {}: {}'.format(url, e))
         return False
-    return True
+
+    with f1:
+        size, error, attempts = _transfer(pool, url, f1, retries, backoff)
+
+    if size is not None:
+        os.replace(dst + '.part', dst)
+        logger.info('Downloaded {} to {}: {} bytes in {:.3f}s ({} attempts)'.format(
+            url, dst, size, time.perf_counter() - start, attempts))
+        return True
+
+    os.remove(dst + '.part')
+    logger.warning('Failed to download {} after {} attempts ({}) in {:.3f}s'.format(
+        url, attempts, error, time.perf_counter() - start))
+    return False
+
+
+def fetch_all(artifacts, workers=WORKERS, pool=None):
+    """
+    Summary.
+
+        Downloads artifacts concurrently over keep-alive connections
+
+    Args:
+        artifacts (list):  (url, destination path) tuples
+        workers (int):  concurrent downloads
+        pool (ConnectionPool):  connections to reuse; closed at the end if created here
+
+    Returns:
+        {destination path: success}, TYPE: dict
+
+    """
+    owned = pool is None
+    pool = pool or ConnectionPool()
+    start = time.perf_counter()
+
+    try:
+        with ThreadPoolExecutor(max_workers=max(min(workers, len(artifacts)), 1)) as executor:
+            futures = {dst: executor.submit(fetch, pool, url, dst) for url, dst in artifacts}
+        results = {dst: future.result() for dst, future in futures.items()}
+    finally:
+        if owned:
+            pool.close()
+
+    logger.info('Downloaded {} of {} artifacts in {:.3f}s'.format(
+        sum(results.values()), len(results), time.perf_counter() - start))
+    return results
+
+
+def download(url_list):
+    """
+    Retrieve remote file objects into the current directory
+    """
+    results = fetch_all(
+        [(url, os.path.join(os.getcwd(), os.path.basename(url))) for url in url_list]
+    )
+    return all(results.values())
 
 
 def getLogger(*args, **kwargs):
@@ -131,7 +301,7 @@ def getLogger(*args, **kwargs):
         logger object | TYPE: logging
     """
     syslog_facility = 'local7'
-    syslog_format = '[INFO] - %(pathname)s - %(name)s - [%(levelname)s]: %(message)s'
+    syslog_format = '[INFO] - %(pathname)s - %(name)s - [%(levelname)s]: %(funcName)s: %(message)s'
 
     # all formats
     asctime_format = "%Y-%m-%d %H:%M:%S"
@@ -155,30 +325,29 @@ def getLogger(*args, **kwargs):
 
 class S3Map():
     """Dict mapping download artifacts to localhost destinations"""
-    def __init__(self, s3_urlpath):
+    def __init__(self, s3_urlpath, pool=None):
+        self.pool = pool or ConnectionPool()
         self.map = self._construct_map(s3_urlpath)
 
     def _construct_map(self, path):
+        s3map = {}
         try:
-            urllib.request.urlretrieve(path, 's3map.json')
-            with open('s3map.json') as f1:
-                s3map = json.loads(f1.read())
-        except OSError:
+            if fetch(self.pool, path, 's3map.json'):
+                with open('s3map.json') as f1:
+                    s3map = json.loads(f1.read())
+        except (OSError, ValueError):
             logger.exception('Failed to parse {}'.format(path))
         return s3map
 
     def download_artifacts(self):
-        for k, v in self.map.items():
-            fname = k
-            src = v['source']
-            dst = v['destination'] + '/' + fname
-            try:
-                urllib.request.urlretrieve(src, dst)
-                if os.path.exists(dst):
-                    logger.info('Successful download and placement of {}'.format(dst))
-            except OSError as e:
-                fx = inspect.stack()[0][3]
-                logger.exception('Problem paring s3 map file: {}'.format(e))
+        """
+        Downloads all mapped artifacts concurrently; returns
+        {destination path: success}
+        """
+        artifacts = [
+            (v['source'], v['destination'] + '/' + k) for k, v in self.map.items()
+        ]
+        return fetch_all(artifacts, pool=self.pool)
 
 
 def os_dependent():
@@ -240,23 +409,14 @@ def local_profile_setup(distro):
 
         m = S3Map(map_url)
 
-        for k, v in m.map.items():
-            fname = k
-            src = v['source']
-            dst = v['destination'] + '/' + fname
-
-            try:
-                urllib.request.urlretrieve(src, dst)
+        for dst, success in m.download_artifacts().items():
+            if success and os.path.exists(dst):
                 os.chown(dst, groupid, userid)
                 os.chmod(dst, 0o644)
-
-                if os.path.exists(dst):
-                    logger.info('Successful download and placement of {}'.format(dst))
-                else:
-                    logger.warning('Failed to download and place {}'.format(dst))
-            except OSError as e:
-                logger.exception('Problem paring s3 map file: {}'.format(e))
-                continue
+                logger.info('Successful download and placement of {}'.format(dst))
+            else:
+                logger.warning('Failed to download and place {}'.format(dst))
+        m.pool.close()
 
         # reset owner to normal user for .config/bash (desination):
         directory_operations(home_dir, groupid, userid, 0o644)